@@ -216,12 +216,19 @@ export class GitHubAnalyzer {
 
                     if (brainType === 'remote' && remoteUrl && repo.description) {
                         try {
-                            const prompt = `Project: ${repo.name}\nDescription: ${repo.description}\nLanguages: ${Object.keys(languages).join(', ')}\nFiles: ${coreFiles.map(f => f.path).join(', ')}`;
+                            // The brain ranks the core files with embeddings and only sends the best excerpts to the LLM
                             const cloudRes = await axios.post(`${remoteUrl}/analyze-project`, {
-                                prompt: prompt,
-                                system_prompt: "Analyze complexity, architecture, and SKILLS. Return JSON: { complexity, architecture, learnedSkills: [], projectType, realWorldUtility }",
+                                name: repo.name,
+                                description: repo.description,
+                                readme: readme.substring(0, 4000),
+                                languages,
+                                file_tree: fileStructure.filter((f: any) => f.type === 'blob').map((f: any) => f.path).slice(0, 200),
+                                core_files: coreFiles,
                                 max_tokens: 1024
-                            }, { timeout: 60000 });
+                            }, {
+                                timeout: 60000,
+                                headers: { 'ngrok-skip-browser-warning': 'true', 'X-Brain-Deadline-Ms': '60000' }
+                            });
 
                             const cloudAnalysis = (cloudRes.data as any).analysis;
                             if (cloudAnalysis) {
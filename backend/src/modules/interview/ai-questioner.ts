@@ -1,4 +1,5 @@
 import { LLMFactory } from '../llm/factory';
+import { RemoteProvider } from '../llm/remote';
 import { Question, InterviewContext } from './types';
 
 export class AIQuestioner {
@@ -22,6 +23,14 @@ export class AIQuestioner {
         const projects = this.context.projects || [];
         const experience = this.context.experience || [];
 
+        // Opening questions come from the cloud brain's index when it is warm: nothing has been
+        // answered yet for the persona to adapt to. Follow-ups and deep dives read the history,
+        // weaknesses and shadow notes, so they always get the full persona prompt below.
+        if (history.length === 0 && options?.mode !== 'DEEP_DIVE') {
+            const served = await this.fromQuestionIndex(history, count);
+            if (served.length > 0) return served;
+        }
+
         const deepProjects = projects.filter((p: any) => p.coreFiles && p.coreFiles.length > 0);
         const lightProjects = projects.filter((p: any) => !p.coreFiles || p.coreFiles.length === 0);
 
@@ -183,6 +192,48 @@ export class AIQuestioner {
         }
     }
 
+    /**
+     * Questions from the brain's retrieval index, or [] unless it can fill the whole request.
+     * A cold index (bank not synced yet) returns [] straight away so the caller generates.
+     */
+    private async fromQuestionIndex(history: any[], count: number): Promise<Question[]> {
+        if (this.brainType !== 'remote') return [];
+        try {
+            const provider = await LLMFactory.getProviderWithFallback(this.brainType);
+            if (!(provider instanceof RemoteProvider)) return [];
+            if (!provider.questionIndexReady()) {
+                provider.syncQuestionBank();
+                return [];
+            }
+
+            const projects = (this.context.projects || []).map((p: any) => ({ name: p.name, description: p.description }));
+            const exclude = [...history.map(h => h.question), ...Array.from(this.askedQuestions)];
+            const questions = await provider.generateQuestions(this.context.skills || [], projects, count, exclude);
+
+            const normalize = (t: string) => t.toLowerCase().trim().replace(/[?.!,]$/, '');
+            const types = ['TECHNICAL', 'PROJECT', 'BEHAVIORAL', 'SYSTEM_DESIGN', 'CODE_CHALLENGE'];
+            const fresh: Question[] = [];
+            for (const q of questions) {
+                if (!q || !q.text || this.askedQuestions.has(normalize(q.text))) continue;
+                if (fresh.some(f => normalize(f.text) === normalize(q.text))) continue;
+                fresh.push({
+                    text: q.text,
+                    type: types.includes(q.type) ? q.type : 'TECHNICAL',
+                    difficulty: ['EASY', 'MEDIUM', 'HARD'].includes(q.difficulty) ? q.difficulty : 'MEDIUM',
+                    context: q.context || 'Question bank',
+                    expectedPoints: Array.isArray(q.expectedPoints) ? q.expectedPoints : [],
+                    source: q.source
+                });
+            }
+            if (fresh.length < count) return [];
+            fresh.slice(0, count).forEach(q => this.askedQuestions.add(normalize(q.text)));
+            return fresh.slice(0, count);
+        } catch (error: any) {
+            console.warn(`⚠️ Question index unavailable, generating with the persona prompt: ${error.message}`);
+            return [];
+        }
+    }
+
     async evaluateAnswer(answer: string, question: Question): Promise<any> {
         // [NEW] Persona Injection for Evaluation
         const evaluationPrompt = `
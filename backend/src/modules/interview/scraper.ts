@@ -50,6 +50,13 @@ export class QuestionScraper {
         }
     }
 
+    /**
+     * Every question collected so far, across all topics (no network).
+     */
+    getCachedQuestions(): ScrapedQuestion[] {
+        return Array.from(this.cache.values()).reduce((all, questions) => all.concat(questions), [] as ScrapedQuestion[]);
+    }
+
     async scrapeQuestions(topic: string): Promise<ScrapedQuestion[]> {
         const normalizedTopic = topic.toLowerCase();
 
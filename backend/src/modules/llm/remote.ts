@@ -1,10 +1,15 @@
 import { LLMProvider } from './types';
 import { OllamaProvider } from './ollama';
 import axios from 'axios';
+import * as crypto from 'crypto';
 import { Logger } from '../logger';
+import { BEHAVIORAL_QUESTIONS, GENERAL_CS_QUESTIONS, TECHNICAL_FRAMEWORK_QUESTIONS } from '../interview/questions-db';
+import { QuestionScraper } from '../interview/scraper';
 
 export class RemoteProvider implements LLMProvider {
     public name = 'Remote (Colab GPU)';
+    // Brain URL -> hash of the bank last indexed there, and the upload in flight (if any)
+    private static questionBankSync: Map<string, { version?: string, pending?: Promise<void> }> = new Map();
     private baseUrl: string;
     private localProvider: OllamaProvider;
 
@@ -34,7 +39,8 @@ export class RemoteProvider implements LLMProvider {
                     timeout: 180000,  // 3 minute timeout for slow GPU
                     headers: {
                         'Content-Type': 'application/json',
-                        'ngrok-skip-browser-warning': 'true'  // Skip ngrok warning page
+                        'ngrok-skip-browser-warning': 'true',  // Skip ngrok warning page
+                        'X-Brain-Deadline-Ms': '180000'  // Brain drops the job once we stop waiting
                     }
                 }
             );
@@ -82,10 +88,35 @@ export class RemoteProvider implements LLMProvider {
     }
 
     /**
-     * Evaluate a candidate's answer using the cloud brain's dedicated endpoint.
-     * Falls back to generate if the endpoint doesn't exist.
+     * Evaluate a candidate's answer using the cloud brain's persona scoring endpoint
+     * (a one-item /batch/evaluate-answers call), which decodes under the JSON grammar and
+     * caches the score. Falls back to generate if the endpoint doesn't exist.
      */
     async evaluateAnswer(question: string, answer: string, expectedPoints: string[] = [], context: string = ''): Promise<any> {
+        // A candidate is waiting on this score: the brain preempts batch analysis for it
+        const headers = { 'ngrok-skip-browser-warning': 'true', 'X-Brain-Deadline-Ms': '60000', 'X-Brain-Priority': 'interactive' };
+
+        try {
+            Logger.info(`🌐 [Cloud Brain] Evaluating answer with Persona...`);
+            const response = await axios.post(
+                `${this.baseUrl}/batch/evaluate-answers`,
+                { items: [{ question, answer, expectedPoints, context }] },
+                { timeout: 60000, headers }
+            );
+
+            const data = response.data as { results?: { ok: boolean, evaluation?: any, error?: string }[] };
+            const result = data.results?.[0];
+            if (!result?.ok) throw new Error(result?.error || 'No evaluation returned');
+            return result.evaluation;
+
+        } catch (error: any) {
+            // Older brains (fab_brain_template.py) have no batch endpoint
+            if (error.response?.status !== 404) {
+                console.warn(`⚠️ Cloud evaluation failed: ${error.message}`);
+                throw error;
+            }
+        }
+
         const systemPrompt = "You are a Senior Engineering Manager (10+ years exp). Be BRUTALLY HONEST. Do not sugarcoat. If the answer is vague, destroy it. If it's wrong, say it's wrong.";
 
         const prompt = `Evaluate this interview answer:
@@ -109,7 +140,6 @@ Return JSON ONLY:
 }`;
 
         try {
-            Logger.info(`🌐 [Cloud Brain] Evaluating answer with Persona...`);
             // Use generic generate to inject system prompt
             const response = await axios.post(
                 `${this.baseUrl}/generate`,
@@ -119,10 +149,7 @@ Return JSON ONLY:
                     max_tokens: 1024,
                     temperature: 0.4
                 },
-                {
-                    timeout: 60000,
-                    headers: { 'ngrok-skip-browser-warning': 'true' }
-                }
+                { timeout: 60000, headers }
             );
 
             const data = response.data as any;
@@ -141,24 +168,84 @@ Return JSON ONLY:
     }
 
     /**
-     * Generate interview questions using the cloud brain's dedicated endpoint.
+     * Uploads the curated bank and every scraped question to the brain's retrieval index in the
+     * background. The bank is hashed, so this is a no-op until it changes (e.g. after a scrape);
+     * a failed upload is retried on the next call. Never blocks the caller.
+     */
+    syncQuestionBank(): void {
+        if (!this.baseUrl) return;
+        const state = RemoteProvider.questionBankSync.get(this.baseUrl) || {};
+        RemoteProvider.questionBankSync.set(this.baseUrl, state);
+        if (state.pending) return;
+
+        const curated = [...BEHAVIORAL_QUESTIONS, ...GENERAL_CS_QUESTIONS, ...TECHNICAL_FRAMEWORK_QUESTIONS].map(q => ({
+            text: q.text,
+            type: q.type,
+            difficulty: q.difficulty,
+            context: q.context,
+            expectedPoints: q.expectedPoints,
+            source: 'bank'
+        }));
+        const scraped = new QuestionScraper().getCachedQuestions().map(q => ({
+            text: q.question,
+            difficulty: q.difficulty ? q.difficulty.toUpperCase() : 'MEDIUM',
+            context: `Technical: ${q.topic}`,
+            skills: q.techStack || [q.topic],
+            source: q.source
+        }));
+
+        const questions = [...curated, ...scraped];
+        const version = crypto.createHash('sha1').update(JSON.stringify(questions)).digest('hex');
+        if (state.version === version) return;
+
+        state.pending = axios.post(
+            `${this.baseUrl}/questions/index`,
+            { questions },
+            { timeout: 120000, headers: { 'Content-Type': 'application/json', 'ngrok-skip-browser-warning': 'true' } }
+        ).then(response => {
+            const data = response.data as { added?: number, bank_size?: number };
+            state.version = version;
+            Logger.info(`🌐 [Cloud Brain] Question bank synced (${data.added} new, ${data.bank_size} indexed)`);
+        }).catch(error => {
+            Logger.warn(`⚠️ Question bank sync failed: ${error.message}`);
+        }).finally(() => {
+            state.pending = undefined;
+        });
+    }
+
+    /**
+     * Whether the brain's question index has received the bank at least once. Until then
+     * retrieval has nothing to serve from and callers should generate instead.
+     */
+    questionIndexReady(): boolean {
+        return !!RemoteProvider.questionBankSync.get(this.baseUrl)?.version;
+    }
+
+    /**
+     * Interview questions from the cloud brain: served from its question index when it has
+     * good matches, generated (and indexed) only for the shortfall.
+     * `exclude` is the session's question history, which is never served again.
      */
-    async generateQuestions(skills: string[], projects: any[], count: number = 3): Promise<any[]> {
+    async generateQuestions(skills: string[], projects: any[], count: number = 3, exclude: string[] = []): Promise<any[]> {
         try {
+            // Picks up questions scraped since the last sync, without holding up this request
+            this.syncQuestionBank();
             Logger.info(`🌐 [Cloud Brain] /generate-questions...`);
             const response = await axios.post(
                 `${this.baseUrl}/generate-questions`,
-                { skills, projects, count },
+                { skills, projects, count, exclude },
                 {
                     timeout: 120000,
                     headers: {
                         'Content-Type': 'application/json',
-                        'ngrok-skip-browser-warning': 'true'
+                        'ngrok-skip-browser-warning': 'true',
+                        'X-Brain-Deadline-Ms': '120000',
+                        'X-Brain-Priority': 'interactive'
                     }
                 }
             );
-            console.log(`🌐 Questions generated by cloud brain`);
-            const data = response.data as { questions?: any[] };
+            const data = response.data as { questions?: any[], retrieved?: number, generated?: number };
+            console.log(`🌐 Questions from cloud brain (${data.retrieved || 0} retrieved, ${data.generated || 0} generated)`);
             return data.questions || [];
         } catch (error: any) {
             console.warn(`⚠️ Cloud question generation failed: ${error.message}`);
@@ -177,7 +264,8 @@ Return JSON ONLY:
                     timeout: 120000,
                     headers: {
                         'Content-Type': 'application/json',
-                        'ngrok-skip-browser-warning': 'true'
+                        'ngrok-skip-browser-warning': 'true',
+                        'X-Brain-Deadline-Ms': '120000'
                     }
                 }
             );
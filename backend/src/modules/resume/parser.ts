@@ -1,6 +1,7 @@
 
 import { LLMFactory, BrainType } from '../llm/factory';
 import { OllamaProvider } from '../llm/ollama';
+import { RemoteProvider } from '../llm/remote';
 
 interface ResumeClaim {
     skill: string;
@@ -48,10 +49,12 @@ const SKILL_PATTERNS = {
 
 export class ResumeParser {
     private resumeText: string;
+    private rawText: string; // line breaks and case kept: the cloud brain reads sections and headings from them
     private claims: ResumeClaim[] = [];
     private enhancedData: EnhancedResumeData | null = null;
 
     constructor(resumeText: string) {
+        this.rawText = resumeText.replace(/\r\n?/g, '\n').trim();
         // Clean the text: remove extra spaces, normalize line breaks
         this.resumeText = resumeText
             .toLowerCase()
@@ -188,7 +191,7 @@ export class ResumeParser {
             const provider = LLMFactory.getProvider();
             console.log(`🧠 [RESUME] Using provider: ${provider.name}`);
 
-            const data = await provider.parseResume(this.resumeText);
+            const data = await provider.parseResume(provider instanceof RemoteProvider ? this.rawText : this.resumeText);
             const skillCount = this.countSkills(data);
 
             console.log(`🧠 [RESUME] Extracted ${skillCount} skills`);
@@ -19,6 +19,7 @@ import { Logger } from './modules/logger';
 import { InterviewSessionManager } from './modules/interview/session';
 import { AIQuestioner } from './modules/interview/ai-questioner';
 import { BrainType, LLMFactory } from './modules/llm/factory';
+import { RemoteProvider } from './modules/llm/remote';
 import { HistoryStorage } from './modules/history/storage';
 import { ProfileRepository } from './modules/profile/repository';
 import { ProjectGenerator } from './modules/coaching/project-generator';
@@ -1104,6 +1105,8 @@ app.post('/config/brain', async (req, res) => {
     process.env.BRAIN_TYPE = brainType;
     if (brainType === 'remote') {
         process.env.REMOTE_BRAIN_URL = remoteUrl;
+        // Warm the new brain's question index before the first interview asks it
+        if (cleanRemoteUrl) new RemoteProvider(cleanRemoteUrl).syncQuestionBank();
     } else {
         delete process.env.REMOTE_BRAIN_URL;
     }
@@ -1172,4 +1175,7 @@ app.use((err: any, req: Request, res: Response, next: NextFunction) => {
 app.listen(PORT, () => {
     Logger.info(`🚀 FAB Backend running on http://localhost:${PORT}`);
     Logger.info(`🧠 Brain Type: ${process.env.BRAIN_TYPE}`);
+    if (process.env.BRAIN_TYPE === 'remote' && process.env.REMOTE_BRAIN_URL) {
+        new RemoteProvider().syncQuestionBank();
+    }
 });
@@ -0,0 +1,371 @@
+# FAB BRAIN BENCHMARK
+# Drives fab_brain.py in-process (no HTTP, no ngrok) across a grid of prompt lengths, max_tokens,
+# scheduler batch sizes and concurrency levels, then times Sentence-BERT per batch size.
+#
+#   python fab_bench.py --profile tiny --out bench.json         # small model on CPU: runs on any Linux box
+#   python fab_bench.py --profile full --out t4.json            # the configured brain (a T4 by default)
+#   python fab_bench.py --profile tiny --baseline bench.json    # exits 1 when a grid point regressed
+#
+# FAB_BRAIN_* variables still apply; a profile only fills in the ones left unset.
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime, timezone
+from typing import List, Optional, Dict, Any
+
+#===============================================
+# STEP 1: Profiles
+#===============================================
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    # ~0.5B params in int8: about 1 GB of RAM and a few minutes on a laptop
+    "tiny": {
+        "env": {
+            "FAB_BRAIN_DEVICE": "cpu",
+            "FAB_BRAIN_CPU_DTYPE": "int8",
+            "FAB_BRAIN_LLM_ID": "Qwen/Qwen2.5-0.5B-Instruct",
+            "FAB_BRAIN_SENTENCE_MODEL_ID": "all-MiniLM-L6-v2",
+            "FAB_BRAIN_MAX_CONTEXT_TOKENS": "2048",
+        },
+        "prompt_tokens": [64, 512],
+        "max_tokens": [16, 64],
+        "batch_sizes": [1, 4],
+        "concurrency": [1, 4],
+        "embed_batches": [1, 16, 64],
+        "repeats": 2,
+    },
+    # Whatever FAB_BRAIN_* selects, with prompts up to the old 8000-character cut (~2k tokens) and past it
+    "full": {
+        "env": {},
+        "prompt_tokens": [256, 1024, 2048, 3500],
+        "max_tokens": [64, 256],
+        "batch_sizes": [1, 4, 8],
+        "concurrency": [1, 4, 8, 16],
+        "embed_batches": [1, 8, 32, 128],
+        "repeats": 3,
+    },
+}
+
+FILLER = ("The service keeps a cache of recent results, validates every request body before it reaches "
+          "the database, and retries failed calls with exponential backoff. ")
+CODE_FILLER = ("def handle(request, cache, db):\n    key = request.path + str(sorted(request.args.items()))\n"
+               "    if key in cache:\n        return cache[key]\n    rows = db.query(request.args)\n"
+               "    cache[key] = [row.to_dict() for row in rows]\n    return cache[key]\n\n")
+
+# Higher is better for throughputs, lower for latencies; used by --baseline
+HIGHER_IS_BETTER = ("prefill_tokens_per_sec", "decode_tokens_per_sec", "output_tokens_per_sec", "texts_per_sec")
+LOWER_IS_BETTER = ("ttft_p50_ms", "ttft_p95_ms", "latency_p95_ms")
+
+brain = None  # fab_brain, imported once the profile's environment is in place
+
+#===============================================
+# STEP 2: Measurement helpers
+#===============================================
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))]
+
+def ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+def reset_peak_memory():
+    if brain.DEVICE == "cuda":
+        brain.torch.cuda.synchronize()
+        brain.torch.cuda.reset_peak_memory_stats()
+
+def peak_memory() -> Dict[str, float]:
+    """Peak accelerator memory since the last reset; on CPU the process RSS high-water mark."""
+    if brain.DEVICE == "cuda":
+        brain.torch.cuda.synchronize()
+        return {"gpu_peak_allocated_mb": round(brain.torch.cuda.max_memory_allocated() / 1024**2, 1),
+                "gpu_peak_reserved_mb": round(brain.torch.cuda.max_memory_reserved() / 1024**2, 1)}
+    return {"process_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+def text_of_tokens(filler: str, tokens: int, encode, decode) -> str:
+    """`filler` repeated and cut to exactly `tokens` tokens of the given tokenizer."""
+    copies = tokens // max(1, len(encode(filler))) + 1
+    ids = encode(filler * copies)
+    while len(ids) < tokens:
+        copies *= 2
+        ids = encode(filler * copies)
+    return decode(ids[:tokens])
+
+def make_prompt(tokens: int) -> str:
+    tok = brain.tokenizer
+    body = text_of_tokens(FILLER, tokens, lambda t: tok(t, add_special_tokens=False).input_ids,
+                          lambda ids: tok.decode(ids, skip_special_tokens=True))
+    return f"Continue this design note without repeating it:\n\n{body}"
+
+#===============================================
+# STEP 3: Generation grid
+#===============================================
+
+def run_generation_point(prompt_tokens: int, max_tokens: int, batch_size: int, concurrency: int, empty_cache: bool,
+                         repeats: int) -> Dict[str, Any]:
+    """
+    Fires `concurrency` greedy requests at once, `repeats` times, through the real scheduler.
+
+    Prefill and decode rates come from the scheduler's own metrics (the same split /metrics
+    reports); TTFT and latency are per request, from the moment it was queued.
+    """
+    brain.scheduler.max_batch_size = batch_size
+    brain.EMPTY_CACHE_EACH_BATCH = empty_cache
+    prompt = make_prompt(prompt_tokens)
+    tokens_before, seconds_before = dict(brain.metrics.tokens), dict(brain.metrics.seconds)
+    batches_before, requests_before = brain.scheduler.stats["batches"], brain.scheduler.stats["requests"]
+    reset_peak_memory()
+
+    ttft, latencies, request_rates, output_tokens, dropped = [], [], [], 0, 0
+    wall_start = time.time()
+    for repeat in range(repeats):
+        # Distinct prompts, so nothing upstream of the scheduler can fold them together
+        jobs = [brain.submit_generation(f"[{repeat}.{i}] {prompt}", "", max_tokens, 0.0) for i in range(concurrency)]
+        finished_at: Dict[int, float] = {}
+        for job in jobs:
+            job.future.add_done_callback(lambda _, key=id(job): finished_at.setdefault(key, time.time()))
+        for job in jobs:
+            job.future.result()
+            done = finished_at.get(id(job), time.time())
+            latencies.append(done - job.enqueued_at)
+            output_tokens += len(job.output_ids)
+            dropped += job.dropped_tokens
+            if job.first_token_at is not None:
+                ttft.append(job.first_token_at - job.enqueued_at)
+                if len(job.output_ids) > 1 and done > job.first_token_at:
+                    request_rates.append((len(job.output_ids) - 1) / (done - job.first_token_at))
+    wall = time.time() - wall_start
+    # Futures resolve inside the batch; its timings land in the metrics just after it returns
+    while brain.scheduler.stats["requests"] - requests_before < concurrency * repeats:
+        time.sleep(0.001)
+
+    prefill_tokens = brain.metrics.tokens["input"] - tokens_before["input"]
+    prefill_s = brain.metrics.seconds["prefill"] - seconds_before["prefill"]
+    decoded = brain.metrics.tokens["output"] - tokens_before["output"]
+    decode_s = brain.metrics.seconds["decode"] - seconds_before["decode"]
+    return {
+        "prompt_tokens": prompt_tokens,
+        "max_tokens": max_tokens,
+        "batch_size": batch_size,
+        "concurrency": concurrency,
+        "empty_cache": empty_cache,
+        "requests": concurrency * repeats,
+        "batches": brain.scheduler.stats["batches"] - batches_before,
+        "output_tokens": output_tokens,
+        "dropped_prompt_tokens": dropped,
+        "ttft_p50_ms": ms(percentile(ttft, 50)),
+        "ttft_p95_ms": ms(percentile(ttft, 95)),
+        "latency_p50_ms": ms(percentile(latencies, 50)),
+        "latency_p95_ms": ms(percentile(latencies, 95)),
+        "prefill_tokens_per_sec": round(prefill_tokens / prefill_s, 1) if prefill_s > 0 else None,
+        "decode_tokens_per_sec": round(decoded / decode_s, 1) if decode_s > 0 else None,
+        "request_decode_tokens_per_sec": round(percentile(request_rates, 50), 1) if request_rates else None,
+        "output_tokens_per_sec": round(output_tokens / wall, 1) if wall > 0 else None,
+        **peak_memory()
+    }
+
+#===============================================
+# STEP 4: Embedding grid
+#===============================================
+
+def run_embedding_point(kind: str, batch_size: int, texts: List[str], repeats: int) -> Dict[str, Any]:
+    """Times `encode_texts` over `texts` at one Sentence-BERT batch size."""
+    reset_peak_memory()
+    tokens = sum(len(ids) for ids in brain.sentence_model.tokenizer(texts, add_special_tokens=True, verbose=False)["input_ids"])
+    brain.encode_texts(texts[:batch_size], batch_size=batch_size)
+    start = time.time()
+    for _ in range(repeats):
+        brain.encode_texts(texts, batch_size=batch_size, normalize=True)
+    elapsed = (time.time() - start) / repeats
+    return {
+        "kind": kind,
+        "batch_size": batch_size,
+        "texts": len(texts),
+        "mean_tokens": round(tokens / len(texts), 1),
+        "texts_per_sec": round(len(texts) / elapsed, 1),
+        "tokens_per_sec": round(tokens / elapsed, 1),
+        "batch_ms": round(elapsed / max(1, -(-len(texts) // batch_size)) * 1000, 2),
+        **peak_memory()
+    }
+
+def embedding_corpus(kind: str, count: int) -> List[str]:
+    """Short prose sentences, or full-width code windows as /embed-code would produce."""
+    tok = brain.sentence_model.tokenizer
+    encode = lambda t: tok(t, add_special_tokens=False, verbose=False)["input_ids"]
+    decode = lambda ids: tok.decode(ids, skip_special_tokens=True)
+    if kind == "text":
+        return [f"{i} {text_of_tokens(FILLER, 48, encode, decode)}" for i in range(count)]
+    return [f"# {i}\n{text_of_tokens(CODE_FILLER, brain.code_chunk_window(), encode, decode)}" for i in range(count)]
+
+#===============================================
+# STEP 5: Report
+#===============================================
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def brain_info() -> Dict[str, Any]:
+    """Identifies the build being measured, so results from different versions line up."""
+    with open(brain.__file__, encoding="utf-8") as f:
+        source = f.read()
+    version = re.search(r"\(v([\d.]+)", source.splitlines()[0])
+    import transformers
+    return {
+        "version": version.group(1) if version else None,
+        "source_sha": brain.git_blob_sha(source),
+        "git_commit": git_commit(),
+        "model": brain.LLM_ID,
+        "embedding_model": brain.SENTENCE_MODEL_ID,
+        "device": brain.DEVICE,
+        "dtype": brain.CPU_DTYPE if brain.DEVICE == "cpu" else "nf4",
+        "threads": brain.torch.get_num_threads(),
+        "max_context_tokens": brain.token_budget.max_context,
+        "load_seconds": brain.BRAIN_STATE["load_seconds"],
+        "warmup_seconds": brain.BRAIN_STATE["warmup_seconds"],
+        "calibrated_decode_tokens_per_sec": brain.BRAIN_STATE["decode_tokens_per_sec"],
+        "torch": brain.torch.__version__,
+        "transformers": transformers.__version__,
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "gpu": brain.torch.cuda.get_device_name(0) if brain.DEVICE == "cuda" else None,
+    }
+
+def point_key(section: str, point: Dict[str, Any]) -> tuple:
+    if section == "generation":
+        return ("generation", point["prompt_tokens"], point["max_tokens"], point["batch_size"], point["concurrency"], point["empty_cache"])
+    return ("embeddings", point["kind"], point["batch_size"])
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Grid points present in both runs whose throughput fell or latency rose by more than `tolerance`."""
+    regressions = []
+    for section in ("generation", "embeddings"):
+        before = {point_key(section, p): p for p in baseline.get(section, [])}
+        for point in current.get(section, []):
+            base = before.get(point_key(section, point))
+            if base is None:
+                continue
+            label = "/".join(str(v) for v in point_key(section, point))
+            for field in HIGHER_IS_BETTER:
+                if base.get(field) and point.get(field) is not None and point[field] < base[field] * (1 - tolerance):
+                    regressions.append(f"{label} {field}: {base[field]} -> {point[field]}")
+            for field in LOWER_IS_BETTER:
+                if base.get(field) and point.get(field) is not None and point[field] > base[field] * (1 + tolerance):
+                    regressions.append(f"{label} {field}: {base[field]} -> {point[field]}")
+    return regressions
+
+def print_report(results: Dict[str, Any]):
+    info = results["brain"]
+    print(f"\n📊 {info['model']} on {info['device']}/{info['dtype']} (brain v{info['version']}, {info['git_commit'] or 'no git'})")
+    if results["generation"]:
+        print(f"{'prompt':>7} {'max':>5} {'batch':>5} {'conc':>5} {'ttft p50':>9} {'ttft p95':>9} {'prefill t/s':>12} {'decode t/s':>11} {'req t/s':>8} {'dropped':>8}")
+    for p in results["generation"]:
+        print(f"{p['prompt_tokens']:>7} {p['max_tokens']:>5} {p['batch_size']:>5} {p['concurrency']:>5} "
+              f"{p['ttft_p50_ms'] or '-':>9} {p['ttft_p95_ms'] or '-':>9} {p['prefill_tokens_per_sec'] or '-':>12} "
+              f"{p['decode_tokens_per_sec'] or '-':>11} {p['request_decode_tokens_per_sec'] or '-':>8} {p['dropped_prompt_tokens']:>8}"
+              f"{'' if p['empty_cache'] else '  (no empty_cache)'}")
+    if results["embeddings"]:
+        print(f"\n{'embed':>7} {'batch':>5} {'texts/s':>9} {'tokens/s':>10} {'batch ms':>9}")
+    for p in results["embeddings"]:
+        print(f"{p['kind']:>7} {p['batch_size']:>5} {p['texts_per_sec']:>9} {p['tokens_per_sec']:>10} {p['batch_ms']:>9}")
+
+#===============================================
+# STEP 6: Run
+#===============================================
+
+def int_list(text: str) -> List[int]:
+    return [int(v) for v in text.split(",") if v.strip()]
+
+def main():
+    global brain
+    parser = argparse.ArgumentParser(description="Microbenchmark for the FAB brain")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="tiny")
+    parser.add_argument("--prompt-tokens", type=int_list, help="Override the profile's prompt lengths, e.g. 256,2048")
+    parser.add_argument("--max-tokens", type=int_list)
+    parser.add_argument("--batch-sizes", type=int_list, help="Scheduler max batch sizes to try")
+    parser.add_argument("--concurrency", type=int_list, help="Requests in flight at once")
+    parser.add_argument("--embed-batches", type=int_list)
+    parser.add_argument("--repeats", type=int)
+    parser.add_argument("--empty-cache", default="1", help="Per-batch torch.cuda.empty_cache() settings to compare on CUDA, e.g. 1,0")
+    parser.add_argument("--skip-generation", action="store_true")
+    parser.add_argument("--skip-embeddings", action="store_true")
+    parser.add_argument("--out", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Results JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown per metric")
+    args = parser.parse_args()
+
+    profile = PROFILES[args.profile]
+    for key, value in profile["env"].items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import fab_brain
+    brain = fab_brain
+
+    print(f"🏋️ Benchmark profile '{args.profile}': loading {brain.LLM_ID} on {brain.DEVICE}...")
+    brain.load_and_warm()
+    if brain.BRAIN_STATE["phase"] != "ready":
+        raise SystemExit(f"Brain failed to start: {brain.BRAIN_STATE['error']}")
+
+    repeats = args.repeats or profile["repeats"]
+    empty_cache = [v.strip() == "1" for v in args.empty_cache.split(",")] if brain.DEVICE == "cuda" else [brain.EMPTY_CACHE_EACH_BATCH]
+    results: Dict[str, Any] = {
+        "tool": "fab-brain-bench",
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "profile": args.profile,
+        "brain": brain_info(),
+        "generation": [],
+        "embeddings": [],
+    }
+
+    if not args.skip_generation:
+        grid = [(p, m, b, c, e)
+                for p in args.prompt_tokens or profile["prompt_tokens"]
+                for m in args.max_tokens or profile["max_tokens"]
+                for c in args.concurrency or profile["concurrency"]
+                # A batch larger than the requests in flight behaves like batch == concurrency
+                for b in args.batch_sizes or profile["batch_sizes"] if b <= c
+                for e in empty_cache]
+        for i, point in enumerate(grid, 1):
+            result = run_generation_point(*point, repeats=repeats)
+            results["generation"].append(result)
+            print(f"⏱️ [{i}/{len(grid)}] prompt={point[0]} max={point[1]} batch={point[2]} conc={point[3]}: "
+                  f"ttft {result['ttft_p50_ms']}ms, decode {result['decode_tokens_per_sec']} tokens/sec")
+
+    if not args.skip_embeddings:
+        for kind in ("text", "code"):
+            for batch_size in args.embed_batches or profile["embed_batches"]:
+                texts = embedding_corpus(kind, max(64, batch_size * 4))
+                results["embeddings"].append(run_embedding_point(kind, batch_size, texts, repeats))
+
+    print_report(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\n🔍 Against {args.baseline} (brain {baseline['brain'].get('git_commit')}, {baseline['started_at']}):")
+        for line in regressions:
+            print(f"   ❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print("   ✅ No regressions")
+
+if __name__ == "__main__":
+    main()
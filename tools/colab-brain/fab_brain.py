@@ -1,28 +1,44 @@
 # FAB CLOUD BRAIN (v13.1 - Cloud Agnostic)
 # heavy tasking enabled: Qwen 2.5-1.5B (Fast & Light) + SentenceBERT
-# Compatible with Google Colab (T4) and Kaggle (T4/P100)
+# Compatible with Google Colab (T4) and Kaggle (T4/P100), or CPU-only nodes (FAB_BRAIN_DEVICE=cpu)
 
 import os
-# Auto-install dependencies if in cloud environments (Colab/Kaggle)
-if 'COLAB_GPU' in os.environ or 'KAGGLE_URL_BASE' in os.environ:
-    os.system("pip install -q fastapi uvicorn pydantic transformers torch accelerate bitsandbytes pyngrok nest-asyncio sentencepiece sentence-transformers")
+import sys
+# Auto-install dependencies when launched as a script in cloud environments (Colab/Kaggle).
+# Importing this module (uvicorn fab_brain:app, benchmarks) never touches pip.
+if __name__ == "__main__" and ('COLAB_GPU' in os.environ or 'KAGGLE_URL_BASE' in os.environ):
+    import subprocess
+    subprocess.run([sys.executable, "-m", "pip", "install", "-q", "fastapi", "uvicorn", "pydantic", "transformers", "torch", "accelerate", "bitsandbytes", "pyngrok", "nest-asyncio", "sentencepiece", "sentence-transformers"], check=False)
 
 os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
 import time
+import math
+import re
 import json
+import copy
+import base64
 import asyncio
-from typing import List, Optional, Dict, Any
+import hashlib
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
+from collections import deque, OrderedDict
+from concurrent.futures import Future
+from typing import List, Optional, Dict, Any, Callable, Awaitable
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, HTTPException, Request, Depends
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import uvicorn
 import nest_asyncio
 from pyngrok import ngrok, conf
 
 # Machine Learning Imports
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, StoppingCriteria, StoppingCriteriaList, LogitsProcessor, LogitsProcessorList
 from sentence_transformers import SentenceTransformer
 import torch
+import numpy as np
 #===============================================
 # STEP 2: Configure Ngrok
 #===============================================
@@ -39,147 +55,2421 @@ if NGROK_TOKEN != "YOUR_NGROK_TOKEN_HERE":
 #===============================================
 # STEP 3: Load Heavy Models (Targeting ~8GB VRAM)
 #===============================================
+# GPU: 4-bit NF4 via bitsandbytes. CPU: fp32, bf16 or (default) dynamic int8
+# quantization of every Linear layer, with torch threads pinned to physical cores.
+# Nothing loads at import: the server starts first and `load_and_warm` runs in the
+# background (see STEP 4d), so /ready can report progress while weights stream in.
 
-bnb_config = BitsAndBytesConfig(
-    load_in_4bit=True,
-    bnb_4bit_quant_type="nf4",
-    bnb_4bit_compute_dtype=torch.float16,
-    bnb_4bit_use_double_quant=True
-)
+# "auto" picks CUDA when present; "cpu" forces the CPU backend even on GPU hosts
+DEVICE = os.environ.get("FAB_BRAIN_DEVICE", "auto").lower()
+if DEVICE == "auto":
+    DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+CPU_DTYPE = os.environ.get("FAB_BRAIN_CPU_DTYPE", "int8").lower()  # int8 | bf16 | fp32
 
 # 1. Primary LLM: Qwen 2.5-1.5B-Instruct
-LLM_ID = "Qwen/Qwen2.5-1.5B-Instruct"
-print(f"🧠 Loading Main LLM: {LLM_ID}...")
-
-# Load Tokenizer & Model
-try:
-    tokenizer = AutoTokenizer.from_pretrained(LLM_ID, trust_remote_code=True)
-    model = AutoModelForCausalLM.from_pretrained(
-        LLM_ID, 
-        quantization_config=bnb_config,
-        device_map="auto", 
-        trust_remote_code=True,
-        torch_dtype=torch.float16
-    )
-    print("✅ Qwen 1.5B Loaded!")
-except Exception as e:
-    print(f"❌ Failed to load LLM: {e}")
-    # Fallback or exit logic here
-
-# 3. Semantic Search: Sentence-BERT
-print("📊 Loading Sentence-BERT...")
-sentence_model = SentenceTransformer('all-MiniLM-L6-v2')
-if torch.cuda.is_available():
-    sentence_model = sentence_model.to("cuda")
-print("✅ Sentence-BERT Loaded!")
-
-# Log GPU usage
-if torch.cuda.is_available():
-    gpu_mem = torch.cuda.memory_allocated() / 1024**3
-    gpu_total = torch.cuda.get_device_properties(0).total_memory / 1024**3
-    print(f"\n🎮 GPU: {torch.cuda.get_device_name(0)}")
-    print(f"💾 VRAM Used: {gpu_mem:.2f} GB / {gpu_total:.2f} GB")
+LLM_ID = os.environ.get("FAB_BRAIN_LLM_ID", "Qwen/Qwen2.5-1.5B-Instruct")
+# 2. Semantic Search: Sentence-BERT
+SENTENCE_MODEL_ID = os.environ.get("FAB_BRAIN_SENTENCE_MODEL_ID", "all-MiniLM-L6-v2")
+# 3. Optional draft model for speculative decoding (must share the main tokenizer), e.g. Qwen/Qwen2.5-0.5B-Instruct
+DRAFT_MODEL_ID = os.environ.get("FAB_BRAIN_DRAFT_MODEL_ID", "")
+DRAFT_TOKENS = int(os.environ.get("FAB_BRAIN_DRAFT_TOKENS", "5"))
+# Endpoints that decode with the draft model when it is loaded
+SPECULATIVE_ENDPOINTS = {e.strip() for e in os.environ.get("FAB_BRAIN_SPECULATIVE_ENDPOINTS", "evaluate-answer,generate-questions").split(",") if e.strip()}
+# Persistent weight cache (e.g. a Drive or /kaggle/working folder); used offline-first when set
+WEIGHTS_DIR = os.environ.get("FAB_BRAIN_WEIGHTS_DIR") or None
+
+tokenizer = None
+model = None
+draft_model = None
+sentence_model = None
+
+# Load progress, surfaced by /health and /ready
+BRAIN_STATE: Dict[str, Any] = {
+    "phase": "pending",          # pending -> loading -> warming -> ready | failed
+    "error": None,
+    "started_at": None,
+    "load_seconds": None,
+    "warmup_seconds": None,
+    "decode_tokens_per_sec": None,
+}
+
+def cpu_thread_count() -> int:
+    """FAB_BRAIN_THREADS, else one thread per physical core (hyperthreads slow GEMMs down)."""
+    if os.environ.get("FAB_BRAIN_THREADS"):
+        return int(os.environ["FAB_BRAIN_THREADS"])
+    try:
+        import psutil
+        return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    except ImportError:
+        return max(1, (os.cpu_count() or 2) // 2)
+
+def quantize_int8(module: torch.nn.Module) -> torch.nn.Module:
+    """Dynamic int8 quantization of Linear layers (weights int8, activations quantized per batch)."""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+def from_weights_cache(loader: Callable, model_id: str, **kwargs):
+    """Loads from FAB_BRAIN_WEIGHTS_DIR without touching the network, downloading into it on a miss."""
+    if not WEIGHTS_DIR:
+        return loader(model_id, **kwargs)
+    try:
+        return loader(model_id, local_files_only=True, **kwargs)
+    except Exception:
+        print(f"📥 {model_id} not in {WEIGHTS_DIR} yet, downloading...")
+        return loader(model_id, **kwargs)
+
+def load_models():
+    """Loads the tokenizer, the main LLM, the optional draft model and Sentence-BERT into the module globals."""
+    global tokenizer, model, draft_model, sentence_model
+
+    if DEVICE == "cpu":
+        torch.set_num_threads(cpu_thread_count())
+        print(f"🖥️ CPU backend: {CPU_DTYPE}, {torch.get_num_threads()} threads")
+
+    print(f"🧠 Loading Main LLM: {LLM_ID}...")
+    tok = from_weights_cache(AutoTokenizer.from_pretrained, LLM_ID, trust_remote_code=True, cache_dir=WEIGHTS_DIR)
+    if DEVICE == "cuda":
+        bnb_config = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.float16,
+            bnb_4bit_use_double_quant=True
+        )
+        llm = from_weights_cache(
+            AutoModelForCausalLM.from_pretrained,
+            LLM_ID, 
+            quantization_config=bnb_config,
+            device_map="auto", 
+            trust_remote_code=True,
+            torch_dtype=torch.float16,
+            cache_dir=WEIGHTS_DIR
+        )
+    else:
+        llm = from_weights_cache(
+            AutoModelForCausalLM.from_pretrained,
+            LLM_ID,
+            trust_remote_code=True,
+            torch_dtype=torch.bfloat16 if CPU_DTYPE == "bf16" else torch.float32,
+            cache_dir=WEIGHTS_DIR
+        )
+        if CPU_DTYPE == "int8":
+            llm = quantize_int8(llm)
+    llm.eval()
+    # Batched generation needs left padding so every prompt ends at the same position
+    tok.padding_side = "left"
+    if tok.pad_token is None:
+        tok.pad_token = tok.eos_token
+    tokenizer, model = tok, llm
+    print(f"✅ {LLM_ID} Loaded on {DEVICE}!")
+
+    if DRAFT_MODEL_ID:
+        print(f"🐇 Loading draft model: {DRAFT_MODEL_ID}...")
+        # Small enough to skip 4-bit: fp16 kernels keep the draft steps cheap on GPU
+        draft = from_weights_cache(
+            AutoModelForCausalLM.from_pretrained,
+            DRAFT_MODEL_ID,
+            trust_remote_code=True,
+            torch_dtype=torch.float16 if DEVICE == "cuda" else (torch.bfloat16 if CPU_DTYPE == "bf16" else torch.float32),
+            cache_dir=WEIGHTS_DIR
+        ).to(llm.device)
+        if DEVICE == "cpu" and CPU_DTYPE == "int8":
+            draft = quantize_int8(draft)
+        draft.eval()
+        draft.generation_config.num_assistant_tokens = DRAFT_TOKENS
+        draft.register_forward_hook(draft_counter)
+        draft_model = draft
+        print(f"✅ Draft model loaded (speculating on: {', '.join(sorted(SPECULATIVE_ENDPOINTS)) or 'nothing'})")
+
+    print("📊 Loading Sentence-BERT...")
+    encoder = from_weights_cache(SentenceTransformer, SENTENCE_MODEL_ID, device=DEVICE, cache_folder=WEIGHTS_DIR)
+    if DEVICE == "cpu" and CPU_DTYPE == "int8":
+        encoder = quantize_int8(encoder)
+    sentence_model = encoder
+    print("✅ Sentence-BERT Loaded!")
+
+    # Log GPU usage
+    if DEVICE == "cuda":
+        gpu_mem = torch.cuda.memory_allocated() / 1024**3
+        gpu_total = torch.cuda.get_device_properties(0).total_memory / 1024**3
+        print(f"\n🎮 GPU: {torch.cuda.get_device_name(0)}")
+        print(f"💾 VRAM Used: {gpu_mem:.2f} GB / {gpu_total:.2f} GB")
+
+def memory_snapshot() -> Dict[str, Any]:
+    """Current accelerator and host memory use, in GB."""
+    snapshot: Dict[str, Any] = {"device": DEVICE}
+    if DEVICE == "cuda":
+        snapshot.update({
+            "gpu": torch.cuda.get_device_name(0),
+            "gpu_allocated_gb": round(torch.cuda.memory_allocated() / 1024**3, 2),
+            "gpu_reserved_gb": round(torch.cuda.memory_reserved() / 1024**3, 2),
+            "gpu_total_gb": round(torch.cuda.get_device_properties(0).total_memory / 1024**3, 2),
+        })
+    try:
+        import psutil
+        snapshot["process_rss_gb"] = round(psutil.Process().memory_info().rss / 1024**3, 2)
+    except ImportError:
+        import resource
+        snapshot["process_max_rss_gb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024**2, 2)
+    return snapshot
 
 
 #===============================================
-# STEP 4: Core Functions
+# STEP 4: Request Batching
 #===============================================
+# Every endpoint funnels its prompts through one scheduler thread that owns the model.
+# Concurrent requests are padded into a single `model.generate` call instead of
+# fighting over the GPU one thread at a time.
+
+MAX_BATCH_SIZE = int(os.environ.get("FAB_BRAIN_MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.environ.get("FAB_BRAIN_MAX_BATCH_WAIT_MS", "20"))
+# Return freed CUDA blocks to the driver before every batch (fab_bench.py measures what it costs)
+EMPTY_CACHE_EACH_BATCH = os.environ.get("FAB_BRAIN_EMPTY_CACHE_EACH_BATCH", "1") == "1"
+# Backpressure: past this many waiting jobs new requests get 429 + Retry-After
+MAX_QUEUE_DEPTH = int(os.environ.get("FAB_BRAIN_MAX_QUEUE_DEPTH", "32"))
+# Used when the caller sends no X-Brain-Deadline-Ms (RemoteProvider gives up after 180 s)
+DEFAULT_DEADLINE_S = float(os.environ.get("FAB_BRAIN_DEFAULT_DEADLINE_S", "180"))
+# Single-flight: identical prompts in flight at once share one job, up to this sampling temperature
+COALESCE_REQUESTS = os.environ.get("FAB_BRAIN_COALESCE", "1") == "1"
+COALESCE_MAX_TEMPERATURE = float(os.environ.get("FAB_BRAIN_COALESCE_MAX_TEMPERATURE", "0.3"))
+
+# Priority classes, most urgent first. A request picks one with X-Brain-Priority, else its endpoint's default
+PRIORITY_CLASSES = ("interactive", "standard", "batch")
+PRIORITY_WEIGHTS = {
+    name.strip(): float(value)
+    for name, value in (pair.split("=") for pair in os.environ.get(
+        "FAB_BRAIN_PRIORITY_WEIGHTS", "interactive=8,standard=3,batch=1"
+    ).split(",") if "=" in pair)
+}
+PRIORITY_DEFAULTS = {
+    name.strip(): value.strip()
+    for name, value in (pair.split("=") for pair in os.environ.get(
+        "FAB_BRAIN_PRIORITY_DEFAULTS",
+        "evaluate-answer=interactive,evaluate-answer-stream=interactive,generate-stream=interactive,generate-questions=interactive,"
+        "analyze-code=batch,analyze-project=batch,analyze-resume=batch,batch/evaluate-answers=batch"
+    ).split(",") if "=" in pair)
+}
+# Running rows yield to more urgent waiting jobs at a token boundary, once each has decoded this many tokens in its run
+PREEMPTION = os.environ.get("FAB_BRAIN_PREEMPTION", "1") == "1"
+PREEMPT_MIN_TOKENS = int(os.environ.get("FAB_BRAIN_PREEMPT_MIN_TOKENS", "16"))
+
+# Draft proposals vs accepted tokens, summed over every speculative job
+SPECULATIVE_STATS = {"jobs": 0, "steps": 0, "proposed": 0, "accepted": 0}
+
+class _DraftCounter:
+    """
+    Forward hook on the draft model counting the candidate tokens it proposed.
+
+    Every draft forward pass emits one candidate, the first one of a round included: it
+    runs over the tokens the draft has not seen yet (the whole prompt on the first round)
+    and proposes from its last position. Counts are kept per thread, and a generate call
+    runs on a single thread, so draft passes from another call (warmup, calibration, a
+    benchmark) never land in a job's acceptance rate.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, module, args, output):
+        self._local.proposed = getattr(self._local, "proposed", 0) + 1
+
+    def take(self) -> int:
+        """Proposals made on this thread since the last take()."""
+        proposed, self._local.proposed = getattr(self._local, "proposed", 0), 0
+        return proposed
+
+draft_counter = _DraftCounter()
+
+class QueueFullError(Exception):
+    """The scheduler already holds MAX_QUEUE_DEPTH waiting jobs."""
 
-def generate_text(prompt: str, system_prompt: str = "", max_tokens: int = 1024, temperature: float = 0.3) -> str:
+class DeadlineExceededError(Exception):
+    """The caller's deadline passed before the job finished."""
+
+class JobCancelledError(Exception):
+    """The client went away; the job was stopped at a token boundary."""
+
+class GenerationJob:
+    """A single chat prompt waiting for (or running inside) a batched generate call.
+
+    `prompt_ids` is the tokenized chat prompt; its first `prefix_len` tokens are the
+    system-prompt prefix, which is served from the prefix KV cache when `prefix_key` is set.
+    A preempted job goes back in the queue and later resumes from `prompt_ids + output_ids`.
+    """
+
+    def __init__(self, prompt_ids: List[int], max_tokens: int, temperature: float, prefix_len: int = 0, prefix_key: Optional[str] = None,
+                 deadline: Optional[float] = None, speculative: bool = False, priority: str = "standard"):
+        self.prompt_ids = prompt_ids
+        self.deadline = deadline
+        self.speculative = speculative
+        self.rank = PRIORITY_CLASSES.index(priority)    # 0 = most urgent
+        self.run_start = 0              # len(output_ids) when the current generate call started
+        self.preemptions = 0
+        self.draft_proposed = 0
+        self.draft_accepted = 0
+        self.prefix_len = prefix_len
+        self.prefix_key = prefix_key
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.output_ids: List[int] = []
+        self.future: Future = Future()
+        self.enqueued_at = time.time()
+        self.first_token_at: Optional[float] = None
+        self.dropped_tokens = 0
+        self.grammar: Optional["JsonGrammar"] = None
+        self.json_watch: Optional["JsonStreamParser"] = None   # unconstrained JSON jobs: stop when the value closes
+        self.cancelled = False
+        self.waiters = 1                # callers sharing this job (see SingleFlight)
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+        self._stream_start = 0
+        self._streamed_chars = 0
+        self._streamed = ""             # every delta sent so far, replayed to late subscribers
+
+    @property
+    def batch_key(self):
+        """Jobs can only share a generate call when their sampling settings and cached prefix match."""
+        return (round(self.temperature, 3), self.prefix_key, self.grammar is not None, self.speculative)
+
+    @property
+    def priority(self) -> str:
+        return PRIORITY_CLASSES[self.rank]
+
+    @property
+    def input_ids(self) -> List[int]:
+        """What the model reads on this run: the prompt plus everything decoded before a preemption."""
+        return self.prompt_ids + self.output_ids if self.output_ids else self.prompt_ids
+
+    @property
+    def acceptance_rate(self) -> Optional[float]:
+        return round(self.draft_accepted / self.draft_proposed, 3) if self.draft_proposed else None
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+    @property
+    def json_complete(self) -> bool:
+        return (self.grammar is not None and self.grammar.complete) or (self.json_watch is not None and self.json_watch.complete)
+
+    def subscribe(self, listener: Callable[[Optional[str]], None]):
+        """Registers a callback that receives text deltas as they decode, then None at the end.
+
+        A listener that joins mid-generation (a coalesced stream) first receives the text so far.
+        """
+        with self._lock:
+            if self.future.done():
+                error = self.future.exception()
+                text = "" if error else self.future.result()[len(self._streamed):]
+                if self._streamed + text:
+                    listener(self._streamed + text)
+                listener(None)
+                return
+            if self._streamed:
+                listener(self._streamed)
+            self._listeners.append(listener)
+
+    def attach(self, deadline: Optional[float], priority: str = "standard") -> bool:
+        """Adds a caller to a job that is still running; False once it has finished or been cancelled."""
+        with self._lock:
+            if self.cancelled or self.future.done():
+                return False
+            self.waiters += 1
+            # An urgent caller promotes the shared job to its class
+            self.rank = min(self.rank, PRIORITY_CLASSES.index(priority))
+            # Work is only dropped once nobody is waiting: keep the latest deadline
+            self.deadline = None if deadline is None or self.deadline is None else max(self.deadline, deadline)
+            return True
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.time() > self.deadline
+
+    def cancel(self):
+        """Stops this row at the next token boundary once every caller sharing it has gone away."""
+        with self._lock:
+            self.waiters -= 1
+            if self.waiters <= 0:
+                self.cancelled = True
+
+    def abandon(self):
+        """Fails a job nobody is waiting for any more (cancelled or past its deadline)."""
+        if self.cancelled:
+            self.fail(JobCancelledError("Client disconnected"))
+        else:
+            self.fail(DeadlineExceededError(f"Deadline passed after {time.time() - self.enqueued_at:.1f}s"))
+
+    def push_tokens(self, token_ids: List[int]):
+        if self.grammar is not None:
+            for i, token_id in enumerate(token_ids):
+                text = token_text(token_id)
+                if text is None or not self.grammar.feed(text):
+                    # The model escaped the grammar (e.g. no valid candidate); decode freely from here
+                    self.grammar = None
+                    JSON_DECODING_STATS["abandoned"] += 1
+                    break
+                if self.grammar.complete:
+                    # A speculative step can accept tokens past the closing bracket
+                    token_ids = token_ids[:i + 1]
+                    break
+        elif self.json_watch is not None:
+            for i, token_id in enumerate(token_ids):
+                if self.json_watch.feed(token_text(token_id) or ""):
+                    token_ids = token_ids[:i + 1]
+                    break
+        if token_ids and self.first_token_at is None:
+            self.first_token_at = time.time()
+        self.output_ids.extend(token_ids)
+        with self._lock:
+            if not self._listeners:
+                return
+            # Same windowing as TextIteratorStreamer: decode since the last newline and
+            # hold back text that ends in a partial multi-byte character.
+            text = tokenizer.decode(self.output_ids[self._stream_start:], skip_special_tokens=True)
+            if text.endswith("\ufffd"):
+                return
+            delta = text[self._streamed_chars:]
+            if text.endswith("\n"):
+                self._stream_start, self._streamed_chars = len(self.output_ids), 0
+            else:
+                self._streamed_chars = len(text)
+            if delta:
+                self._streamed += delta
+                for listener in self._listeners:
+                    listener(delta)
+
+    def finish(self):
+        with self._lock:
+            if self.future.done():
+                return
+            if self._listeners:
+                tail = tokenizer.decode(self.output_ids[self._stream_start:], skip_special_tokens=True)[self._streamed_chars:]
+                self._streamed += tail
+                for listener in self._listeners:
+                    if tail:
+                        listener(tail)
+                    listener(None)
+            self.future.set_result(tokenizer.decode(self.output_ids, skip_special_tokens=True))
+
+    def fail(self, error: Exception):
+        with self._lock:
+            if not self.future.done():
+                for listener in self._listeners:
+                    listener(None)
+                self.future.set_exception(error)
+
+class _BatchStopper(StoppingCriteria):
+    """Tracks each row of a batch and resolves its job the moment that row is finished.
+
+    Short answers are handed back without waiting for the longest row in the batch.
+    """
+
+    def __init__(self, jobs: List[GenerationJob], prompt_len: int):
+        self.jobs = jobs
+        self.prompt_len = prompt_len
+        self.eos_ids = {tokenizer.eos_token_id, tokenizer.pad_token_id}
+        self.first_step_at: Optional[float] = None  # end of prefill, for the metrics split
+        self.preempted = False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_step_at is None:
+            self.first_step_at = time.time()
+        finished = []
+        for row, job in enumerate(self.jobs):
+            if not job.done:
+                new_ids = input_ids[row, self.prompt_len + len(job.output_ids) - job.run_start:].tolist()
+                if job.speculative:
+                    # One verify step yields the accepted draft tokens plus one from the main model
+                    proposed = draft_counter.take()
+                    accepted = min(proposed, max(0, len(new_ids) - 1))
+                    job.draft_proposed += proposed
+                    job.draft_accepted += accepted
+                    SPECULATIVE_STATS["steps"] += 1
+                    SPECULATIVE_STATS["proposed"] += proposed
+                    SPECULATIVE_STATS["accepted"] += accepted
+                hit_eos = False
+                for i, token_id in enumerate(new_ids):
+                    if token_id in self.eos_ids:
+                        new_ids, hit_eos = new_ids[:i], True
+                        break
+                job.push_tokens(new_ids[:job.max_tokens - len(job.output_ids)])
+                if job.json_complete:
+                    # The top-level JSON value just closed: nothing after it is worth decoding
+                    if len(job.output_ids) < job.max_tokens:
+                        JSON_DECODING_STATS["early_stops"] += 1
+                    job.finish()
+                elif hit_eos or len(job.output_ids) >= job.max_tokens:
+                    job.finish()
+                elif job.cancelled or job.expired:
+                    job.abandon()
+            finished.append(job.done)
+        if not all(finished) and scheduler.should_yield(self.jobs):
+            # Stop the whole call; _run_batch puts the unfinished rows back in the queue
+            self.preempted = True
+            return torch.ones(len(self.jobs), dtype=torch.bool, device=input_ids.device)
+        return torch.tensor(finished, dtype=torch.bool, device=input_ids.device)
+
+class PrefixCache:
+    """Bounded LRU of past_key_values for system-prompt prefixes.
+
+    Known prompts are pinned and always cached; any other system prompt is cached once
+    it has been seen `min_seen` times. Entries are only touched from the scheduler thread,
+    which owns the model, so building one never races a running batch.
+    """
+
+    def __init__(self, max_entries: int, min_seen: int, min_tokens: int):
+        self.max_entries = max_entries
+        self.min_seen = min_seen
+        self.min_tokens = min_tokens
+        self._entries: OrderedDict = OrderedDict()
+        self._seen: OrderedDict = OrderedDict()
+        self._pinned: set = set()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "reused_tokens": 0}
+
+    @staticmethod
+    def key_for(system_prompt: str) -> str:
+        return hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()
+
+    def pin(self, system_prompt: str):
+        with self._lock:
+            self._pinned.add(self.key_for(system_prompt))
+
+    def admit(self, system_prompt: str, prefix_len: int) -> Optional[str]:
+        """Returns the cache key if this prefix should be decoded from cache, else None."""
+        if self.max_entries <= 0 or prefix_len < self.min_tokens:
+            return None
+        key = self.key_for(system_prompt)
+        with self._lock:
+            if key in self._pinned or key in self._entries:
+                return key
+            self._seen[key] = self._seen.pop(key, 0) + 1
+            if len(self._seen) > 256:
+                self._seen.popitem(last=False)
+            return key if self._seen[key] >= self.min_seen else None
+
+    def get(self, key: str, prefix_ids: List[int]):
+        """Returns a private copy of the cached KV for `prefix_ids`, prefilling it on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["reused_tokens"] += len(prefix_ids)
+            else:
+                self.stats["misses"] += 1
+        if entry is None:
+            with torch.inference_mode():
+                entry = model(torch.tensor([prefix_ids], device=model.device), use_cache=True).past_key_values
+            with self._lock:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+        return copy.deepcopy(entry)
+
+class TokenBudget:
+    """Fits each prompt plus its generation into the context window.
+
+    The window is the smallest of the model's position limit, FAB_BRAIN_MAX_CONTEXT_TOKENS
+    and what the KV memory budget allows for a full batch. The system prefix and the chat
+    tail are always kept; only the user content is middle-elided, keeping its opening
+    instructions and its closing question.
+    """
+
+    HEAD_SHARE = 0.4
+    MIN_NEW_TOKENS = 64
+    MIN_USER_TOKENS = 256
+
+    def __init__(self, max_context: int, kv_budget_bytes: int, max_batch_size: int):
+        config = model.config
+        heads = config.num_attention_heads
+        head_dim = getattr(config, "head_dim", None) or config.hidden_size // heads
+        kv_heads = getattr(config, "num_key_value_heads", None) or heads
+        dtype_bytes = torch.finfo(model.dtype).bits // 8 if model.dtype.is_floating_point else 2
+        self.kv_bytes_per_token = 2 * config.num_hidden_layers * kv_heads * head_dim * dtype_bytes
+        memory_cap = kv_budget_bytes // (self.kv_bytes_per_token * max(1, max_batch_size))
+        self.max_context = int(min(max_context, getattr(config, "max_position_embeddings", max_context), memory_cap))
+        self.marker = "\n\n...[truncated]...\n\n"
+        self.marker_ids = tokenizer(self.marker, add_special_tokens=False).input_ids
+        self.stats = {"truncated_requests": 0, "dropped_tokens": 0}
+
+    def fit(self, prefix_ids: List[int], user_ids: List[int], tail_ids: List[int], max_new_tokens: int):
+        """
+        Returns:
+            tuple: (prompt_ids, max_new_tokens, dropped_tokens)
+        """
+        fixed = len(prefix_ids) + len(tail_ids)
+        max_new_tokens = min(max_new_tokens, max(self.MIN_NEW_TOKENS, self.max_context - fixed - min(len(user_ids), self.MIN_USER_TOKENS)))
+        room = max(0, self.max_context - fixed - max_new_tokens)
+        if len(user_ids) <= room:
+            return prefix_ids + user_ids + tail_ids, max_new_tokens, 0
+
+        if room > len(self.marker_ids):
+            keep = room - len(self.marker_ids)
+            head = int(keep * self.HEAD_SHARE)
+            dropped = len(user_ids) - keep
+            user_ids = user_ids[:head] + self.marker_ids + user_ids[len(user_ids) - (keep - head):]
+        else:
+            dropped = len(user_ids) - room
+            user_ids = user_ids[len(user_ids) - room:] if room else []
+        self.stats["truncated_requests"] += 1
+        self.stats["dropped_tokens"] += dropped
+        return prefix_ids + user_ids + tail_ids, max_new_tokens, dropped
+
+class BatchScheduler:
+    """Gathers concurrent generation jobs into padded batches.
+
+    A request that arrives alone runs immediately. The wait window only opens when
+    several requests are already queued or the previous batch was shared, so a burst
+    from the backend fills one batch instead of queueing serially.
+
+    Priority classes share the model by weighted fair queueing: each class is charged
+    the tokens its jobs decode divided by its weight, and the next batch is led by the
+    waiting class with the least charge. A more urgent job arriving while every running
+    row is less urgent preempts the batch at the next token boundary; the unfinished
+    rows keep their output and go back to the head of their class.
+    """
+
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_BATCH_WAIT_MS, max_queue_depth: int = MAX_QUEUE_DEPTH):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.max_queue_depth = max_queue_depth
+        self._last_batch_size = 1
+        self._mean_batch_s = 5.0
+        self.running = 0
+        self._virtual = [0.0] * len(PRIORITY_CLASSES)     # weighted tokens served per class
+        self._clock = 0.0                                   # charge of the class that led the last batch
+        self._handoff = False                               # a preemption just happened: most urgent class goes next
+        self.stats = {"batches": 0, "requests": 0, "largest_batch": 0, "generated_tokens": 0, "rejected": 0, "abandoned": 0, "preempted": 0}
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def queue_depths(self) -> Dict[str, int]:
+        with self._cond:
+            ranks = [job.rank for job in self._pending]
+        return {name: ranks.count(rank) for rank, name in enumerate(PRIORITY_CLASSES)}
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained, from the running mean batch time."""
+        return max(1, int((len(self._pending) / self.max_batch_size + 1) * self._mean_batch_s + 0.5))
+
+    def submit(self, job: GenerationJob) -> Future:
+        with self._cond:
+            # Interactive jobs only count their own class, so a flood of batch work cannot 429 them
+            ahead = sum(1 for queued in self._pending if queued.rank == 0) if job.rank == 0 else len(self._pending)
+            if ahead >= self.max_queue_depth:
+                self.stats["rejected"] += 1
+                raise QueueFullError(f"{ahead} requests already queued")
+            self._enqueue(job)
+            self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="fab-batch-scheduler", daemon=True)
+                self._thread.start()
+        return job.future
+
+    def _enqueue(self, job: GenerationJob, front: bool = False):
+        """Adds a job under the lock. A class that was idle starts at the current virtual clock,
+        so time spent with nothing queued does not bank credit against the other classes."""
+        if not any(queued.rank == job.rank for queued in self._pending):
+            self._virtual[job.rank] = max(self._virtual[job.rank], self._clock)
+        if front:
+            self._pending.appendleft(job)
+        else:
+            self._pending.append(job)
+
+    def requeue(self, jobs: List[GenerationJob]):
+        """Returns preempted jobs to the head of their classes, in their original order."""
+        with self._cond:
+            for job in reversed(jobs):
+                job.preemptions += 1
+                self._enqueue(job, front=True)
+            self._handoff = True
+            self.stats["preempted"] += len(jobs)
+            self._cond.notify()
+
+    def charge(self, batch: List[GenerationJob]):
+        """Bills each job's class for the tokens it decoded this run (at least one for its prefill)."""
+        with self._cond:
+            for job in batch:
+                self._virtual[job.rank] += max(1, len(job.output_ids) - job.run_start) / PRIORITY_WEIGHTS.get(job.priority, 1.0)
+
+    def should_yield(self, batch: List[GenerationJob]) -> bool:
+        """Whether a running batch should stop for a waiting job more urgent than all of its live rows."""
+        if not PREEMPTION:
+            return False
+        live = [job for job in batch if not job.done]
+        if not live or min(len(job.output_ids) - job.run_start for job in live) < max(1, PREEMPT_MIN_TOKENS):
+            return False
+        with self._cond:
+            waiting = min((job.rank for job in self._pending), default=len(PRIORITY_CLASSES))
+        return waiting < min(job.rank for job in live)
+
+    def _next_lead(self) -> GenerationJob:
+        """First queued job of the waiting class with the least weighted service, or of the
+        most urgent class right after a preemption (otherwise the preempted rows could win
+        the next pick and be preempted again)."""
+        ranks = {job.rank for job in self._pending}
+        rank = min(ranks) if self._handoff else min(ranks, key=lambda r: (self._virtual[r], r))
+        self._handoff = False
+        self._clock = self._virtual[rank]
+        return next(job for job in self._pending if job.rank == rank)
+
+    def _drop_abandoned(self):
+        """Fails queued jobs whose client disconnected or whose deadline passed while waiting."""
+        for job in [job for job in self._pending if job.cancelled or job.expired]:
+            self._pending.remove(job)
+            self.stats["abandoned"] += 1
+            job.abandon()
+
+    def _take_batch(self) -> List[GenerationJob]:
+        with self._cond:
+            while True:
+                while not self._pending:
+                    self._cond.wait()
+                if self.max_wait > 0 and (len(self._pending) > 1 or self._last_batch_size > 1):
+                    deadline = time.monotonic() + self.max_wait
+                    while len(self._pending) < self.max_batch_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                self._drop_abandoned()
+                if self._pending:
+                    break
+            lead = self._next_lead()
+            # Assisted generation only verifies one sequence at a time
+            limit = 1 if lead.speculative else self.max_batch_size
+            # Rows from other classes fill the free slots, most urgent first (FIFO within a class)
+            riders = sorted((job for job in self._pending if job is not lead and job.batch_key == lead.batch_key), key=lambda job: job.rank)
+            batch = [lead] + riders[:limit - 1]
+            for job in batch:
+                self._pending.remove(job)
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._take_batch()
+            self._last_batch_size = self.running = len(batch)
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                print(f"❌ Batch of {len(batch)} failed: {e}")
+                for job in batch:
+                    job.fail(e)
+            finally:
+                self.running = 0
+
+    def _build_inputs(self, batch: List[GenerationJob]) -> Dict[str, Any]:
+        """Left-pads the batch. With a cached prefix the padding sits between the shared
+        prefix and each row's suffix; position ids follow the attention mask, so every
+        row still continues straight on from the cached prefix."""
+        prefix_len = batch[0].prefix_len if batch[0].prefix_key else 0
+        suffixes = [job.input_ids[prefix_len:] for job in batch]
+        width = max(len(ids) for ids in suffixes)
+        pad_id = tokenizer.pad_token_id
+        input_ids, attention_mask = [], []
+        for job, ids in zip(batch, suffixes):
+            pad = width - len(ids)
+            input_ids.append(job.prompt_ids[:prefix_len] + [pad_id] * pad + ids)
+            attention_mask.append([1] * prefix_len + [0] * pad + [1] * len(ids))
+        inputs = {
+            "input_ids": torch.tensor(input_ids, device=model.device),
+            "attention_mask": torch.tensor(attention_mask, device=model.device),
+        }
+        if prefix_len:
+            past = prefix_cache.get(batch[0].prefix_key, batch[0].prompt_ids[:prefix_len])
+            if len(batch) > 1:
+                past.batch_repeat_interleave(len(batch))
+            inputs["past_key_values"] = past
+        return inputs
+
+    def _run_batch(self, batch: List[GenerationJob]):
+        started_at = time.time()
+        for job in batch:
+            job.run_start = len(job.output_ids)
+        model_inputs = self._build_inputs(batch)
+        prompt_len = model_inputs["input_ids"].shape[1]
+        temperature = batch[0].temperature
+        sampling = {}
+        logits_processor = LogitsProcessorList()
+        if batch[0].grammar is not None:
+            # The grammar mask acts as the top-k filter; HF's top-k/top-p would otherwise
+            # prune the valid candidates before the mask sees them.
+            sampling = {"top_k": 0, "top_p": 1.0}
+            logits_processor.append(_JsonConstraintProcessor(batch, prompt_len, greedy=temperature <= 0))
+        if batch[0].speculative:
+            sampling["assistant_model"] = draft_model
+            draft_counter.take()
+
+        # Memory Optimizations
+        if DEVICE == "cuda" and EMPTY_CACHE_EACH_BATCH:
+            torch.cuda.empty_cache()
+
+        stopper = _BatchStopper(batch, prompt_len)
+        with torch.inference_mode():
+            model.generate(
+                **model_inputs,
+                **sampling,
+                max_new_tokens=max(job.max_tokens - job.run_start for job in batch),
+                temperature=temperature if temperature > 0 else None,
+                do_sample=True if temperature > 0 else False,
+                use_cache=True,
+                pad_token_id=tokenizer.pad_token_id,
+                logits_processor=logits_processor,
+                stopping_criteria=StoppingCriteriaList([stopper])
+            )
+
+        preempted = [job for job in batch if not job.done] if stopper.preempted else []
+        for job in batch:
+            if job not in preempted:
+                job.finish()
+        finished_at = time.time()
+        self._mean_batch_s = 0.8 * self._mean_batch_s + 0.2 * (finished_at - started_at)
+        prefill_done = stopper.first_step_at or finished_at
+        metrics.observe_batch(batch, started_at, prefill_done - started_at, finished_at - prefill_done)
+        self.charge(batch)
+        if preempted:
+            self.requeue(preempted)
+        self.stats["batches"] += 1
+        # A preempted job counts once, when its last run finishes it
+        self.stats["requests"] += len(batch) - len(preempted)
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        self.stats["generated_tokens"] += sum(len(job.output_ids) - job.run_start for job in batch)
+
+PREFIX_CACHE_SIZE = int(os.environ.get("FAB_BRAIN_PREFIX_CACHE_SIZE", "16"))
+PREFIX_CACHE_MIN_SEEN = int(os.environ.get("FAB_BRAIN_PREFIX_CACHE_MIN_SEEN", "2"))
+PREFIX_CACHE_MIN_TOKENS = int(os.environ.get("FAB_BRAIN_PREFIX_CACHE_MIN_TOKENS", "32"))
+
+# Long fixed system prompts sent on every call; their prefill is cached from the first request.
+RESUME_EXTRACTOR_PROMPT = """You are an expert HR Data Extractor. 
+    Extract details from the resume into this JSON structure:
+    {
+        "languages": ["python", "java"],
+        "frameworks": ["react"],
+        "tools": ["git"],
+        "concepts": ["agile"],
+        "summary": "Professional summary...",
+        "experience": [{"company": "Name", "role": "Title", "duration": "Dates", "highlights": ["..."]}],
+        "projects": [{"name": "Title", "tech": ["stack"], "description": "..."}]
+    }
+    Return ONLY valid JSON. If data is missing, use empty arrays."""
+
+# /analyze-resume fast path: rules extract skills, sections, dates and companies; the LLM only writes what is left
+RESUME_NARRATIVE_PROMPT = """You are an expert HR Data Extractor. The resume's skills, roles, companies and dates are already extracted.
+    Write only the fields you are asked for, from the resume excerpt:
+    - summary: one-line professional summary (role, seniority, core stack)
+    - highlights: for each listed role, 2-4 short achievement bullets taken from the resume, in the order given
+    Never invent employers, numbers or technologies. Return ONLY valid JSON."""
+
+# Persona used by RemoteProvider.evaluateAnswer (backend/src/modules/llm/remote.ts)
+EVALUATOR_PERSONA_PROMPT = "You are a Senior Engineering Manager (10+ years exp). Be BRUTALLY HONEST. Do not sugarcoat. If the answer is vague, destroy it. If it's wrong, say it's wrong."
+# ...and its user prompt; RemoteProvider.evaluateAnswer sends single answers through /batch/evaluate-answers too
+EVALUATOR_PERSONA_TEMPLATE = """Evaluate this interview answer:
+Question: {question}
+Context: {context}
+Expected Points: {expected_points}
+Candidate Answer: "{answer}"
+
+Evalute based on:
+1. Accuracy (0-100)
+2. Depth (0-100) - Did they go deep or just surface level?
+3. Communication (0-100) - Was it clear and concise?
+
+Return JSON ONLY:
+{{
+    "score": 0-100,
+    "feedback": "Short, brutal, constructive feedback. Point out exactly what was missing.",
+    "satisfaction": 0-100,
+    "redFlags": ["flag1", "flag2"],
+    "breakdown": {{ "accuracy": 0, "depth": 0, "communication": 0 }}
+}}
+
+RESTRICT TO JSON FORMAT."""
+
+# System prompt for /analyze-project; the output shape is GitHubAnalyzer's DeepProjectAnalysis fields
+PROJECT_ANALYST_PROMPT = """You are a Principal Engineer reviewing a candidate's GitHub repository.
+    From the README, languages, file tree and the most informative code excerpts, judge what the project really demonstrates.
+
+    Return a JSON object with:
+    - complexity: "BASIC", "INTERMEDIATE" or "ADVANCED"
+    - architecture: one short phrase (e.g. "Layered REST API", "Monolithic SPA", "CLI with plugin system")
+    - learnedSkills: concrete skills the code proves (frameworks, patterns, techniques), not just language names
+    - projectType: one of "Web App", "CLI", "Library", "API", "Other"
+    - realWorldUtility: one sentence on why this project matters
+
+    Judge from the code, not from README claims. Return ONLY valid JSON."""
+
+class SingleFlight:
+    """
+    Merges identical generation requests that are in flight at the same moment.
+
+    A double-submit or a re-triggered analysis reaches the brain as the same prompt while
+    the first copy is still queued or decoding. The copy attaches to that job and gets its
+    result, or its token stream, instead of generating the same text twice. Keys cover the
+    tokenized chat prompt and every decoding setting, and only sampling at or below
+    COALESCE_MAX_TEMPERATURE is merged, where the copies would not differ in any way that matters.
+    """
+
+    def __init__(self, enabled: bool = COALESCE_REQUESTS, max_temperature: float = COALESCE_MAX_TEMPERATURE):
+        self.enabled = enabled
+        self.max_temperature = max_temperature
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0, "coalesced_streams": 0}
+
+    def key_for(self, prompt_ids: List[int], max_tokens: int, temperature: float, json_schema: Optional[Dict[str, Any]]) -> Optional[str]:
+        if not self.enabled or temperature > self.max_temperature:
+            return None
+        raw = json.dumps([prompt_ids, max_tokens, round(temperature, 3), json_schema], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def join(self, key: str, deadline: Optional[float], priority: str = "standard") -> Optional[GenerationJob]:
+        """The running job for `key` with one more caller attached, or None to run a new one."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or not job.attach(deadline, priority):
+                return None
+            self.stats["coalesced"] += 1
+            return job
+
+    def lead(self, key: str, job: GenerationJob):
+        with self._lock:
+            # Finished jobs are dropped here rather than from a done-callback, which would
+            # run on the scheduler thread while the job's own lock is held
+            self._jobs = {k: j for k, j in self._jobs.items() if not j.done}
+            self._jobs[key] = job
+            self.stats["leaders"] += 1
+
+prefix_cache = PrefixCache(PREFIX_CACHE_SIZE, PREFIX_CACHE_MIN_SEEN, PREFIX_CACHE_MIN_TOKENS)
+single_flight = SingleFlight()
+for known_prompt in (RESUME_EXTRACTOR_PROMPT, RESUME_NARRATIVE_PROMPT, EVALUATOR_PERSONA_PROMPT, PROJECT_ANALYST_PROMPT):
+    prefix_cache.pin(known_prompt)
+
+scheduler = BatchScheduler()
+
+MAX_CONTEXT_TOKENS = int(os.environ.get("FAB_BRAIN_MAX_CONTEXT_TOKENS", "4096"))
+
+def default_kv_budget_bytes() -> int:
+    """FAB_BRAIN_KV_BUDGET_GB, else half of the VRAM left after loading (4 GB on CPU)."""
+    if os.environ.get("FAB_BRAIN_KV_BUDGET_GB"):
+        return int(float(os.environ["FAB_BRAIN_KV_BUDGET_GB"]) * 1024**3)
+    if DEVICE == "cuda":
+        free, _ = torch.cuda.mem_get_info()
+        return int(free * 0.5)
+    return 4 * 1024**3
+
+token_budget: Optional[TokenBudget] = None  # sized from the model config once it has loaded
+
+#===============================================
+# STEP 4a: JSON-Constrained Decoding
+#===============================================
+# JSON endpoints decode under an incremental JSON grammar: each step only the top
+# candidates that keep the output valid survive, and the row stops the moment the
+# top-level value closes instead of running on to max_tokens.
+
+JSON_CONSTRAINED = os.environ.get("FAB_BRAIN_JSON_CONSTRAINED", "1") == "1"
+JSON_CONSTRAINT_TOP_K = int(os.environ.get("FAB_BRAIN_JSON_CONSTRAINT_TOP_K", "20"))
+JSON_DECODING_STATS = {"constrained_jobs": 0, "watched_jobs": 0, "early_stops": 0, "corrected_tokens": 0, "abandoned": 0,
+                       "parsed": 0, "repaired": 0, "parse_failures": 0}
+
+# Top-level keys each structured endpoint must produce before its object may close
+EVALUATION_SCHEMA = {"type": "object", "required": ["score", "feedback", "breakdown"]}
+RESUME_SCHEMA = {"type": "object", "required": ["languages", "frameworks", "tools", "concepts", "summary", "experience", "projects"]}
+QUESTIONS_SCHEMA = {"type": "object", "required": ["questions"]}
+PROJECT_SCHEMA = {"type": "object", "required": ["complexity", "architecture", "learnedSkills", "projectType", "realWorldUtility"]}
+PERSONA_EVALUATION_SCHEMA = {"type": "object", "required": ["score", "feedback", "satisfaction", "redFlags", "breakdown"]}
+
+# Digit counts are bounded so every number the grammar admits parses to a finite float:
+# an unbounded exponent lets the model write 1e999999, which comes back as inf and then
+# serializes as the non-standard `Infinity`.
+_NUMBER_RE = re.compile(r"-?(0|[1-9]\d{0,15})(\.\d{1,15})?([eE][+-]?\d{1,2})?")
+_NUMBER_PREFIX_RE = re.compile(r"-?(0|[1-9]\d{0,15})?(\.\d{0,15})?([eE][+-]?\d{0,2})?")
+_token_texts: Dict[int, Optional[str]] = {}
+_fallback_ids: List[int] = []
+
+def token_text(token_id: int) -> Optional[str]:
+    """Decoded text of a single token (None for special tokens), memoized."""
+    text = _token_texts.get(token_id, "")
+    if text == "":
+        text = None if token_id in tokenizer.all_special_ids else tokenizer.decode([token_id])
+        _token_texts[token_id] = text
+    return text
+
+def json_fallback_ids() -> List[int]:
+    """Single-character tokens that can always continue a JSON document (structure, digits, letters)."""
+    if not _fallback_ids:
+        for ch in '{}[],:" -0123456789abcdefghijklmnopqrstuvwxyz':
+            ids = tokenizer(ch, add_special_tokens=False).input_ids
+            if len(ids) == 1:
+                _fallback_ids.append(ids[0])
+    return _fallback_ids
+
+class JsonGrammar:
+    """Character-level pushdown recognizer for JSON.
+
+    `feed` advances the state and returns False as soon as the text can no longer be
+    the start of a valid document; `accepts` asks the same question without moving.
+    The root must be an object or array (leading whitespace is not allowed, so no
+    markdown fence or preamble), runs of whitespace are capped so a degenerate model
+    cannot pad forever, numbers have bounded digits so they stay finite, and a minimal schema can pin the root type and the keys the
+    top-level object needs before it is allowed to close.
+
+    It also remembers the last safe cut: the offset just after the most recent finished
+    member (or the root's opening bracket) and the containers open there, which is all
+    it takes to repair a truncated document (see `repair`).
+    """
+
+    WHITESPACE = " \t\n\r"
+    MAX_WHITESPACE_RUN = 32
+
+    def __init__(self, root: str = "any", required_keys=(), max_whitespace_run: Optional[int] = MAX_WHITESPACE_RUN):
+        self.root = root
+        self.required = frozenset(required_keys)
+        self.max_whitespace_run = max_whitespace_run
+        self.consumed = 0
+        self.safe_at = 0
+        self.safe_stack: Optional[tuple] = None
+        self.keys: frozenset = frozenset()
+        self.stack: List[str] = []
+        self.state = "START"
+        self.is_key = False
+        self.key_chars: List[str] = []
+        self.escape = False
+        self.unicode_left = 0
+        self.number = ""
+        self.literal_left = ""
+        self.whitespace_run = 0
+
+    @classmethod
+    def from_schema(cls, schema: Optional[Dict[str, Any]]) -> "JsonGrammar":
+        schema = schema or {}
+        root = schema.get("type") if schema.get("type") in ("object", "array") else "any"
+        return cls(root, schema.get("required", []) if root == "object" else ())
+
+    @property
+    def complete(self) -> bool:
+        return self.state == "DONE"
+
+    def clone(self) -> "JsonGrammar":
+        other = copy.copy(self)
+        other.stack = list(self.stack)
+        other.key_chars = list(self.key_chars)
+        return other
+
+    def accepts(self, text: str) -> bool:
+        return self.clone().feed(text)
+
+    def feed(self, text: str) -> bool:
+        for ch in text:
+            if not self._step(ch):
+                return False
+            self.consumed += 1
+        return True
+
+    def repair(self, text: str) -> Optional[str]:
+        """
+        Closes a truncated document fed so far as `text`: cuts back to the last safe point,
+        dropping a partial key, string, number, literal or nested container with no finished
+        member, and closes every container still open.
+        Returns None when not even the root container was opened.
+        """
+        if self.complete:
+            return text[:self.consumed]
+        if self.safe_stack is None:
+            return None
+        return text[:self.safe_at] + "".join("}" if kind == "obj" else "]" for kind in reversed(self.safe_stack))
+
+    def _step(self, ch: str) -> bool:
+        state = self.state
+        if state == "STRING":
+            return self._string_char(ch)
+        if state == "NUMBER":
+            if ch in "0123456789+-.eE":
+                self.number += ch
+                return _NUMBER_PREFIX_RE.fullmatch(self.number) is not None
+            if not _NUMBER_RE.fullmatch(self.number):
+                return False
+            self._end_value(self.consumed)
+            return self._step(ch)
+        if state == "LITERAL":
+            if not self.literal_left.startswith(ch):
+                return False
+            self.literal_left = self.literal_left[1:]
+            if not self.literal_left:
+                self._end_value()
+            return True
+        if ch in self.WHITESPACE:
+            self.whitespace_run += 1
+            return state != "START" and (self.max_whitespace_run is None or self.whitespace_run <= self.max_whitespace_run)
+        self.whitespace_run = 0
+        if state == "START":
+            if ch not in {"object": "{", "array": "["}.get(self.root, "{["):
+                return False
+            return self._begin_value(ch)
+        if state == "VALUE":
+            return self._begin_value(ch)
+        if state == "VALUE_OR_CLOSE":
+            return self._close("arr") if ch == "]" else self._begin_value(ch)
+        if state in ("KEY", "KEY_OR_CLOSE"):
+            if ch == '"':
+                self.state, self.is_key, self.key_chars = "STRING", True, []
+                return True
+            return state == "KEY_OR_CLOSE" and ch == "}" and self._close("obj")
+        if state == "COLON":
+            if ch != ":":
+                return False
+            self.state = "VALUE"
+            return True
+        if state == "COMMA_OR_CLOSE":
+            top = self.stack[-1]
+            if ch == ",":
+                self.state = "KEY" if top == "obj" else "VALUE"
+                return True
+            if (ch == "}" and top == "obj") or (ch == "]" and top == "arr"):
+                return self._close(top)
+        return False
+
+    def _string_char(self, ch: str) -> bool:
+        if self.unicode_left:
+            if ch not in "0123456789abcdefABCDEF":
+                return False
+            self.unicode_left -= 1
+            return True
+        if self.escape:
+            self.escape = False
+            if ch == "u":
+                self.unicode_left = 4
+                return True
+            return ch in '"\\/bfnrt'
+        if ch == "\\":
+            self.escape = True
+            return True
+        if ch == '"':
+            if not self.is_key:
+                self._end_value()
+            else:
+                if len(self.stack) == 1:
+                    self.keys = self.keys | {"".join(self.key_chars)}
+                self.state = "COLON"
+            return True
+        if ord(ch) < 0x20:
+            return False
+        if self.is_key:
+            self.key_chars.append(ch)
+        return True
+
+    def _begin_value(self, ch: str) -> bool:
+        if ch in "{[":
+            self.stack.append("obj" if ch == "{" else "arr")
+            self.state = "KEY_OR_CLOSE" if ch == "{" else "VALUE_OR_CLOSE"
+            if len(self.stack) == 1:
+                self.safe_at, self.safe_stack = self.consumed + 1, ("obj" if ch == "{" else "arr",)
+        elif ch == '"':
+            self.state, self.is_key = "STRING", False
+        elif ch in "-0123456789":
+            self.state, self.number = "NUMBER", ch
+        elif ch in "tfn":
+            self.state, self.literal_left = "LITERAL", {"t": "rue", "f": "alse", "n": "ull"}[ch]
+        else:
+            return False
+        return True
+
+    def _close(self, kind: str) -> bool:
+        if kind == "obj" and len(self.stack) == 1 and not self.required <= self.keys:
+            return False
+        self.stack.pop()
+        self._end_value()
+        return True
+
+    def _end_value(self, at: Optional[int] = None):
+        """`at` is where the value ended; by default just after the current character."""
+        self.state = "COMMA_OR_CLOSE" if self.stack else "DONE"
+        if self.stack:
+            self.safe_at, self.safe_stack = self.consumed + 1 if at is None else at, tuple(self.stack)
+
+class JsonStreamParser:
+    """
+    Incremental JSON extraction from free-running model output.
+
+    Text can arrive in any chunks: tokens as they decode, or a whole response at once.
+    Preamble, markdown fences and prose are skipped until a "{" or "[" opens a document the
+    grammar accepts; a start that goes wrong is dropped and scanning resumes just after it.
+    `complete` flips the moment the value closes, so unconstrained JSON jobs can stop
+    there too. `value()` parses it, or repairs a truncated one via JsonGrammar.repair.
+    Only the schema's root type is enforced: a value missing required keys is still parsed.
+    """
+
+    MAX_RESTARTS = 16
+
+    def __init__(self, root: str = "any"):
+        self.root = root
+        self.text = ""
+        self.start = 0
+        self.scan_from = 0
+        self.restarts = 0
+        self.grammar: Optional[JsonGrammar] = None
+        self.repaired = False
+
+    @classmethod
+    def from_schema(cls, schema: Optional[Dict[str, Any]]) -> "JsonStreamParser":
+        return cls(JsonGrammar.from_schema(schema).root)
+
+    @property
+    def complete(self) -> bool:
+        return self.grammar is not None and self.grammar.complete
+
+    def feed(self, chunk: str) -> bool:
+        """Consumes more output; returns True once a complete value has been seen."""
+        if self.complete:
+            return True
+        self.text += chunk
+        while self.restarts <= self.MAX_RESTARTS:
+            if self.grammar is None:
+                opens = [i for i in (self.text.find(c, self.scan_from) for c in {"object": "{", "array": "["}.get(self.root, "{["))
+                         if i != -1]
+                if not opens:
+                    self.scan_from = len(self.text)
+                    return False
+                self.start = min(opens)
+                self.grammar = JsonGrammar(self.root, max_whitespace_run=None)
+            if self.grammar.feed(self.text[self.start + self.grammar.consumed:]) or self.grammar.complete:
+                return self.complete
+            self.restarts += 1
+            self.scan_from, self.grammar = self.start + 1, None
+        return False
+
+    def value(self) -> Optional[Any]:
+        """The complete value, else the repaired truncated one, else None."""
+        if self.grammar is None:
+            return None
+        document = self.text[self.start:]
+        repaired = self.grammar.repair(document)
+        if repaired is None:
+            return None
+        try:
+            parsed = json.loads(repaired)
+        except json.JSONDecodeError:
+            return None
+        self.repaired = not self.complete
+        return parsed
+
+class _JsonConstraintProcessor(LogitsProcessor):
+    """Masks every candidate token that would break a row's JSON grammar.
+
+    Only the top candidates are checked (the first valid one when greedy), which keeps
+    the per-step cost to a handful of short string checks per row. If none of them fit,
+    the best-scoring single-character structural token that does is used instead.
+
+    Under speculative decoding the processor also scores draft and verify positions
+    ahead of the job's committed output, so those pending tokens are replayed first.
+    """
+
+    def __init__(self, jobs: List[GenerationJob], prompt_len: int, greedy: bool):
+        self.jobs = jobs
+        self.prompt_len = prompt_len
+        self.greedy = greedy
+
+    def __call__(self, input_ids, scores):
+        for row, job in enumerate(self.jobs):
+            grammar = job.grammar
+            if job.done or grammar is None:
+                continue
+            pending = input_ids[row, self.prompt_len + len(job.output_ids) - job.run_start:].tolist()
+            if pending:
+                grammar = grammar.clone()
+                if not all(grammar.feed(token_text(token_id) or "\x00") for token_id in pending):
+                    continue
+            k = min(JSON_CONSTRAINT_TOP_K, scores.shape[-1])
+            top_scores, top_ids = torch.topk(scores[row], k)
+            allowed = []
+            for score, token_id in zip(top_scores.tolist(), top_ids.tolist()):
+                if score == float("-inf"):
+                    break
+                text = token_text(token_id)
+                if text is not None and grammar.accepts(text):
+                    allowed.append(token_id)
+                    if self.greedy:
+                        break
+            if not allowed:
+                fallback = json_fallback_ids()
+                ranked = sorted(zip(scores[row, fallback].tolist(), fallback), reverse=True)
+                allowed = [token_id for _, token_id in ranked if grammar.accepts(token_text(token_id) or "\x00")][:1]
+            if not allowed:
+                continue
+            if allowed[0] != top_ids[0].item():
+                JSON_DECODING_STATS["corrected_tokens"] += 1
+            keep = torch.tensor(allowed, device=scores.device)
+            masked = torch.full_like(scores[row], float("-inf"))
+            masked[keep] = scores[row, keep]
+            scores[row] = masked
+        return scores
+
+#===============================================
+# STEP 4b: Core Functions
+#===============================================
+
+_USER_SENTINEL = "<<FAB_USER_CONTENT>>"
+
+def split_chat_prompt(prompt: str, system_prompt: str):
+    """
+    Renders the chat template around the user content.
+
+    Returns:
+        tuple: (prefix, user, tail) where prefix depends only on the system prompt and
+        tail closes the user turn and opens the assistant turn.
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": _USER_SENTINEL}
+    ]
+    text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    if text.count(_USER_SENTINEL) != 1:
+        messages[1]["content"] = prompt
+        return "", tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True), ""
+    head, tail = text.split(_USER_SENTINEL)
+    return head, prompt, tail
+
+def submit_generation(prompt: str, system_prompt: str = "", max_tokens: int = 1024, temperature: float = 0.3,
+                      json_schema: Optional[Dict[str, Any]] = None, deadline: Optional[float] = None,
+                      speculative: bool = False, priority: str = "standard", coalesce: bool = True) -> GenerationJob:
+    """
+    Builds the chat prompt and queues it on the batch scheduler without waiting.
+
+    Streaming endpoints subscribe to the returned job; everything else waits on `job.future`.
+    Passing `json_schema` (an empty dict means "any JSON") decodes under the JSON grammar.
+    `deadline` is a time.time() value after which the job is dropped. Raises QueueFullError
+    when the scheduler is saturated.
+
+    `speculative` decodes with the draft model when one is loaded and the queue is empty.
+    Speculation runs one sequence at a time, so under load batching is the better deal.
+
+    `priority` is one of PRIORITY_CLASSES (see `request_priority`).
+
+    An identical prompt already in flight is not queued again: the returned job is that one,
+    shared through `single_flight` (pass `coalesce=False` to always queue a new job).
+    """
+    system_prompt = system_prompt or "You are a helpful AI assistant."
+    prefix, user, tail = split_chat_prompt(prompt, system_prompt)
+
+    # 1. Tokenize the system prefix on its own so its KV can be reused across requests
+    prefix_ids = tokenizer(prefix, add_special_tokens=False).input_ids
+    user_ids = tokenizer(user, add_special_tokens=False).input_ids
+    tail_ids = tokenizer(tail, add_special_tokens=False).input_ids
+
+    # 2. Fit prompt + generation into the token budget (elides the middle of long user content)
+    prompt_ids, max_tokens, dropped = token_budget.fit(prefix_ids, user_ids, tail_ids, max_tokens)
+    if dropped:
+        print(f"✂️ Prompt over budget: elided {dropped} of {len(user_ids)} user tokens")
+
+    # 3. Attach to an identical job that is still queued or decoding
+    flight_key = single_flight.key_for(prompt_ids, max_tokens, temperature, json_schema) if coalesce else None
+    if flight_key is not None:
+        shared = single_flight.join(flight_key, deadline, priority)
+        if shared is not None:
+            return shared
+
+    speculative = speculative and draft_model is not None and scheduler.queue_depth == 0
+    # The draft model has no copy of the cached prefix KV, so speculative jobs prefill in full
+    prefix_key = None if speculative else prefix_cache.admit(system_prompt, len(prefix_ids))
+    job = GenerationJob(prompt_ids, max_tokens, temperature, len(prefix_ids), prefix_key, deadline, speculative, priority)
+    if speculative:
+        SPECULATIVE_STATS["jobs"] += 1
+    job.dropped_tokens = dropped
+    if json_schema is not None and JSON_CONSTRAINED:
+        job.grammar = JsonGrammar.from_schema(json_schema)
+        JSON_DECODING_STATS["constrained_jobs"] += 1
+    elif json_schema is not None:
+        job.json_watch = JsonStreamParser.from_schema(json_schema)
+        JSON_DECODING_STATS["watched_jobs"] += 1
+    scheduler.submit(job)
+    if flight_key is not None:
+        single_flight.lead(flight_key, job)
+    return job
+
+def generate_text(prompt: str, system_prompt: str = "", max_tokens: int = 1024, temperature: float = 0.3,
+                  speculative: bool = False) -> str:
     """
     Generates text using the loaded LLM.
 
+    The prompt is queued on the batch scheduler, so concurrent callers share a
+    single padded `model.generate` call.
+
     Args:
         prompt (str): The user input prompt.
         system_prompt (str): The system context.
         max_tokens (int): Maximum generation length.
         temperature (float): Randomness of output.
+        speculative (bool): Let the draft model propose tokens for the main model to verify.
 
     Returns:
         str: Generated text response.
     """
-    messages = [
-        {"role": "system", "content": system_prompt or "You are a helpful AI assistant."},
-        {"role": "user", "content": prompt}
-    ]
-    
-    # 1. Truncate long contexts to prevent OOM
-    text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    if len(text) > 8000: # Heuristic for 4-bit 1.5B model on T4
-        text = text[-8000:] 
-        
-    model_inputs = tokenizer([text], return_tensors="pt").to(model.device)
-    
-    # 2. Memory Optimizations
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
-        
-    with torch.inference_mode():
-        generated_ids = model.generate(
-            **model_inputs, 
-            max_new_tokens=max_tokens, 
-            temperature=temperature,
-            do_sample=True if temperature > 0 else False,
-            use_cache=True,
-            pad_token_id=tokenizer.eos_token_id
-        )
-    
-    output_ids = generated_ids[0][len(model_inputs.input_ids[0]):]
-    return tokenizer.decode(output_ids, skip_special_tokens=True)
+    return submit_generation(prompt, system_prompt, max_tokens, temperature, speculative=speculative).future.result()
+
+def use_speculative(endpoint: str) -> bool:
+    """Whether `endpoint` is configured for speculative decoding (FAB_BRAIN_SPECULATIVE_ENDPOINTS)."""
+    return draft_model is not None and endpoint in SPECULATIVE_ENDPOINTS
+
+def speculation_fields(job: GenerationJob) -> Dict[str, Any]:
+    """Draft acceptance for a finished job, merged into speculative responses."""
+    if not job.speculative:
+        return {}
+    return {"acceptance_rate": job.acceptance_rate, "draft_tokens_accepted": job.draft_accepted}
+
+def parse_json_output(text: str, schema: Optional[Dict[str, Any]] = None) -> tuple:
+    """
+    Parses model output with JsonStreamParser: first complete value (inside a markdown
+    fence if there is one), else the truncated value repaired.
+
+    Returns:
+        tuple: (parsed value or None, whether it had to be repaired).
+    """
+    fence = re.search(r"```(?:json)?\s*([\s\S]*?)(?:```|$)", text)
+    parser = JsonStreamParser.from_schema(schema)
+    parser.feed(fence.group(1) if fence and fence.group(1).strip() else text)
+    parsed = parser.value()
+    if parsed is None:
+        JSON_DECODING_STATS["parse_failures"] += 1
+    else:
+        JSON_DECODING_STATS["repaired" if parser.repaired else "parsed"] += 1
+    return parsed, parser.repaired
+
+def json_complete(parsed: Any, repaired: bool, schema: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Whether a parse counts as a success: not repaired from truncated output, of the schema's
+    root type and carrying all of its required keys. Only complete results are cached or
+    reported as ok; a repaired value is still handed back as a best effort.
+    """
+    if parsed is None or repaired:
+        return False
+    schema = schema or {}
+    if schema.get("type") == "object":
+        return isinstance(parsed, dict) and all(key in parsed for key in schema.get("required", []))
+    if schema.get("type") == "array":
+        return isinstance(parsed, list)
+    return True
 
-def extract_json(text: str) -> Optional[Any]:
+def extract_json(text: str, schema: Optional[Dict[str, Any]] = None) -> Optional[Any]:
     """
     Extracts and parses JSON from a markdown code block or raw string.
 
     Args:
         text (str): The string containing JSON.
+        schema (dict): Optional minimal schema; its root type skips values of the other kind.
 
     Returns:
-        Optional[Any]: Parsed JSON object or None if failed.
+        Optional[Any]: Parsed (or truncation-repaired) JSON, or None if there is none.
     """
-    import re
-    # Try finding JSON block
-    json_match = re.search(r'```(?:json)?\s*([\s\S]*?)```', text)
-    if json_match:
-        text = json_match.group(1)
-    
-    # Try finding raw structure
-    start_arr, start_obj = text.find('['), text.find('{')
-    
+    return parse_json_output(text, schema)[0]
+
+def request_deadline(request: Request) -> float:
+    """Absolute deadline from X-Brain-Deadline-Ms (how long the caller will wait); the default when missing, malformed or not a positive number."""
+    header = request.headers.get("x-brain-deadline-ms")
     try:
-        if start_arr != -1 and (start_obj == -1 or start_arr < start_obj):
-            end = text.rfind(']') + 1
-            if end > start_arr:
-                return json.loads(text[start_arr:end])
-        if start_obj != -1:
-            end = text.rfind('}') + 1
-            if end > start_obj:
-                return json.loads(text[start_obj:end])
-    except json.JSONDecodeError:
-        return None
-        
-    return None
+        budget_s = float(header) / 1000 if header else DEFAULT_DEADLINE_S
+    except ValueError:
+        budget_s = DEFAULT_DEADLINE_S
+    if not (math.isfinite(budget_s) and budget_s > 0):
+        budget_s = DEFAULT_DEADLINE_S
+    return time.time() + budget_s
+
+def request_priority(request: Request, endpoint: str) -> str:
+    """Priority class from X-Brain-Priority, else the endpoint's default (FAB_BRAIN_PRIORITY_DEFAULTS)."""
+    header = (request.headers.get("x-brain-priority") or "").strip().lower()
+    if header in PRIORITY_CLASSES:
+        return header
+    default = PRIORITY_DEFAULTS.get(endpoint, "standard")
+    return default if default in PRIORITY_CLASSES else "standard"
+
+async def _cancel_on_disconnect(request: Request, jobs: List[GenerationJob]):
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            for job in jobs:
+                job.cancel()
+            return
+
+async def await_job(job: GenerationJob, request: Request) -> str:
+    """
+    Waits for a job without holding a threadpool thread.
+
+    If the HTTP client disconnects first, the job is cancelled: dropped from the queue or
+    stopped at its next token boundary, so it stops holding up the requests behind it.
+    """
+    watcher = asyncio.ensure_future(_cancel_on_disconnect(request, [job]))
+    try:
+        return await asyncio.wrap_future(job.future)
+    finally:
+        watcher.cancel()
+
+async def await_jobs(jobs: List[GenerationJob], request: Request) -> List[Any]:
+    """Like `await_job` for several jobs; a failed job yields its exception instead of raising."""
+    watcher = asyncio.ensure_future(_cancel_on_disconnect(request, jobs))
+    try:
+        return await asyncio.gather(*(asyncio.wrap_future(job.future) for job in jobs), return_exceptions=True)
+    finally:
+        watcher.cancel()
+
+def stream_job_events(job: GenerationJob, start: float, json_schema: Optional[Dict[str, Any]] = None):
+    """
+    Relays a job's decoded text as Server-Sent Events.
+
+    Emits one `token` event per text delta and a final `done` event carrying the full
+    result, timing and, when `json_schema` is given, the parsed JSON. Closing the connection cancels
+    the generation at the next token boundary.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    if job.waiters > 1:
+        single_flight.stats["coalesced_streams"] += 1
+    job.subscribe(lambda delta: loop.call_soon_threadsafe(queue.put_nowait, delta))
+
+    def sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def events():
+        try:
+            while True:
+                delta = await queue.get()
+                if delta is None:
+                    break
+                yield sse("token", {"text": delta})
+            try:
+                res = await asyncio.wrap_future(job.future)
+            except Exception as e:
+                yield sse("error", {"error": str(e)})
+                return
+            done = {
+                "result": res,
+                "tokens": len(job.output_ids),
+                "truncated_tokens": job.dropped_tokens,
+                "ttft_ms": round(max(0.0, job.first_token_at - start)*1000) if job.first_token_at else None,
+                "time_ms": round((time.time() - start)*1000),
+                **speculation_fields(job)
+            }
+            if json_schema is not None:
+                parsed, repaired = parse_json_output(res, json_schema)
+                done.update({"parsed": parsed, "repaired": repaired,
+                             "parse_error": not json_complete(parsed, repaired, json_schema)})
+            yield sse("done", done)
+        finally:
+            job.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+EMBED_BATCH_SIZE = int(os.environ.get("FAB_BRAIN_EMBED_BATCH_SIZE", "64"))
+EMBED_MAX_TEXTS = int(os.environ.get("FAB_BRAIN_EMBED_MAX_TEXTS", "4096"))
+# Code embeddings: overlapping token windows pooled per file, stored by git blob SHA
+CODE_CHUNK_TOKENS = int(os.environ.get("FAB_BRAIN_CODE_CHUNK_TOKENS", "0"))          # 0 = the model's max_seq_length
+CODE_CHUNK_OVERLAP = int(os.environ.get("FAB_BRAIN_CODE_CHUNK_OVERLAP", "32"))
+CODE_MAX_CHUNKS = int(os.environ.get("FAB_BRAIN_CODE_MAX_CHUNKS", "64"))             # per file
+CODE_STORE_MEMORY_ENTRIES = int(os.environ.get("FAB_BRAIN_CODE_STORE_MEMORY_ENTRIES", "2048"))
+CODE_STORE_DISK_MB = float(os.environ.get("FAB_BRAIN_CODE_STORE_DISK_MB", "512"))
+
+def encode_texts(texts: List[str], batch_size: int = EMBED_BATCH_SIZE, normalize: bool = False) -> np.ndarray:
+    """
+    Encodes many strings with SentenceBERT in batches.
+
+    Returns:
+        np.ndarray: float32 matrix of shape (len(texts), dim).
+    """
+    if not texts:
+        return np.zeros((0, sentence_model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return sentence_model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=normalize,
+        show_progress_bar=False
+    ).astype(np.float32, copy=False)
 
 def get_code_embedding(code: str) -> List[float]:
-    """Generates embedding for code snippet using SentenceBERT."""
-    return sentence_model.encode(code[:1024], convert_to_tensor=False).tolist()
+    """Generates a file-level embedding for code: pooled token-window chunks, served from the code store."""
+    return embed_code_files([(code, None)])[0]["vector"].tolist()
 
 def get_text_embedding(text: str) -> List[float]:
     """Generates embedding for text using SentenceBERT."""
-    return sentence_model.encode(text, convert_to_tensor=False).tolist()
+    return encode_texts([text])[0].tolist()
+
+def git_blob_sha(content: str) -> str:
+    """The SHA git (and the GitHub trees API) gives a file with this content."""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def code_chunk_window() -> int:
+    """Tokens per code chunk: FAB_BRAIN_CODE_CHUNK_TOKENS, or whatever Sentence-BERT reads minus [CLS]/[SEP]."""
+    return CODE_CHUNK_TOKENS or max(16, sentence_model.max_seq_length - 2)
+
+def split_code_windows(content: str) -> List[tuple]:
+    """
+    Splits a file into overlapping token windows sized to the embedding model.
+
+    Returns:
+        List[tuple]: `(start_char, end_char, tokens)` per chunk. Files longer than
+        CODE_MAX_CHUNKS windows keep an evenly spaced sample so the whole file is covered.
+    """
+    offsets = sentence_model.tokenizer(content, add_special_tokens=False, return_offsets_mapping=True, verbose=False)["offset_mapping"]
+    if not offsets:
+        return []
+    window = code_chunk_window()
+    stride = max(1, window - CODE_CHUNK_OVERLAP)
+    starts = [0]
+    while starts[-1] + window < len(offsets):
+        starts.append(starts[-1] + stride)
+    if len(starts) > CODE_MAX_CHUNKS:
+        starts = [starts[i] for i in sorted(set(np.linspace(0, len(starts) - 1, CODE_MAX_CHUNKS).round().astype(int)))]
+    return [(offsets[s][0], offsets[min(s + window, len(offsets)) - 1][1], min(window, len(offsets) - s)) for s in starts]
+
+def pool_vectors(vectors: np.ndarray, weights) -> np.ndarray:
+    """Weighted mean of unit vectors, renormalized; zeros when there is nothing to pool."""
+    weights = np.asarray(weights, dtype=np.float32)
+    if len(vectors) == 0 or weights.sum() <= 0:
+        return np.zeros(sentence_model.get_sentence_embedding_dimension(), dtype=np.float32)
+    pooled = (vectors * weights[:, None]).sum(axis=0)
+    return pooled / max(float(np.linalg.norm(pooled)), 1e-12)
+
+
+#===============================================
+# STEP 4c: Response Cache
+#===============================================
+# Exact-match cache for greedy and grammar-constrained responses. Memory is the hot tier; a SQLite
+# file under FAB_BRAIN_CACHE_DIR is the warm tier that outlives a notebook restart
+# (point it at Google Drive or /kaggle/working to keep it across sessions).
+
+CACHE_DIR = os.environ.get("FAB_BRAIN_CACHE_DIR", os.path.join(os.getcwd(), "fab_brain_cache"))
+RESPONSE_CACHE_TTL_S = float(os.environ.get("FAB_BRAIN_RESPONSE_CACHE_TTL_S", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.environ.get("FAB_BRAIN_RESPONSE_CACHE_MEMORY_ENTRIES", "512"))
+RESPONSE_CACHE_DISK_MB = float(os.environ.get("FAB_BRAIN_RESPONSE_CACHE_DISK_MB", "256"))
+# Free text sampled hotter than this is not cached (JSON-constrained endpoints always are)
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.environ.get("FAB_BRAIN_RESPONSE_CACHE_MAX_TEMPERATURE", "0.0"))
+# Semantic layer (opt-in): "endpoint=min cosine" pairs; endpoints left out only use the exact cache.
+# Scoring endpoints never take part, since near-duplicate prompts there are different candidate answers.
+SEMANTIC_THRESHOLDS = {
+    name.strip(): float(value)
+    for name, value in (pair.split("=") for pair in os.environ.get("FAB_BRAIN_SEMANTIC_THRESHOLDS", "").split(",") if "=" in pair)
+}
+SEMANTIC_CACHE_ENTRIES = int(os.environ.get("FAB_BRAIN_SEMANTIC_CACHE_ENTRIES", "2048"))
+SEMANTIC_CACHE_TTL_S = float(os.environ.get("FAB_BRAIN_SEMANTIC_CACHE_TTL_S", str(24 * 3600)))
+SEMANTIC_CACHE_EVICTION = os.environ.get("FAB_BRAIN_SEMANTIC_CACHE_EVICTION", "lru").lower()  # lru | lfu | fifo
+# Question bank: retrieval-first /generate-questions
+QUESTION_BANK_MAX_ENTRIES = int(os.environ.get("FAB_BRAIN_QUESTION_BANK_MAX_ENTRIES", "20000"))
+QUESTION_MIN_SIMILARITY = float(os.environ.get("FAB_BRAIN_QUESTION_MIN_SIMILARITY", "0.35"))
+QUESTION_MMR_LAMBDA = float(os.environ.get("FAB_BRAIN_QUESTION_MMR_LAMBDA", "0.7"))           # 1 = pure relevance
+QUESTION_DUPLICATE_SIMILARITY = float(os.environ.get("FAB_BRAIN_QUESTION_DUPLICATE_SIMILARITY", "0.9"))
+QUESTION_SKILL_BOOST = 0.15     # added to the relevance of questions tagged with a requested skill
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) response cache bounded by entry count, disk size and TTL."""
+
+    def __init__(self, path: str, memory_entries: int, disk_bytes: int, ttl_s: float):
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self.ttl_s = ttl_s
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, endpoint TEXT, payload TEXT, size INTEGER,
+            created REAL, expires REAL, last_hit REAL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_hit ON responses(last_hit)")
+        self._db.commit()
+
+    @staticmethod
+    def key_for(endpoint: str, *parts) -> str:
+        raw = json.dumps([LLM_ID, endpoint, *parts], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Returns (tier, payload) or (None, None) on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return "memory", entry[1]
+            row = self._db.execute("SELECT payload, expires FROM responses WHERE key = ? AND expires > ?", (key, now)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None, None
+            self._db.execute("UPDATE responses SET last_hit = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            payload = json.loads(row[0])
+            self._remember(key, row[1], payload)
+            self.stats["disk_hits"] += 1
+            return "disk", payload
+
+    def put(self, key: str, endpoint: str, payload: Dict[str, Any]):
+        now = time.time()
+        blob = json.dumps(payload, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, now + self.ttl_s, payload)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, blob, len(blob), now, now + self.ttl_s, now)
+            )
+            self._puts += 1
+            if self._puts % 32 == 1:
+                self._prune(now)
+            self._db.commit()
+            self.stats["stores"] += 1
+
+    def _remember(self, key: str, expires: float, payload: Dict[str, Any]):
+        self._memory[key] = (expires, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self, now: float):
+        self._db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.disk_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_hit LIMIT 64").fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, size in rows:
+                if total <= self.disk_bytes:
+                    break
+                victims.append((key,))
+                total -= size
+            self._db.executemany("DELETE FROM responses WHERE key = ?", victims)
+            self.stats["evictions"] += len(victims)
+
+response_cache = ResponseCache(
+    os.path.join(CACHE_DIR, "responses.sqlite3"),
+    RESPONSE_CACHE_MEMORY_ENTRIES,
+    int(RESPONSE_CACHE_DISK_MB * 1024 * 1024),
+    RESPONSE_CACHE_TTL_S
+)
+
+class SemanticCache:
+    """
+    Bounded in-memory vector index answering near-duplicate prompts.
+
+    Entries are partitioned by endpoint plus every request parameter except the free text
+    (system prompt, max_tokens, ...), so only prompts that would run the same way are
+    compared. Sentence-BERT only reads its first ~256 tokens, so the text is embedded in
+    SEGMENT_CHARS windows and a match needs the same segment count and every segment
+    above the threshold: two resumes sharing a header do not collide.
+    """
+
+    SEGMENT_CHARS = 1000
+    MAX_SEGMENTS = 16
+
+    def __init__(self, max_entries: int, ttl_s: float, eviction: str):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.eviction = eviction if eviction in ("lru", "lfu", "fifo") else "lru"
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._partitions: Dict[str, List[int]] = {}
+        self._stacked: Dict[str, np.ndarray] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def partition_for(endpoint: str, context: tuple, segments: int) -> str:
+        raw = json.dumps([SENTENCE_MODEL_ID, LLM_ID, endpoint, *context, segments], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Normalized (segments, dim) embedding, or None for text too long to index."""
+        segments = [text[i:i + self.SEGMENT_CHARS] for i in range(0, max(1, len(text)), self.SEGMENT_CHARS)]
+        if len(segments) > self.MAX_SEGMENTS:
+            return None
+        return encode_texts(segments, normalize=True)
+
+    def lookup(self, partition: str, vectors: np.ndarray, threshold: float):
+        """Returns (similarity, payload) of the closest live entry above `threshold`, else (None, None)."""
+        now = time.time()
+        with self._lock:
+            ids = self._partitions.get(partition)
+            if ids:
+                stacked = self._stacked.get(partition)
+                if stacked is None:
+                    stacked = self._stacked[partition] = np.stack([self._entries[i]["vectors"] for i in ids])
+                # Weakest segment decides: (entries, segments) -> (entries,)
+                scores = np.einsum("esd,sd->es", stacked, vectors).min(axis=1)
+                best = int(np.argmax(scores))
+                entry = self._entries[ids[best]]
+                if scores[best] >= threshold and entry["expires"] > now:
+                    entry["last_hit"] = now
+                    entry["hits"] += 1
+                    self.stats["hits"] += 1
+                    return float(scores[best]), entry["payload"]
+            self.stats["misses"] += 1
+            return None, None
+
+    def put(self, partition: str, vectors: np.ndarray, payload: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            entry_id, self._next_id = self._next_id, self._next_id + 1
+            self._entries[entry_id] = {"partition": partition, "vectors": vectors.astype(np.float32), "payload": payload,
+                                       "created": now, "expires": now + self.ttl_s, "last_hit": now, "hits": 0}
+            self._partitions.setdefault(partition, []).append(entry_id)
+            self._stacked.pop(partition, None)
+            self.stats["stores"] += 1
+            self._evict(now)
+
+    def _evict(self, now: float):
+        expired = [i for i, e in self._entries.items() if e["expires"] <= now]
+        while len(self._entries) - len(expired) > self.max_entries:
+            rank = {
+                "lru": lambda e: e["last_hit"],
+                "lfu": lambda e: (e["hits"], e["last_hit"]),
+                "fifo": lambda e: e["created"],
+            }[self.eviction]
+            victim = min((i for i in self._entries if i not in expired), key=lambda i: rank(self._entries[i]))
+            expired.append(victim)
+            self.stats["evictions"] += 1
+        for entry_id in expired:
+            partition = self._entries.pop(entry_id)["partition"]
+            self._partitions[partition].remove(entry_id)
+            self._stacked.pop(partition, None)
+            if not self._partitions[partition]:
+                del self._partitions[partition]
+
+semantic_cache = SemanticCache(SEMANTIC_CACHE_ENTRIES, SEMANTIC_CACHE_TTL_S, SEMANTIC_CACHE_EVICTION)
+
+class CodeEmbeddingStore:
+    """
+    Content-addressed chunk vectors for source files, keyed by git blob SHA.
+
+    A blob's chunks and vectors never change, so entries have no TTL: the same memory LRU
+    + SQLite layout as ResponseCache, bounded by entry count and disk size. Rows are also
+    keyed by `namespace()` (model, window, overlap), so changing any of those re-embeds
+    instead of mixing vector spaces.
+    """
+
+    def __init__(self, path: str, memory_entries: int, disk_bytes: int):
+        self.memory_entries = memory_entries
+        self.disk_bytes = disk_bytes
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "chunks_embedded": 0}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS code_embeddings (
+            sha TEXT, namespace TEXT, spans TEXT, vectors BLOB, size INTEGER,
+            created REAL, last_hit REAL, PRIMARY KEY (sha, namespace))""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS code_embeddings_last_hit ON code_embeddings(last_hit)")
+        self._db.commit()
+
+    @staticmethod
+    def namespace() -> str:
+        return f"{SENTENCE_MODEL_ID}|{code_chunk_window()}|{CODE_CHUNK_OVERLAP}|{CODE_MAX_CHUNKS}"
+
+    def get_many(self, shas: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Returns `{sha: {"spans", "vectors"}}` for the SHAs already embedded."""
+        namespace, now, found = self.namespace(), time.time(), {}
+        with self._lock:
+            for sha in shas:
+                entry = self._memory.get((sha, namespace))
+                if entry is not None:
+                    self._memory.move_to_end((sha, namespace))
+                    self.stats["memory_hits"] += 1
+                    found[sha] = entry
+                    continue
+                row = self._db.execute("SELECT spans, vectors FROM code_embeddings WHERE sha = ? AND namespace = ?", (sha, namespace)).fetchone()
+                if row is None:
+                    self.stats["misses"] += 1
+                    continue
+                spans = [tuple(span) for span in json.loads(row[0])]
+                entry = {"spans": spans, "vectors": np.frombuffer(row[1], dtype="<f2").astype(np.float32).reshape(len(spans), -1)}
+                self._db.execute("UPDATE code_embeddings SET last_hit = ? WHERE sha = ? AND namespace = ?", (now, sha, namespace))
+                self._remember((sha, namespace), entry)
+                self.stats["disk_hits"] += 1
+                found[sha] = entry
+            self._db.commit()
+        return found
+
+    def put_many(self, entries: Dict[str, Dict[str, Any]]):
+        namespace, now = self.namespace(), time.time()
+        with self._lock:
+            for sha, entry in entries.items():
+                blob = entry["vectors"].astype("<f2").tobytes()
+                self._remember((sha, namespace), entry)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO code_embeddings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (sha, namespace, json.dumps(entry["spans"]), blob, len(blob), now, now)
+                )
+                self._puts += 1
+                self.stats["stores"] += 1
+                if self._puts % 64 == 1:
+                    self._prune()
+            self._db.commit()
+
+    def _remember(self, key: tuple, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM code_embeddings").fetchone()[0]
+        while total > self.disk_bytes:
+            rows = self._db.execute("SELECT sha, namespace, size FROM code_embeddings ORDER BY last_hit LIMIT 64").fetchall()
+            if not rows:
+                break
+            self._db.executemany("DELETE FROM code_embeddings WHERE sha = ? AND namespace = ?", [(sha, ns) for sha, ns, _ in rows])
+            total -= sum(size for _, _, size in rows)
+            self.stats["evictions"] += len(rows)
+
+code_store = CodeEmbeddingStore(
+    os.path.join(CACHE_DIR, "code_embeddings.sqlite3"),
+    CODE_STORE_MEMORY_ENTRIES,
+    int(CODE_STORE_DISK_MB * 1024 * 1024)
+)
+
+def embed_code_files(files: List[tuple]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Chunk and file vectors for `(content, sha)` pairs, computing only blobs the store lacks.
+
+    Content, when present, is addressed by its own git blob SHA (a caller-sent SHA is only
+    used to look up a file whose content was left out). Every missing blob is chunked and
+    all their chunks are encoded in one batched pass. Each result holds `sha`, `spans`,
+    chunk `vectors`, the token-weighted pooled `vector`, `tokens` and `cached`; files that
+    are neither stored nor sent come back as None.
+    """
+    shas = [git_blob_sha(content) if content is not None else sha for content, sha in files]
+    found = code_store.get_many(list(dict.fromkeys(sha for sha in shas if sha)))
+
+    pending: Dict[str, str] = {}
+    for (content, _), sha in zip(files, shas):
+        if content is not None and sha not in found:
+            pending[sha] = content
+    if pending:
+        spans = {sha: split_code_windows(content) for sha, content in pending.items()}
+        texts = [pending[sha][start:end] for sha in pending for start, end, _ in spans[sha]]
+        vectors, offset, computed = encode_texts(texts, normalize=True), 0, {}
+        for sha in pending:
+            computed[sha] = {"spans": spans[sha], "vectors": vectors[offset:offset + len(spans[sha])]}
+            offset += len(spans[sha])
+        code_store.put_many(computed)
+        code_store.stats["chunks_embedded"] += len(texts)
+        found.update({sha: {**entry, "fresh": True} for sha, entry in computed.items()})
+
+    results = []
+    for sha in shas:
+        entry = found.get(sha)
+        if entry is None:
+            results.append(None)
+            continue
+        tokens = [span[2] for span in entry["spans"]]
+        results.append({
+            "sha": sha,
+            "spans": entry["spans"],
+            "vectors": entry["vectors"],
+            "vector": pool_vectors(entry["vectors"], tokens),
+            "tokens": sum(tokens),
+            "cached": not entry.get("fresh", False)
+        })
+    return results
+
+class QuestionBank:
+    """
+    Vector index over every interview question the brain knows about: the backend's curated
+    bank, what its scraper collected, and questions this node generated before.
+
+    Questions are stored once per normalized text in SQLite (vectors as float16) and kept
+    in memory as one normalized matrix. `search` ranks them by their best similarity to any
+    probe (a skill or a project), boosts questions tagged with a requested skill, drops the
+    session's earlier questions and their near-duplicates, then picks with MMR so the result
+    does not ask the same thing three ways.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: List[Dict[str, Any]] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retrieved": 0, "generated": 0, "fallbacks": 0, "indexed": 0, "evictions": 0}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS questions (
+            id TEXT, namespace TEXT, payload TEXT, vector BLOB, source TEXT,
+            created REAL, PRIMARY KEY (id, namespace))""")
+        self._db.commit()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text.lower()).strip().rstrip("?.!,")
+
+    @classmethod
+    def question_id(cls, text: str) -> str:
+        return hashlib.sha256(cls.normalize(text).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def index_text(question: Dict[str, Any]) -> str:
+        topic = question.get("context") or ", ".join(question.get("skills", []))
+        return f"{topic}: {question['text']}" if topic else question["text"]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+    def _load(self):
+        if self._loaded:
+            return
+        rows = self._db.execute("SELECT id, payload, vector, created FROM questions WHERE namespace = ? ORDER BY created",
+                                (SENTENCE_MODEL_ID,)).fetchall()
+        self._entries = [{**json.loads(payload), "id": qid, "created": created,
+                          "vector": np.frombuffer(vector, dtype="<f2").astype(np.float32)} for qid, payload, vector, created in rows]
+        self._matrix = None
+        self._loaded = True
+
+    def stacked(self) -> np.ndarray:
+        if self._matrix is None:
+            dim = sentence_model.get_sentence_embedding_dimension()
+            self._matrix = np.stack([e["vector"] for e in self._entries]) if self._entries else np.zeros((0, dim), dtype=np.float32)
+        return self._matrix
+
+    def add(self, questions: List[Dict[str, Any]]) -> int:
+        """Indexes questions not seen before (by normalized text). Returns how many were new."""
+        with self._lock:
+            self._load()
+            known = {e["id"] for e in self._entries}
+            fresh = {}
+            for q in questions:
+                qid = self.question_id(q["text"])
+                if q["text"].strip() and qid not in known and qid not in fresh:
+                    fresh[qid] = q
+        if not fresh:
+            return 0
+        vectors = encode_texts([self.index_text(q) for q in fresh.values()], normalize=True)
+        now = time.time()
+        with self._lock:
+            known = {e["id"] for e in self._entries}
+            rows = []
+            for (qid, q), vector in zip(fresh.items(), vectors):
+                if qid in known:
+                    continue
+                self._entries.append({**q, "id": qid, "created": now, "vector": vector})
+                rows.append((qid, SENTENCE_MODEL_ID, json.dumps(q, ensure_ascii=False), vector.astype("<f2").tobytes(), q.get("source", ""), now))
+            self._db.executemany("INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self._db.commit()
+            self._matrix = None
+            self.stats["indexed"] += len(rows)
+            return len(rows)
+
+    def _evict(self):
+        """Over capacity, the oldest generated questions go first; the curated bank goes last."""
+        overflow = len(self._entries) - self.max_entries
+        if overflow <= 0:
+            return
+        order = sorted(range(len(self._entries)), key=lambda i: (self._entries[i].get("source") != "generated", self._entries[i]["created"]))
+        victims = set(order[:overflow])
+        self._db.executemany("DELETE FROM questions WHERE id = ? AND namespace = ?",
+                             [(self._entries[i]["id"], SENTENCE_MODEL_ID) for i in victims])
+        self._entries = [e for i, e in enumerate(self._entries) if i not in victims]
+        self.stats["evictions"] += len(victims)
+
+    def search(self, probes: np.ndarray, skills: List[str], count: int, exclude_texts: List[str],
+               exclude_vectors: np.ndarray, difficulty: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Up to `count` relevant, mutually diverse questions the session has not asked yet."""
+        with self._lock:
+            self._load()
+            entries, matrix = list(self._entries), self.stacked()
+        if not entries or len(probes) == 0 or count <= 0:
+            return []
+        relevance = (matrix @ probes.T).max(axis=1)
+        wanted = {s.lower() for s in skills}
+        excluded = {self.question_id(t) for t in exclude_texts}
+        near_duplicate = (matrix @ exclude_vectors.T).max(axis=1) >= QUESTION_DUPLICATE_SIMILARITY if len(exclude_vectors) \
+            else np.zeros(len(entries), dtype=bool)
+        for i, e in enumerate(entries):
+            if wanted & {s.lower() for s in e.get("skills", [])}:
+                relevance[i] += QUESTION_SKILL_BOOST
+            if e["id"] in excluded or near_duplicate[i] or (difficulty and e.get("difficulty") != difficulty):
+                relevance[i] = -np.inf
+
+        candidates = [i for i in np.argsort(-relevance)[:max(64, count * 8)] if relevance[i] >= QUESTION_MIN_SIMILARITY]
+        picked: List[int] = []
+        while candidates and len(picked) < count:
+            redundancy = (matrix[candidates] @ matrix[picked].T).max(axis=1) if picked else np.zeros(len(candidates))
+            scores = QUESTION_MMR_LAMBDA * relevance[candidates] - (1 - QUESTION_MMR_LAMBDA) * redundancy
+            best = candidates.pop(int(np.argmax(scores)))
+            if picked and float((matrix[picked] @ matrix[best]).max()) >= QUESTION_DUPLICATE_SIMILARITY:
+                continue
+            picked.append(best)
+        return [{**{k: v for k, v in entries[i].items() if k not in ("vector", "id", "created")},
+                 "similarity": round(float(relevance[i]), 4)} for i in picked]
+
+question_bank = QuestionBank(os.path.join(CACHE_DIR, "questions.sqlite3"), QUESTION_BANK_MAX_ENTRIES)
+
+async def serve_cached(response: Response, endpoint: str, parts: tuple, temperature: float,
+                       compute: Callable[[], Awaitable[Dict[str, Any]]], store_if: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                       semantic_text: Optional[str] = None, constrained: bool = False) -> Dict[str, Any]:
+    """
+    Answers from the response cache or runs `compute` and stores its result.
+
+    Sets `X-Brain-Cache` to HIT-MEMORY, HIT-DISK, HIT-SEMANTIC, MISS or BYPASS (sampled
+    free text, above RESPONSE_CACHE_MAX_TEMPERATURE). `constrained` endpoints decode under a
+    JSON grammar, which pins the output to one structured answer, so they are cached at their
+    fixed low temperature. `time_ms` is never cached; on a hit it reports the lookup time.
+    SQLite lookups and stores run in the threadpool, off the event loop.
+
+    `semantic_text` is the free-text element of `parts`. When the endpoint has a semantic
+    threshold, an exact miss is retried against near-duplicates of that text; a semantic
+    hit also carries `semantic_similarity` in the body.
+    """
+    if not constrained and temperature > RESPONSE_CACHE_MAX_TEMPERATURE:
+        response.headers["X-Brain-Cache"] = "BYPASS"
+        return await compute()
+
+    start = time.time()
+    key = response_cache.key_for(endpoint, *parts)
+    tier, payload = await run_in_threadpool(response_cache.get, key)
+    if payload is not None:
+        response.headers["X-Brain-Cache"] = f"HIT-{tier.upper()}"
+        return {**payload, "time_ms": round((time.time() - start)*1000)}
+
+    threshold = SEMANTIC_THRESHOLDS.get(endpoint)
+    vectors = None
+    if threshold is not None and semantic_text is not None:
+        vectors = await run_in_threadpool(semantic_cache.embed, semantic_text)
+    if vectors is not None:
+        text_at = next(i for i, part in enumerate(parts) if part is semantic_text)
+        partition = semantic_cache.partition_for(endpoint, parts[:text_at] + parts[text_at + 1:], len(vectors))
+        similarity, payload = semantic_cache.lookup(partition, vectors, threshold)
+        if payload is not None:
+            response.headers["X-Brain-Cache"] = "HIT-SEMANTIC"
+            return {**payload, "semantic_similarity": round(similarity, 4), "time_ms": round((time.time() - start)*1000)}
+
+    response.headers["X-Brain-Cache"] = "MISS"
+    result = await compute()
+    if store_if is None or store_if(result):
+        payload = {k: v for k, v in result.items() if k != "time_ms"}
+        await run_in_threadpool(response_cache.put, key, endpoint, payload)
+        if vectors is not None:
+            semantic_cache.put(partition, vectors, payload)
+    return result
+
+
+#===============================================
+# STEP 4d: Startup, Warmup & Readiness
+#===============================================
+
+def measure_decode_rate(new_tokens: int = 32) -> float:
+    """
+    Times a short greedy generation through the scheduler.
+
+    Returns:
+        float: Decode throughput in tokens/sec for a single request on this node.
+    """
+    job = submit_generation("Count from one to one hundred in words.", "", new_tokens, 0.0)
+    job.future.result()
+    decoded = len(job.output_ids) - 1
+    if decoded <= 0 or job.first_token_at is None:
+        return 0.0
+    return round(decoded / max(time.time() - job.first_token_at, 1e-6), 1)
+
+def warmup():
+    """
+    Runs real traffic shapes through the stack before the node reports ready.
+
+    Compiles the generate/attention kernels for single, batched and speculative shapes,
+    prefills the pinned system prompts into the prefix cache, builds the grammar fallback
+    table and warms the embedding model, then measures decode speed (see README, "Sizing").
+    """
+    json_fallback_ids()
+    if draft_model is not None:
+        submit_generation("Hello", "", 8, 0.0, {}, speculative=True).future.result()
+    jobs = [submit_generation("Hello", known_prompt, 4, 0.0) for known_prompt in
+            (RESUME_EXTRACTOR_PROMPT, RESUME_NARRATIVE_PROMPT, EVALUATOR_PERSONA_PROMPT, PROJECT_ANALYST_PROMPT)]
+    jobs += [submit_generation("Return an empty JSON object.", "", 8, 0.2, {}, coalesce=False) for _ in range(2)]
+    for job in jobs:
+        job.future.result()
+    encode_texts(["warmup"] * 8)
+    if os.environ.get("FAB_BRAIN_CALIBRATE", "1") == "1":
+        BRAIN_STATE["decode_tokens_per_sec"] = measure_decode_rate()
+        print(f"⏱️ Decode speed: {BRAIN_STATE['decode_tokens_per_sec']} tokens/sec ({DEVICE}{'/' + CPU_DTYPE if DEVICE == 'cpu' else ''})")
+
+def load_and_warm():
+    """Loads and warms both models, recording each phase in BRAIN_STATE."""
+    global token_budget
+    BRAIN_STATE.update(phase="loading", error=None, started_at=time.time())
+    try:
+        load_models()
+        token_budget = TokenBudget(MAX_CONTEXT_TOKENS, default_kv_budget_bytes(), MAX_BATCH_SIZE)
+        print(f"📏 Context budget: {token_budget.max_context} tokens per request ({token_budget.kv_bytes_per_token // 1024} KB KV/token)")
+        BRAIN_STATE.update(phase="warming", load_seconds=round(time.time() - BRAIN_STATE["started_at"], 1))
+
+        warmup_start = time.time()
+        warmup()
+        BRAIN_STATE.update(phase="ready", warmup_seconds=round(time.time() - warmup_start, 1))
+        print(f"🟢 Brain ready (load {BRAIN_STATE['load_seconds']}s, warmup {BRAIN_STATE['warmup_seconds']}s)")
+    except Exception as e:
+        BRAIN_STATE.update(phase="failed", error=f"{type(e).__name__}: {e}")
+        print(f"❌ Brain failed to start: {e}")
+
+_loader_thread: Optional[threading.Thread] = None
+
+def start_background_loading():
+    """Starts `load_and_warm` on a daemon thread (once)."""
+    global _loader_thread
+    if _loader_thread is None:
+        _loader_thread = threading.Thread(target=load_and_warm, name="fab-model-loader", daemon=True)
+        _loader_thread.start()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_background_loading()
+    yield
+
+# Routes that must answer while the models are still loading
+STATUS_PATHS = {"/", "/health", "/ready", "/metrics", "/docs", "/openapi.json"}
+
+def require_ready(request: Request):
+    """Rejects model-backed requests with 503 + Retry-After until warmup has finished."""
+    if BRAIN_STATE["phase"] != "ready" and request.url.path not in STATUS_PATHS:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Brain is {BRAIN_STATE['phase']}",
+            headers={"Retry-After": "15"}
+        )
+
+
+#===============================================
+# STEP 4e: Metrics (Prometheus text format)
+#===============================================
+# Scrape GET /metrics. Request latency is measured from the first byte in to the last
+# byte out, so streamed responses count their full duration; comparing it with the
+# backend's own timings separates brain time from tunnel time.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+STEP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.series: Dict[tuple, Dict[str, Any]] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.setdefault(labels, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+class BrainMetrics:
+    """Request, batch and token counters, written from the event loop and the scheduler thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests: Dict[tuple, int] = {}
+        self.request_latency = Histogram(LATENCY_BUCKETS)
+        self.queue_wait = Histogram(STEP_BUCKETS)
+        self.ttft = Histogram(STEP_BUCKETS)
+        self.prefill = Histogram(STEP_BUCKETS)
+        self.decode = Histogram(LATENCY_BUCKETS)
+        self.batch_size = Histogram(tuple(range(1, MAX_BATCH_SIZE + 1)))
+        self.tokens = {"input": 0, "output": 0}
+        self.seconds = {"prefill": 0.0, "decode": 0.0}
+        self.last_decode_rate = 0.0
+
+    def observe_request(self, endpoint: str, method: str, status: int, seconds: float):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_latency.observe((endpoint,), seconds)
+
+    def observe_batch(self, batch: List[GenerationJob], started_at: float, prefill_s: float, decode_s: float):
+        output_tokens = sum(len(job.output_ids) - job.run_start for job in batch)
+        with self._lock:
+            self.prefill.observe((), prefill_s)
+            self.decode.observe((), decode_s)
+            self.batch_size.observe((), len(batch))
+            for job in batch:
+                if job.run_start:
+                    continue    # resumed after preemption: already observed on its first run
+                self.queue_wait.observe((job.priority,), max(0.0, started_at - job.enqueued_at))
+                if job.first_token_at:
+                    self.ttft.observe((job.priority,), job.first_token_at - job.enqueued_at)
+            # Resumed jobs prefill their earlier output again
+            self.tokens["input"] += sum(len(job.prompt_ids) + job.run_start for job in batch)
+            self.tokens["output"] += output_tokens
+            self.seconds["prefill"] += prefill_s
+            self.seconds["decode"] += decode_s
+            if decode_s > 0:
+                self.last_decode_rate = output_tokens / decode_s
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def label_str(names: tuple, values: tuple) -> str:
+            pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        def metric(name: str, kind: str, help_text: str, samples: List[tuple]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        def histogram(name: str, help_text: str, hist: Histogram, label_names: tuple = ()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for values, series in sorted(hist.series.items()):
+                cumulative = list(zip(hist.buckets, series["counts"])) + [("+Inf", series["count"])]
+                for bound, count in cumulative:
+                    lines.append(f"{name}_bucket{label_str(label_names + ('le',), values + (bound,))} {count}")
+                lines.append(f"{name}_sum{label_str(label_names, values)} {round(series['sum'], 6)}")
+                lines.append(f"{name}_count{label_str(label_names, values)} {series['count']}")
+
+        def ratio(hits: int, total: int) -> float:
+            return round(hits / total, 4) if total else 0.0
+
+        with self._lock:
+            metric("fab_brain_up", "gauge", "1 once models are loaded and warm.",
+                   [("", int(BRAIN_STATE["phase"] == "ready"))])
+            metric("fab_brain_requests_total", "counter", "HTTP requests by route, method and status.",
+                   [(label_str(("endpoint", "method", "status"), k), v) for k, v in sorted(self.requests.items())])
+            histogram("fab_brain_request_duration_seconds", "End-to-end request latency, including streamed bodies.",
+                      self.request_latency, ("endpoint",))
+            metric("fab_brain_in_flight_requests", "gauge", "HTTP requests currently being served.", [("", self.in_flight)])
+            metric("fab_brain_queue_depth", "gauge", "Generation jobs waiting for a batch, by priority class.",
+                   [(label_str(("priority",), (k,)), v) for k, v in scheduler.queue_depths().items()])
+            metric("fab_brain_running_jobs", "gauge", "Generation jobs in the batch being decoded.", [("", scheduler.running)])
+            metric("fab_brain_scheduler_jobs_total", "counter",
+                   "Jobs rejected with 429, dropped from the queue (disconnect/deadline) or preempted by more urgent work.",
+                   [(label_str(("event",), (k,)), scheduler.stats[k]) for k in ("rejected", "abandoned", "preempted")])
+            histogram("fab_brain_queue_wait_seconds", "Time a job waited before its first batch started.", self.queue_wait, ("priority",))
+            histogram("fab_brain_time_to_first_token_seconds", "Enqueue to first generated token.", self.ttft, ("priority",))
+            histogram("fab_brain_prefill_seconds", "Per-batch prompt prefill time (incl. prefix-cache builds).", self.prefill)
+            histogram("fab_brain_decode_seconds", "Per-batch decode time after the first token.", self.decode)
+            histogram("fab_brain_batch_size", "Jobs per generate call.", self.batch_size)
+            metric("fab_brain_tokens_total", "counter", "Prompt (input) and generated (output) tokens.",
+                   [(label_str(("direction",), (k,)), v) for k, v in self.tokens.items()])
+            metric("fab_brain_generation_seconds_total", "counter", "Time spent in prefill and decode.",
+                   [(label_str(("phase",), (k,)), round(v, 6)) for k, v in self.seconds.items()])
+            metric("fab_brain_decode_tokens_per_second", "gauge", "Output tokens/sec of the last batch.",
+                   [("", round(self.last_decode_rate, 2))])
+
+        metric("fab_brain_truncated_requests_total", "counter", "Prompts middle-elided to fit the context window.",
+               [("", token_budget.stats["truncated_requests"] if token_budget else 0)])
+        metric("fab_brain_json_decoding_total", "counter", "JSON decoding events (constrained jobs, early stops, parses...).",
+               [(label_str(("event",), (k,)), v) for k, v in JSON_DECODING_STATS.items()])
+        metric("fab_brain_json_parse_failure_ratio", "gauge", "Share of model outputs that failed to parse as JSON.",
+               [("", ratio(JSON_DECODING_STATS["parse_failures"], JSON_DECODING_STATS["parsed"] + JSON_DECODING_STATS["parse_failures"]))])
+
+        metric("fab_brain_speculative_total", "counter", "Speculative decoding: jobs, verify steps, draft tokens proposed and accepted.",
+               [(label_str(("event",), (k,)), v) for k, v in SPECULATIVE_STATS.items()])
+        metric("fab_brain_draft_acceptance_ratio", "gauge", "Accepted over proposed draft tokens since startup.",
+               [("", ratio(SPECULATIVE_STATS["accepted"], SPECULATIVE_STATS["proposed"]))])
+
+        response_stats = response_cache.stats
+        response_hits = response_stats["memory_hits"] + response_stats["disk_hits"]
+        metric("fab_brain_response_cache_total", "counter", "Response cache events.",
+               [(label_str(("event",), (k,)), v) for k, v in response_stats.items()])
+        metric("fab_brain_single_flight_total", "counter", "Generation jobs started (leaders) and identical requests merged into them.",
+               [(label_str(("event",), (k,)), v) for k, v in single_flight.stats.items()])
+        metric("fab_brain_prefix_cache_total", "counter", "Prefix KV cache events.",
+               [(label_str(("event",), (k,)), v) for k, v in prefix_cache.stats.items()])
+        metric("fab_brain_semantic_cache_total", "counter", "Semantic (near-duplicate) cache events.",
+               [(label_str(("event",), (k,)), v) for k, v in semantic_cache.stats.items()])
+        metric("fab_brain_question_bank_total", "counter", "Question bank events (retrieved vs generated questions, LLM fallbacks).",
+               [(label_str(("event",), (k,)), v) for k, v in question_bank.stats.items()])
+        metric("fab_brain_code_store_total", "counter", "Code embedding store events (chunks_embedded counts encoder work).",
+               [(label_str(("event",), (k,)), v) for k, v in code_store.stats.items()])
+        code_hits = code_store.stats["memory_hits"] + code_store.stats["disk_hits"]
+        metric("fab_brain_cache_hit_ratio", "gauge", "Hits over lookups since startup.", [
+            (label_str(("cache",), ("response",)), ratio(response_hits, response_hits + response_stats["misses"])),
+            (label_str(("cache",), ("semantic",)), ratio(semantic_cache.stats["hits"], semantic_cache.stats["hits"] + semantic_cache.stats["misses"])),
+            (label_str(("cache",), ("prefix",)), ratio(prefix_cache.stats["hits"], prefix_cache.stats["hits"] + prefix_cache.stats["misses"])),
+            (label_str(("cache",), ("code_store",)), ratio(code_hits, code_hits + code_store.stats["misses"])),
+        ])
+
+        memory = []
+        if DEVICE == "cuda":
+            memory += [
+                (label_str(("kind",), ("gpu_allocated",)), torch.cuda.memory_allocated()),
+                (label_str(("kind",), ("gpu_reserved",)), torch.cuda.memory_reserved()),
+                (label_str(("kind",), ("gpu_total",)), torch.cuda.get_device_properties(0).total_memory),
+            ]
+        try:
+            import psutil
+            memory.append((label_str(("kind",), ("process_rss",)), psutil.Process().memory_info().rss))
+        except ImportError:
+            import resource
+            memory.append((label_str(("kind",), ("process_max_rss",)), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024))
+        metric("fab_brain_memory_bytes", "gauge", "Accelerator and host memory use.", memory)
+        return "\n".join(lines) + "\n"
+
+metrics = BrainMetrics()
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request until its last body chunk is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            metrics.in_flight -= 1
+            route = scope.get("route")
+            metrics.observe_request(route.path if route else "unmatched", scope["method"], status[0], time.perf_counter() - start)
 
 
 #===============================================
 # STEP 5: FastAPI Server
 #===============================================
 
-app = FastAPI(title="FAB Dual-Brain Cloud Node")
+app = FastAPI(title="FAB Dual-Brain Cloud Node", lifespan=lifespan, dependencies=[Depends(require_ready)])
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(status_code=429, content={"detail": f"Brain overloaded: {exc}"},
+                        headers={"Retry-After": str(scheduler.retry_after())})
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_handler(request: Request, exc: DeadlineExceededError):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+@app.exception_handler(JobCancelledError)
+async def cancelled_handler(request: Request, exc: JobCancelledError):
+    # Nobody is listening any more; 499 (client closed request) only shows up in logs and metrics
+    return JSONResponse(status_code=499, content={"detail": str(exc)})
 
 class GenerateRequest(BaseModel):
     prompt: str
     system_prompt: str = ""
     max_tokens: int = 2048
     temperature: float = 0.3
+    json_schema: Optional[Dict[str, Any]] = None  # /generate-json only: {"type": ..., "required": [...]}
 
 class CodeAnalysisRequest(BaseModel):
     code: str
@@ -188,120 +2478,823 @@ class CodeAnalysisRequest(BaseModel):
 class ResumeAnalysisRequest(BaseModel):
     resume_text: str
     job_description: str = ""
+    mode: str = "hybrid"        # "hybrid" (rules + LLM for summary/highlights) or "llm" (whole resume through the LLM)
 
 @app.get("/")
 def root():
-    return {"status": "online", "model": LLM_ID, "features": ["llm", "sentence-bert"]}
+    return {
+        "status": "online",
+        "model": LLM_ID,
+        "device": DEVICE,
+        "dtype": CPU_DTYPE if DEVICE == "cpu" else "nf4",
+        "phase": BRAIN_STATE["phase"],
+        "decode_tokens_per_sec": BRAIN_STATE["decode_tokens_per_sec"],
+        "features": ["llm", "sentence-bert"] + (["speculative"] if draft_model is not None else [])
+    }
 
 @app.get("/health")
-def health():
-    return {"status": "healthy"}
+def health(response: Response):
+    """200 only once the models are loaded and warm, so callers can route on the status code."""
+    phase = BRAIN_STATE["phase"]
+    if phase == "ready":
+        return {"status": "healthy"}
+    response.status_code = 503
+    response.headers["Retry-After"] = "15"
+    return {"status": "failed" if phase == "failed" else "starting", "phase": phase, "error": BRAIN_STATE["error"]}
+
+@app.get("/ready")
+def ready(response: Response):
+    """Load phase, timings, device and memory; 503 until the node is warm."""
+    if BRAIN_STATE["phase"] != "ready":
+        response.status_code = 503
+    started = BRAIN_STATE["started_at"]
+    return {
+        **BRAIN_STATE,
+        "uptime_seconds": round(time.time() - started, 1) if started else None,
+        "model": LLM_ID,
+        "embedding_model": SENTENCE_MODEL_ID,
+        "dtype": CPU_DTYPE if DEVICE == "cpu" else "nf4",
+        "weights_dir": WEIGHTS_DIR,
+        "memory": memory_snapshot()
+    }
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus exposition of latency, token, queue, cache and memory metrics."""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/generate")
-def generate_endpoint(req: GenerateRequest):
+async def generate_endpoint(req: GenerateRequest, request: Request, response: Response):
+    async def run():
+        start = time.time()
+        job = submit_generation(req.prompt, req.system_prompt, req.max_tokens, req.temperature, deadline=request_deadline(request),
+                                speculative=use_speculative("generate"), priority=request_priority(request, "generate"))
+        res = await await_job(job, request)
+        return {"result": res, "truncated_tokens": job.dropped_tokens, "time_ms": round((time.time() - start)*1000), **speculation_fields(job)}
+
+    parts = (req.system_prompt, req.prompt, req.max_tokens, req.temperature)
+    return await serve_cached(response, "generate", parts, req.temperature, run, semantic_text=req.prompt)
+
+@app.post("/generate-stream")
+async def generate_stream_endpoint(req: GenerateRequest, request: Request):
+    """Streaming variant of /generate (text/event-stream)."""
     start = time.time()
-    res = generate_text(req.prompt, req.system_prompt, req.max_tokens, req.temperature)
-    return {"result": res, "time_ms": round((time.time() - start)*1000)}
+    job = submit_generation(req.prompt, req.system_prompt, req.max_tokens, req.temperature, deadline=request_deadline(request),
+                            speculative=use_speculative("generate-stream"), priority=request_priority(request, "generate-stream"))
+    return stream_job_events(job, start)
 
 @app.post("/generate-json")
-def generate_json_endpoint(req: GenerateRequest):
-    start = time.time()
-    prompt = req.prompt + "\n\nIMPORTANT: Return ONLY valid JSON."
-    res = generate_text(prompt, req.system_prompt, req.max_tokens, 0.2)
-    parsed = extract_json(res)
-    return {
-        "result": res, 
-        "parsed": parsed, 
-        "parse_error": parsed is None, 
-        "time_ms": round((time.time() - start)*1000)
-    }
+async def generate_json_endpoint(req: GenerateRequest, request: Request, response: Response):
+    async def run():
+        start = time.time()
+        prompt = req.prompt + "\n\nIMPORTANT: Return ONLY valid JSON."
+        job = submit_generation(prompt, req.system_prompt, req.max_tokens, 0.2, req.json_schema or {}, request_deadline(request),
+                                use_speculative("generate-json"), request_priority(request, "generate-json"))
+        res = await await_job(job, request)
+        parsed, repaired = parse_json_output(res, req.json_schema)
+        return {
+            "result": res, 
+            "parsed": parsed, 
+            "repaired": repaired,
+            "parse_error": not json_complete(parsed, repaired, req.json_schema), 
+            "truncated_tokens": job.dropped_tokens,
+            "time_ms": round((time.time() - start)*1000),
+            **speculation_fields(job)
+        }
+
+    # A failed or repaired parse is worth retrying, so only complete ones are cached
+    parts = (req.system_prompt, req.prompt, req.max_tokens, 0.2, req.json_schema)
+    return await serve_cached(response, "generate-json", parts, 0.2, run, lambda r: not r["parse_error"], req.prompt, constrained=True)
 
 @app.post("/evaluate-answer")
-def evaluate_answer(req: GenerateRequest):
+async def evaluate_answer(req: GenerateRequest, request: Request, response: Response):
     """Specialized endpoint for interview scoring."""
+    async def run():
+        start = time.time()
+        prompt = req.prompt + "\n\nProvide scores as JSON."
+        job = submit_generation(prompt, "You are a strict technical interviewer.", 1024, 0.2, EVALUATION_SCHEMA, request_deadline(request),
+                                use_speculative("evaluate-answer"), request_priority(request, "evaluate-answer"))
+        res = await await_job(job, request)
+        parsed, repaired = parse_json_output(res, EVALUATION_SCHEMA)
+        return {"result": res, "parsed": parsed, "repaired": repaired, "parse_error": not json_complete(parsed, repaired, EVALUATION_SCHEMA),
+                "truncated_tokens": job.dropped_tokens, "time_ms": round((time.time() - start)*1000), **speculation_fields(job)}
+
+    parts = ("You are a strict technical interviewer.", req.prompt, 1024, 0.2)
+    return await serve_cached(response, "evaluate-answer", parts, 0.2, run, lambda r: not r["parse_error"], constrained=True)
+
+@app.post("/evaluate-answer-stream")
+async def evaluate_answer_stream(req: GenerateRequest, request: Request):
+    """Streaming variant of /evaluate-answer; the final `done` event carries the parsed scores."""
     start = time.time()
     prompt = req.prompt + "\n\nProvide scores as JSON."
-    res = generate_text(prompt, "You are a strict technical interviewer.", 1024, 0.2)
-    parsed = extract_json(res)
-    return {"result": res, "parsed": parsed, "time_ms": round((time.time() - start)*1000)}
+    job = submit_generation(prompt, "You are a strict technical interviewer.", 1024, 0.2, EVALUATION_SCHEMA, request_deadline(request),
+                            use_speculative("evaluate-answer"), request_priority(request, "evaluate-answer-stream"))
+    return stream_job_events(job, start, EVALUATION_SCHEMA)
 
 @app.post("/analyze-code")
-def analyze_code(req: CodeAnalysisRequest):
+async def analyze_code(req: CodeAnalysisRequest, request: Request, response: Response):
     """Deep code analysis using hybrid embeddings + LLM reasoning."""
+    async def run():
+        start = time.time()
+        job = submit_generation(f"Analyze this code:\n{req.code}", "You are a senior staff engineer.", 1024, 0.2, deadline=request_deadline(request),
+                                speculative=use_speculative("analyze-code"), priority=request_priority(request, "analyze-code"))
+        emb = await run_in_threadpool(get_code_embedding, req.code)
+        analysis = await await_job(job, request)
+        
+        return {
+            "analysis": analysis,
+            "embedding_preview": emb[:5],
+            "truncated_tokens": job.dropped_tokens,
+            "time_ms": round((time.time() - start)*1000),
+            **speculation_fields(job)
+        }
+
+    return await serve_cached(response, "analyze-code", (req.language, req.code, 1024, 0.2), 0.2, run, semantic_text=req.code)
+
+PROJECT_CONTEXT_CHARS = int(os.environ.get("FAB_BRAIN_PROJECT_CONTEXT_CHARS", "6000"))
+PROJECT_MAX_CHUNKS_PER_FILE = 2
+PROJECT_TYPES = ("Web App", "CLI", "Library", "API", "Other")
+
+class CoreFile(BaseModel):
+    path: str
+    content: str
+
+class ProjectInput(BaseModel):
+    name: str = ""
+    description: str = ""
+    readme: str = ""
+    languages: Dict[str, int] = {}      # GitHub /languages: bytes per language
+    file_tree: List[str] = []
+    core_files: List[CoreFile] = []
+
+class ProjectAnalysisRequest(ProjectInput):
+    projects: List[ProjectInput] = []   # several repositories in one call
+    # Older backends send a pre-built prompt; it is treated as the project description
+    prompt: str = ""
+    system_prompt: str = ""
+    max_tokens: int = 1024
+
+def rank_project_chunks(projects: List[ProjectInput]) -> List[List[str]]:
+    """
+    Picks each project's most informative code chunks within PROJECT_CONTEXT_CHARS.
+
+    Chunk vectors come from the code store, so only files whose content changed since
+    the last analysis are embedded (all of them in one batched pass). Chunks are scored
+    against a probe built from the project's own name and description plus what an
+    architecture review looks for. At most PROJECT_MAX_CHUNKS_PER_FILE non-overlapping
+    chunks per file keep one huge file from crowding out the rest.
+    """
+    files = [f for project in projects for f in project.core_files]
+    if not files:
+        return [[] for _ in projects]
+    records = iter(embed_code_files([(f.content, None) for f in files]))
+    probes = encode_texts([f"{p.name}: {p.description}. Core application logic, architecture, entry points, data models, API routes, algorithms."
+                           for p in projects], normalize=True)
+
+    selected = []
+    for project_index, project in enumerate(projects):
+        chunks = []
+        for f in project.core_files:
+            record = next(records)
+            chunks += [(f, span, vector) for span, vector in zip(record["spans"], record["vectors"])]
+        if not chunks:
+            selected.append([])
+            continue
+        scores = np.stack([vector for _, _, vector in chunks]) @ probes[project_index]
+        picked, taken, used = [], {}, 0
+        for i in np.argsort(-scores):
+            f, (start, end, _), _ = chunks[i]
+            text = f"# {f.path}\n{f.content[start:end]}"
+            spans = taken.setdefault(f.path, [])
+            if len(spans) >= PROJECT_MAX_CHUNKS_PER_FILE or used + len(text) > PROJECT_CONTEXT_CHARS \
+                    or any(start < e and s < end for s, e in spans):
+                continue
+            spans.append((start, end))
+            used += len(text)
+            picked.append(text)
+        selected.append(picked)
+    return selected
+
+def build_project_prompt(project: ProjectInput, chunks: List[str]) -> str:
+    total = sum(project.languages.values()) or 1
+    languages = ", ".join(f"{lang} {round(100 * size / total)}%" for lang, size in
+                          sorted(project.languages.items(), key=lambda kv: -kv[1])[:8])
+    sections = [
+        f"Project: {project.name}",
+        f"Description: {project.description}",
+        f"Languages: {languages or 'unknown'}",
+    ]
+    if project.file_tree:
+        sections.append("File tree:\n" + "\n".join(project.file_tree[:80]))
+    if project.readme:
+        sections.append("README (excerpt):\n" + project.readme[:1500])
+    if chunks:
+        sections.append("Most informative code:\n" + "\n\n".join(chunks))
+    return "\n\n".join(sections)
+
+def normalize_project_analysis(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerces the model's JSON into the value sets GitHubAnalyzer accepts."""
+    complexity = str(parsed.get("complexity", "")).upper()
+    project_type = str(parsed.get("projectType", "Other"))
+    project_type = next((t for t in PROJECT_TYPES if t.lower() == project_type.lower()), "Other")
+    skills = parsed.get("learnedSkills")
+    return {
+        "complexity": complexity if complexity in ("BASIC", "INTERMEDIATE", "ADVANCED") else "INTERMEDIATE",
+        "architecture": str(parsed.get("architecture") or "Unknown"),
+        "learnedSkills": [str(s) for s in skills if s][:15] if isinstance(skills, list) else [],
+        "projectType": project_type,
+        "realWorldUtility": str(parsed.get("realWorldUtility") or "Personal Project")
+    }
+
+@app.post("/analyze-project")
+async def analyze_project(req: ProjectAnalysisRequest, request: Request):
+    """
+    Structured repository analysis (complexity, architecture, learnedSkills, projectType,
+    realWorldUtility) for GitHubAnalyzer.analyzeProjectsDeep.
+
+    Core files are chunked and ranked with Sentence-BERT so only the most informative
+    excerpts reach the LLM. Send `projects` to analyze several repositories at once: their
+    chunks share one embedding pass and their prompts one batched generate. A single
+    project answers with `analysis`; a list answers with `results` in order.
+    """
     start = time.time()
-    emb = get_code_embedding(req.code)
-    
-    analysis = generate_text(f"Analyze this code:\n{req.code}", "You are a senior staff engineer.", 1024, 0.2)
-    
+    projects = req.projects or [ProjectInput(
+        name=req.name, description=req.description or req.prompt, readme=req.readme,
+        languages=req.languages, file_tree=req.file_tree, core_files=req.core_files
+    )]
+    chunk_lists = await run_in_threadpool(rank_project_chunks, projects)
+    deadline = request_deadline(request)
+    priority = request_priority(request, "analyze-project")
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(projects)
+    jobs, submitted = [], []
+    for index, (project, chunks) in enumerate(zip(projects, chunk_lists)):
+        prompt = build_project_prompt(project, chunks)
+        ranked_files = list(dict.fromkeys(chunk.split("\n", 1)[0][2:] for chunk in chunks))
+        key = response_cache.key_for("analyze-project", PROJECT_ANALYST_PROMPT, prompt, req.max_tokens, 0.2)
+        _, payload = await run_in_threadpool(response_cache.get, key)
+        if payload is not None:
+            results[index] = {**payload, "cached": True}
+            continue
+        try:
+            jobs.append(submit_generation(prompt, PROJECT_ANALYST_PROMPT, req.max_tokens, 0.2, PROJECT_SCHEMA, deadline, priority=priority))
+            submitted.append((index, key, ranked_files))
+        except QueueFullError as e:
+            results[index] = {"name": project.name, "analysis": None, "error": f"Brain overloaded: {e}"}
+
+    for (index, key, ranked_files), outcome in zip(submitted, await await_jobs(jobs, request)):
+        name = projects[index].name
+        if isinstance(outcome, Exception):
+            results[index] = {"name": name, "analysis": None, "error": f"{type(outcome).__name__}: {outcome}"}
+            continue
+        parsed, repaired = parse_json_output(outcome, PROJECT_SCHEMA)
+        if not isinstance(parsed, dict):
+            results[index] = {"name": name, "analysis": None, "error": "Unparseable analysis", "raw": outcome}
+            continue
+        if not json_complete(parsed, repaired, PROJECT_SCHEMA):
+            # Defaults would paper over the missing fields, so a truncated analysis is an error
+            results[index] = {"name": name, "analysis": None, "error": "Incomplete analysis", "raw": outcome}
+            continue
+        payload = {"name": name, "analysis": normalize_project_analysis(parsed), "ranked_files": ranked_files}
+        await run_in_threadpool(response_cache.put, key, "analyze-project", payload)
+        results[index] = {**payload, "cached": False}
+
+    if req.projects:
+        return {"results": results, "time_ms": round((time.time() - start)*1000)}
+    if results[0].get("error"):
+        # A single caller falls back to its own heuristics on an HTTP error
+        raise HTTPException(status_code=502, detail=results[0]["error"])
+    return {**results[0], "time_ms": round((time.time() - start)*1000)}
+
+# Mirrors SKILL_PATTERNS in backend/src/modules/resume/parser.ts, so rules and regex fallback agree on
+# what a skill is. Boundaries also work around "c++"/"c#"; "Go" and "R" only count when capitalized.
+RESUME_SKILL_PATTERNS = {
+    "languages": re.compile(r"(?<![\w+#])(python|javascript|typescript|java|c\+\+|c#|ruby|golang|rust|php|swift|kotlin|scala|perl|lua|matlab|dart)(?![\w+#])", re.I),
+    "frameworks": re.compile(r"(?<![\w+#])(react native|react|angular|vue|svelte|next\.?js|express|django|flask|fastapi|spring|laravel|rails|flutter|electron)(?![\w+#])", re.I),
+    "tools": re.compile(r"(?<![\w+#])(docker|kubernetes|aws|gcp|azure|git|jenkins|circleci|terraform|ansible|prometheus|grafana|redis|mongodb|postgresql|mysql)(?![\w+#])", re.I),
+    "concepts": re.compile(r"(?<![\w+#])(rest api|graphql|microservices|ci/cd|agile|scrum|tdd|oop|functional programming|system design|data structures|algorithms)(?![\w+#])", re.I),
+}
+RESUME_CASED_LANGUAGES = re.compile(r"(?<![\w+#])(Go|R)(?![\w+#])")
+RESUME_SKILL_ALIASES = {"golang": "go", "nextjs": "next.js"}
+
+RESUME_SECTIONS = {
+    "summary": ("summary", "professional summary", "profile", "objective", "about me"),
+    "experience": ("experience", "work experience", "professional experience", "employment", "employment history", "work history"),
+    "projects": ("projects", "personal projects", "academic projects", "key projects"),
+    "education": ("education", "academics"),
+    "skills": ("skills", "technical skills", "core skills"),
+    "certifications": ("certifications", "certificates", "licenses & certifications"),
+}
+_RESUME_HEADINGS = {alias: section for section, aliases in RESUME_SECTIONS.items() for alias in aliases}
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?\s*'?\d{2,4}"
+_DATE = rf"(?:{_MONTH}|\d{{1,2}}/\d{{4}}|(?:19|20)\d{{2}})"
+RESUME_DATE_RANGE_RE = re.compile(rf"({_DATE})\s*(?:-|–|—|to)\s*({_DATE}|present|current|now|today)", re.I)
+RESUME_ROLE_RE = re.compile(r"\b(engineer|developer|intern|manager|analyst|lead|architect|consultant|scientist|designer|administrator|specialist|director|programmer|founder|officer|head)\b", re.I)
+RESUME_DEGREE_RE = re.compile(r"\b(b\.?\s?tech|m\.?\s?tech|b\.?\s?e\b|b\.?\s?sc|m\.?\s?sc|bca|mca|mba|ph\.?\s?d|bachelor|master|diploma|associate)[^|,\n]*", re.I)
+RESUME_INSTITUTION_RE = re.compile(r"[^|,\n]*\b(university|college|institute|school|academy|iit|nit)\b[^|,\n]*", re.I)
+RESUME_CERTIFICATION_RE = re.compile(r"\b(?:aws|google|azure|microsoft|oracle|cisco|kubernetes|comptia)\b(?:[ \t]+[\w&+/-]+){0,3}?[ \t]+certified(?:[ \t]+[\w&+/-]+){0,3}", re.I)
+_BULLET_RE = re.compile(r"^\s*[-•*▪●◦‣–·]\s*")
+_SPLIT_RE = re.compile(r"\s*(?:\||•|·|–|—|\s-\s|,|\bat\b|@)\s*")
+
+def resume_skills(text: str) -> Dict[str, List[str]]:
+    """Dictionary skill matches per category, lowercased and de-duplicated in order of appearance."""
+    found = {}
+    for category, pattern in RESUME_SKILL_PATTERNS.items():
+        skills = [RESUME_SKILL_ALIASES.get(m.lower(), m.lower()) for m in pattern.findall(text)]
+        if category == "languages":
+            skills += [m.lower() for m in RESUME_CASED_LANGUAGES.findall(text)]
+        found[category] = list(dict.fromkeys(skills))
+    return found
+
+def resume_sections(text: str) -> Dict[str, List[str]]:
+    """Lines under each recognized heading; text before the first heading goes to "header"."""
+    sections: Dict[str, List[str]] = {"header": []}
+    current = "header"
+    for line in text.splitlines():
+        heading = re.sub(r"[^a-z& ]", "", line.lower()).strip()
+        if heading in _RESUME_HEADINGS and len(line.strip()) < 40:
+            current = _RESUME_HEADINGS[heading]
+            sections.setdefault(current, [])
+            continue
+        if line.strip():
+            sections.setdefault(current, []).append(line.rstrip())
+    return sections
+
+def resume_experience(lines: List[str]) -> List[Dict[str, Any]]:
+    """
+    Role entries from the experience section: a line with a date range starts an entry,
+    its other parts (or the line above) give the role and company, bullets below are kept.
+    """
+    entries, previous = [], None
+    for line in lines:
+        dates = RESUME_DATE_RANGE_RE.search(line)
+        if dates and not _BULLET_RE.match(line):
+            parts = [p for p in _SPLIT_RE.split(line[:dates.start()] + " " + line[dates.end():]) if p.strip(" ()")]
+            if previous and len(parts) < 2:
+                parts = [p for p in _SPLIT_RE.split(previous) if p.strip()] + parts
+            role = next((p for p in parts if RESUME_ROLE_RE.search(p)), "")
+            company = next((p for p in parts if p != role), "")
+            entries.append({"company": company.strip(" ()"), "role": role.strip(" ()"), "duration": dates.group(0), "highlights": []})
+            previous = None
+        elif entries and _BULLET_RE.match(line):
+            entries[-1]["highlights"].append(_BULLET_RE.sub("", line).strip()[:200])
+        else:
+            previous = line
+    for entry in entries:
+        entry["highlights"] = entry["highlights"][:5]
+    return entries
+
+def resume_education(lines: List[str]) -> List[Dict[str, str]]:
+    entries: List[Dict[str, str]] = []
+    for line in lines:
+        degree, institution = RESUME_DEGREE_RE.search(line), RESUME_INSTITUTION_RE.search(line)
+        year = re.findall(r"(?:19|20)\d{2}", line)
+        if degree or institution:
+            if not entries or (degree and entries[-1]["degree"]) or (institution and entries[-1]["institution"]):
+                entries.append({"degree": "", "institution": "", "year": ""})
+            if degree and not entries[-1]["degree"]:
+                entries[-1]["degree"] = degree.group(0).strip()
+            if institution and not entries[-1]["institution"]:
+                entries[-1]["institution"] = institution.group(0).strip()
+        if year and entries and not entries[-1]["year"]:
+            entries[-1]["year"] = year[-1]
+    return entries
+
+def resume_projects(lines: List[str]) -> List[Dict[str, Any]]:
+    """A non-bullet line opens a project; its bullets are the description, its skills the tech."""
+    projects = []
+    for line in lines:
+        if not _BULLET_RE.match(line) and len(line.strip()) <= 100 and (not projects or projects[-1]["description"]):
+            name = re.split(r"\s*(?:\||–|—|\s-\s|:)\s*", re.sub(r"\(.*?\)|\[.*?\]", "", line).strip())[0]
+            projects.append({"name": name, "tech": [], "description": "", "_text": line})
+        elif projects:
+            sep = " " if projects[-1]["description"] else ""
+            projects[-1]["description"] = (projects[-1]["description"] + sep + _BULLET_RE.sub("", line).strip())[:400]
+            projects[-1]["_text"] += "\n" + line
+    for project in projects:
+        project["tech"] = [skill for skills in resume_skills(project.pop("_text")).values() for skill in skills]
+    return [p for p in projects if p["name"]]
+
+def extract_resume_facts(text: str) -> Dict[str, Any]:
+    """
+    Deterministic pre-extraction for /analyze-resume.
+
+    Skills come from the whole text; experience, projects, education and certifications
+    need line breaks and recognizable headings (a resume flattened to one line still gets
+    its skills and certifications, and the LLM fills the rest).
+    """
+    sections = resume_sections(text)
+    certifications = [_BULLET_RE.sub("", line).strip() for line in sections.get("certifications", [])]
+    certifications += [m.group(0).strip() for m in RESUME_CERTIFICATION_RE.finditer(text)
+                       if not any(m.group(0).strip().lower() in c.lower() for c in certifications)]
+    summary_lines = [_BULLET_RE.sub("", line).strip() for line in sections.get("summary", [])]
     return {
-        "analysis": analysis,
-        "embedding_preview": emb[:5],
-        "time_ms": round((time.time() - start)*1000)
+        **resume_skills(text),
+        "summary": " ".join(summary_lines)[:400],
+        "experience": resume_experience(sections.get("experience", [])),
+        "projects": resume_projects(sections.get("projects", [])),
+        "education": resume_education(sections.get("education", [])),
+        "certifications": list(dict.fromkeys(certifications))[:15],
+        "_sections": sections
     }
 
+def resume_narrative_request(facts: Dict[str, Any], text: str) -> Optional[tuple]:
+    """
+    The LLM's share of a resume: `(prompt, schema, max_tokens, roles_needing_highlights)`,
+    or None when the rules found everything.
+
+    Asks for the summary when the resume has none, highlights for roles without bullets, and
+    the whole experience list only when no role could be parsed from the text.
+    """
+    fields, needs_highlights = [], [i for i, e in enumerate(facts["experience"]) if not e["highlights"]]
+    if not facts["summary"]:
+        fields.append("summary")
+    if needs_highlights:
+        fields.append("highlights")
+    if not facts["experience"]:
+        fields.append("experience")
+    if not fields:
+        return None
+
+    sections = facts["_sections"]
+    excerpt_lines = sections.get("summary", []) + sections.get("experience", []) or sections.get("header", [])
+    excerpt = "\n".join(excerpt_lines)[:2500] if excerpt_lines else text[:2500]
+    skills = ", ".join(s for category in ("languages", "frameworks", "tools") for s in facts[category][:6])
+    known = [f"Skills: {skills or 'none found'}"]
+    shape = {}
+    if "summary" in fields:
+        shape["summary"] = "One-line professional summary"
+    if "highlights" in fields:
+        known.append("Roles needing highlights:\n" + "\n".join(
+            f"{n + 1}. {facts['experience'][i]['role']} at {facts['experience'][i]['company']} ({facts['experience'][i]['duration']})"
+            for n, i in enumerate(needs_highlights)))
+        shape["highlights"] = [["Built ...", "Led ..."]]
+    if "experience" in fields:
+        shape["experience"] = [{"company": "Name", "role": "Title", "duration": "Dates", "highlights": ["..."]}]
+
+    prompt = "\n\n".join(known + [f"RESUME EXCERPT:\n{excerpt}", f"Return JSON with exactly these keys:\n{json.dumps(shape)}"])
+    max_tokens = min(768, 96 + 112 * len(needs_highlights) + (384 if "experience" in fields else 0))
+    return prompt, {"type": "object", "required": list(shape)}, max_tokens, needs_highlights
+
+def merge_resume_narrative(facts: Dict[str, Any], needs_highlights: List[int], parsed: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """RESUME_SCHEMA-shaped analysis from the rule facts plus whatever the LLM returned."""
+    analysis = {k: v for k, v in facts.items() if not k.startswith("_")}
+    parsed = parsed if isinstance(parsed, dict) else {}
+    if not analysis["summary"]:
+        analysis["summary"] = str(parsed.get("summary") or "")
+    highlights = parsed.get("highlights") if isinstance(parsed.get("highlights"), list) else []
+    for index, bullets in zip(needs_highlights, highlights):
+        if isinstance(bullets, list):
+            analysis["experience"][index]["highlights"] = [str(b) for b in bullets if b][:5]
+    if not analysis["experience"] and isinstance(parsed.get("experience"), list):
+        analysis["experience"] = [e for e in parsed["experience"] if isinstance(e, dict)]
+    return analysis
+
 @app.post("/analyze-resume")
-def analyze_resume(req: ResumeAnalysisRequest):
-    """Specialized Resume Parsing endpoint."""
+async def analyze_resume(req: ResumeAnalysisRequest, request: Request, response: Response):
+    """
+    Specialized Resume Parsing endpoint.
+
+    In hybrid mode (the default) skills, sections, dates, companies, education and
+    certifications come from rules and a skill dictionary; the LLM only writes the summary
+    and experience highlights the resume does not already spell out, often nothing at all.
+    Results are cached by resume content. mode="llm" runs the whole resume through the LLM.
+    """
+    if req.mode == "llm":
+        async def run():
+            start = time.time()
+            
+            prompt = f"RESUME TEXT:\n{req.resume_text[:4000]}\n\nExtract JSON:"
+            job = submit_generation(prompt, RESUME_EXTRACTOR_PROMPT, 2048, 0.2, RESUME_SCHEMA, request_deadline(request),
+                                    use_speculative("analyze-resume"), request_priority(request, "analyze-resume"))
+            res = await await_job(job, request)
+            parsed, repaired = parse_json_output(res, RESUME_SCHEMA)
+            
+            return {
+                "analysis": parsed,
+                "parse_error": not json_complete(parsed, repaired, RESUME_SCHEMA),
+                "raw": res,
+                "generated_tokens": len(job.output_ids),
+                "time_ms": round((time.time() - start)*1000),
+                **speculation_fields(job)
+            }
+
+        parts = (RESUME_EXTRACTOR_PROMPT, req.resume_text[:4000], 2048, 0.2)
+        return await serve_cached(response, "analyze-resume", parts, 0.2, run, lambda r: not r["parse_error"], parts[1], constrained=True)
+
+    async def run_hybrid():
+        start = time.time()
+        facts = extract_resume_facts(req.resume_text)
+        narrative = resume_narrative_request(facts, req.resume_text)
+        if narrative is None:
+            return {"analysis": merge_resume_narrative(facts, [], None), "parse_error": False, "raw": "", "generated_tokens": 0,
+                    "llm_fields": [], "time_ms": round((time.time() - start)*1000)}
+
+        prompt, schema, max_tokens, needs_highlights = narrative
+        job = submit_generation(prompt, RESUME_NARRATIVE_PROMPT, max_tokens, 0.2, schema, request_deadline(request),
+                                use_speculative("analyze-resume"), request_priority(request, "analyze-resume"))
+        res = await await_job(job, request)
+        parsed, repaired = parse_json_output(res, schema)
+        return {
+            "analysis": merge_resume_narrative(facts, needs_highlights, parsed),
+            "parse_error": not json_complete(parsed, repaired, schema),
+            "raw": res,
+            "generated_tokens": len(job.output_ids),
+            "llm_fields": schema["required"],
+            "time_ms": round((time.time() - start)*1000),
+            **speculation_fields(job)
+        }
+
+    parts = (RESUME_NARRATIVE_PROMPT, req.resume_text, 0.2)
+    return await serve_cached(response, "analyze-resume-hybrid", parts, 0.2, run_hybrid, lambda r: not r["parse_error"], parts[1], constrained=True)
+
+BATCH_EVALUATE_MAX_ITEMS = int(os.environ.get("FAB_BRAIN_BATCH_EVALUATE_MAX_ITEMS", "64"))
+
+class AnswerItem(BaseModel):
+    question: str
+    answer: str
+    expectedPoints: List[str] = []
+    context: str = ""
+
+class BatchEvaluateRequest(BaseModel):
+    items: List[AnswerItem]
+    max_tokens: int = 512
+
+@app.post("/batch/evaluate-answers")
+async def batch_evaluate_answers(req: BatchEvaluateRequest, request: Request):
+    """
+    Scores many answers in one round trip with the interviewer persona; RemoteProvider.evaluateAnswer
+    sends its single answers here as one-item batches.
+
+    Cached items are answered directly; the rest are submitted one scheduler batch at a
+    time, so each wave is a single batched generate sharing the persona's prefix KV and
+    a long re-score never fills the queue ahead of live interviews. Results come back in
+    input order, each with `ok` and either `evaluation` or `error`.
+    """
     start = time.time()
-    
-    system_prompt = """You are an expert HR Data Extractor. 
-    Extract details from the resume into this JSON structure:
-    {
-        "languages": ["python", "java"],
-        "frameworks": ["react"],
-        "tools": ["git"],
-        "concepts": ["agile"],
-        "summary": "Professional summary...",
-        "experience": [{"company": "Name", "role": "Title", "duration": "Dates", "highlights": ["..."]}],
-        "projects": [{"name": "Title", "tech": ["stack"], "description": "..."}]
+    if len(req.items) > BATCH_EVALUATE_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_EVALUATE_MAX_ITEMS} items per request")
+
+    deadline = request_deadline(request)
+    priority = request_priority(request, "batch/evaluate-answers")
+    results: List[Optional[Dict[str, Any]]] = [None] * len(req.items)
+    pending = []
+    for index, item in enumerate(req.items):
+        prompt = EVALUATOR_PERSONA_TEMPLATE.format(question=item.question, context=item.context,
+                                                   expected_points=", ".join(item.expectedPoints), answer=item.answer)
+        key = response_cache.key_for("batch/evaluate-answers", EVALUATOR_PERSONA_PROMPT, prompt, req.max_tokens, 0.2)
+        _, payload = await run_in_threadpool(response_cache.get, key)
+        if payload is not None:
+            results[index] = {"index": index, "ok": True, "evaluation": payload["evaluation"], "cached": True}
+        else:
+            pending.append((index, prompt, key))
+
+    wave_size = scheduler.max_batch_size
+    for offset in range(0, len(pending), wave_size):
+        wave = pending[offset:offset + wave_size]
+        jobs, submitted = [], []
+        for index, prompt, key in wave:
+            try:
+                jobs.append(submit_generation(prompt, EVALUATOR_PERSONA_PROMPT, req.max_tokens, 0.2, PERSONA_EVALUATION_SCHEMA, deadline, priority=priority))
+                submitted.append((index, key))
+            except QueueFullError as e:
+                results[index] = {"index": index, "ok": False, "error": f"Brain overloaded: {e}"}
+        for (index, key), outcome in zip(submitted, await await_jobs(jobs, request)):
+            if isinstance(outcome, Exception):
+                results[index] = {"index": index, "ok": False, "error": f"{type(outcome).__name__}: {outcome}"}
+                continue
+            parsed, repaired = parse_json_output(outcome, PERSONA_EVALUATION_SCHEMA)
+            if parsed is None:
+                results[index] = {"index": index, "ok": False, "error": "Unparseable evaluation", "raw": outcome}
+                continue
+            if not json_complete(parsed, repaired, PERSONA_EVALUATION_SCHEMA):
+                results[index] = {"index": index, "ok": False, "error": "Incomplete evaluation", "evaluation": parsed, "raw": outcome}
+                continue
+            await run_in_threadpool(response_cache.put, key, "batch/evaluate-answers", {"evaluation": parsed})
+            results[index] = {"index": index, "ok": True, "evaluation": parsed, "cached": False}
+
+    return {
+        "results": results,
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "time_ms": round((time.time() - start)*1000)
     }
-    Return ONLY valid JSON. If data is missing, use empty arrays."""
-    
-    prompt = f"RESUME TEXT:\n{req.resume_text[:4000]}\n\nExtract JSON:"
-    res = generate_text(prompt, system_prompt, 2048, 0.2)
-    parsed = extract_json(res)
-    
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+    kind: str = "text"          # "code" returns pooled file vectors from the code store (always normalized)
+    batch_size: int = EMBED_BATCH_SIZE
+    normalize: bool = True
+    dtype: str = "float16"      # "float16" or "float32"
+    encoding: str = "base64"    # "base64" (JSON body) or "binary" (raw octet-stream)
+
+@app.post("/embed")
+def embed(req: EmbedRequest):
+    """
+    Batched SentenceBERT embeddings.
+
+    Vectors are packed row-major, little-endian, as `count x dim` values of `dtype`.
+    With encoding="base64" they come back in the `data` field; with "binary" the body
+    is the raw buffer and the shape travels in X-Embedding-* headers.
+    """
+    start = time.time()
+    if len(req.texts) > EMBED_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {EMBED_MAX_TEXTS} texts per request")
+    if req.dtype not in ("float16", "float32"):
+        raise HTTPException(status_code=400, detail="dtype must be float16 or float32")
+
+    if req.kind == "code":
+        vectors = np.stack([r["vector"] for r in embed_code_files([(t, None) for t in req.texts])]) if req.texts else encode_texts([])
+    else:
+        vectors = encode_texts(req.texts, max(1, req.batch_size), req.normalize)
+    packed = vectors.astype("<f2" if req.dtype == "float16" else "<f4").tobytes()
+    count, dim = vectors.shape[0], sentence_model.get_sentence_embedding_dimension()
+
+    if req.encoding == "binary":
+        return Response(content=packed, media_type="application/octet-stream", headers={
+            "X-Embedding-Count": str(count),
+            "X-Embedding-Dim": str(dim),
+            "X-Embedding-Dtype": req.dtype,
+            "X-Embedding-Model": SENTENCE_MODEL_ID
+        })
     return {
-        "analysis": parsed,
-        "raw": res,
+        "model": SENTENCE_MODEL_ID,
+        "count": count,
+        "dim": dim,
+        "dtype": req.dtype,
+        "normalized": req.normalize or req.kind == "code",
+        "data": base64.b64encode(packed).decode("ascii"),
+        "time_ms": round((time.time() - start)*1000)
+    }
+
+class CodeFile(BaseModel):
+    path: str = ""
+    content: Optional[str] = None
+    sha: Optional[str] = None   # git blob SHA; enough on its own when the brain already has the blob
+
+class EmbedCodeRequest(BaseModel):
+    files: List[CodeFile]
+    include_chunks: bool = False
+    dtype: str = "float16"      # "float16" or "float32"
+
+@app.post("/embed-code")
+def embed_code(req: EmbedCodeRequest):
+    """
+    File- and repository-level code embeddings backed by the content-addressed code store.
+
+    Files are chunked into overlapping token windows, embedded in one batch and pooled
+    per file (weighted by tokens) and per repository (weighted by file size). Blobs seen
+    before cost no embedding compute. `data` packs one normalized row per file like
+    /embed; files sent as a bare `sha` the store does not know are listed in `missing`
+    (zero rows) so the caller can resend them with content.
+    """
+    start = time.time()
+    if len(req.files) > EMBED_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {EMBED_MAX_TEXTS} files per request")
+    if req.dtype not in ("float16", "float32"):
+        raise HTTPException(status_code=400, detail="dtype must be float16 or float32")
+    if any(f.content is None and not f.sha for f in req.files):
+        raise HTTPException(status_code=400, detail="Every file needs content or a sha")
+
+    records = embed_code_files([(f.content, f.sha) for f in req.files])
+    dim = sentence_model.get_sentence_embedding_dimension()
+    vectors = np.stack([r["vector"] if r else np.zeros(dim, dtype=np.float32) for r in records]) if records else np.zeros((0, dim), dtype=np.float32)
+    present = [r for r in records if r]
+    repo_vector = pool_vectors(np.stack([r["vector"] for r in present]), [r["tokens"] for r in present]) if present else np.zeros(dim, dtype=np.float32)
+    dtype = "<f2" if req.dtype == "float16" else "<f4"
+
+    files = []
+    for f, r in zip(req.files, records):
+        entry = {"path": f.path, "sha": r["sha"] if r else f.sha, "missing": r is None}
+        if r:
+            entry.update({"chunks": len(r["spans"]), "tokens": r["tokens"], "cached": r["cached"]})
+            if req.include_chunks:
+                entry["chunk_spans"] = [[s, e] for s, e, _ in r["spans"]]
+                entry["chunk_data"] = base64.b64encode(r["vectors"].astype(dtype).tobytes()).decode("ascii")
+        files.append(entry)
+    return {
+        "model": SENTENCE_MODEL_ID,
+        "dim": dim,
+        "dtype": req.dtype,
+        "files": files,
+        "missing": [f["sha"] for f in files if f["missing"]],
+        "reused": sum(1 for r in present if r["cached"]),
+        "computed": sum(1 for r in present if not r["cached"]),
+        "data": base64.b64encode(vectors.astype(dtype).tobytes()).decode("ascii"),
+        "repo": base64.b64encode(repo_vector.astype(dtype).tobytes()).decode("ascii"),
         "time_ms": round((time.time() - start)*1000)
     }
 
+class BankQuestion(BaseModel):
+    text: str
+    type: str = "TECHNICAL"
+    difficulty: str = "MEDIUM"
+    context: str = ""
+    expectedPoints: List[str] = []
+    skills: List[str] = []      # defaults to the topic after ":" in `context` ("Technical: React")
+    source: str = "bank"
+
+class QuestionIndexRequest(BaseModel):
+    questions: List[BankQuestion]
+
 class QuestionRequest(BaseModel):
     skills: List[str]
     projects: List[dict] = []
     count: int = 3
+    exclude: List[str] = []     # the session's questionHistory texts
+    difficulty: Optional[str] = None
+
+def bank_entry(question: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalizes a question from any source into the shape the bank stores and serves."""
+    context = str(question.get("context") or "")
+    skills = [str(s) for s in question.get("skills") or [] if s] or ([context.split(":", 1)[1].strip()] if ":" in context else [])
+    return {
+        "text": str(question.get("text", "")).strip(),
+        "type": str(question.get("type") or "TECHNICAL").upper(),
+        "difficulty": str(question.get("difficulty") or "MEDIUM").upper(),
+        "context": context,
+        "expectedPoints": [str(p) for p in question.get("expectedPoints") or []],
+        "skills": skills,
+        "source": str(question.get("source") or "bank")
+    }
+
+@app.post("/questions/index")
+def index_questions(req: QuestionIndexRequest):
+    """Adds questions (curated bank, scraped, imported) to the retrieval index; known texts are skipped."""
+    start = time.time()
+    added = question_bank.add([bank_entry(q.model_dump()) for q in req.questions])
+    return {"added": added, "bank_size": len(question_bank), "time_ms": round((time.time() - start)*1000)}
 
 @app.post("/generate-questions")
-def generate_questions(req: QuestionRequest):
-    """Generates context-aware technical interview questions."""
+async def generate_questions(req: QuestionRequest, request: Request):
+    """
+    Interview questions for a candidate's skills and projects, retrieval first.
+
+    The question bank answers with the closest questions the session has not asked yet
+    (MMR keeps them diverse). Only the shortfall, when the bank has too few good matches,
+    is generated by the LLM; those questions are indexed so the next candidate with the
+    same stack is served from the bank.
+    """
     start = time.time()
-    
+    question_bank.stats["requests"] += 1
+    difficulty = req.difficulty.upper() if req.difficulty else None
+
+    probes = [f"Interview question about {skill}" for skill in req.skills[:8]]
+    probes += [f"{p.get('name', 'Project')}: {p.get('description', '')}" for p in req.projects[:3]]
+    vectors = await run_in_threadpool(encode_texts, (probes or ["Software engineering interview question"]) + req.exclude, EMBED_BATCH_SIZE, True)
+    probe_count = len(probes) or 1
+    picked = question_bank.search(vectors[:probe_count], req.skills, req.count, req.exclude, vectors[probe_count:], difficulty)
+    question_bank.stats["retrieved"] += len(picked)
+
+    missing = req.count - len(picked)
+    if missing <= 0:
+        return {"questions": picked, "retrieved": len(picked), "generated": 0, "raw": "",
+                "time_ms": round((time.time() - start)*1000)}
+
     skill_str = ", ".join(req.skills[:5])
     project_CTX = ""
     if req.projects:
         project_CTX = f"Candidate has built: {', '.join([p.get('name', 'Project') for p in req.projects])}."
+    avoid = [q["text"] for q in picked] + req.exclude[-10:]
+    avoid_CTX = "Do not repeat or rephrase these questions:\n" + "\n".join(f"- {q}" for q in avoid) if avoid else ""
 
     system_prompt = "You are a Technical Interviewer. Generate diverse, challenging interview questions."
-    prompt = f"""Generate {req.count} technical interview questions based on:
+    prompt = f"""Generate {missing} technical interview questions based on:
     Skills: {skill_str}
     {project_CTX}
+    {avoid_CTX}
     
     Return a JSON object with a key 'questions' containing a list of objects:
     {{
         "questions": [
-            {{ "text": "Question text?", "type": "TECHNICAL", "difficulty": "MEDIUM" }}
+            {{ "text": "Question text?", "type": "TECHNICAL", "difficulty": "{difficulty or 'MEDIUM'}" }}
         ]
     }}
     """
 
-    res = generate_text(prompt, system_prompt, 1024, 0.4)
-    parsed = extract_json(res)
-    
+    question_bank.stats["fallbacks"] += 1
+    job = submit_generation(prompt, system_prompt, 1024, 0.4, QUESTIONS_SCHEMA, request_deadline(request),
+                            use_speculative("generate-questions"), request_priority(request, "generate-questions"))
+    res = await await_job(job, request)
+    parsed = extract_json(res, QUESTIONS_SCHEMA)
+    seen = {QuestionBank.question_id(t) for t in avoid}
+    generated = []
+    for q in (parsed.get("questions", []) if parsed else []):
+        if isinstance(q, dict) and q.get("text") and QuestionBank.question_id(str(q["text"])) not in seen:
+            seen.add(QuestionBank.question_id(str(q["text"])))
+            generated.append(bank_entry({**q, "skills": req.skills[:5], "source": "generated"}))
+    generated = generated[:missing]
+    if generated:
+        await run_in_threadpool(question_bank.add, generated)
+    question_bank.stats["generated"] += len(generated)
+
     return {
-        "questions": parsed.get("questions", []) if parsed else [],
+        "questions": picked + generated,
+        "retrieved": len(picked),
+        "generated": len(generated),
         "raw": res,
-        "time_ms": round((time.time() - start)*1000)
+        "time_ms": round((time.time() - start)*1000),
+        **speculation_fields(job)
     }
 
 #===============================================
@@ -320,7 +3313,7 @@ if __name__ == "__main__":
         print("⚠️  Ngrok not configured. Running locally on port 8000.")
 
     print(f"🧠 Model: {LLM_ID}")
-    print("⚡ Status: Ready for Multi-Cloud Tasking")
+    print("⚡ Status: Loading models in the background (poll /ready)")
     print(f"{'='*60}\n")
 
     config = uvicorn.Config(app, host="0.0.0.0", port=8000, log_level="info")
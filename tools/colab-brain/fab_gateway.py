@@ -0,0 +1,383 @@
+# FAB BRAIN GATEWAY
+# One URL in front of N cloud brains (fab_brain.py on Colab/Kaggle/CPU nodes).
+# Point REMOTE_BRAIN_URL at this service; it speaks the same API as a single brain.
+#
+#   FAB_GATEWAY_NODES="https://a.ngrok-free.app,https://b.ngrok-free.app" python fab_gateway.py
+
+import os
+import math
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional, Dict, Any
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
+from pydantic import BaseModel
+
+#===============================================
+# STEP 1: Configuration
+#===============================================
+
+NODES = [u.strip().rstrip("/") for u in os.environ.get("FAB_GATEWAY_NODES", "").split(",") if u.strip()]
+PORT = int(os.environ.get("FAB_GATEWAY_PORT", "8100"))
+HEALTH_INTERVAL_S = float(os.environ.get("FAB_GATEWAY_HEALTH_INTERVAL_S", "10"))
+EJECT_AFTER = int(os.environ.get("FAB_GATEWAY_EJECT_AFTER", "2"))          # failed checks before ejection
+MAX_ATTEMPTS = int(os.environ.get("FAB_GATEWAY_MAX_ATTEMPTS", "3"))        # nodes tried per request
+DEFAULT_DEADLINE_S = float(os.environ.get("FAB_GATEWAY_DEFAULT_DEADLINE_S", "180"))
+
+# Node answers that are safe to replay elsewhere: the brain did no work for the request
+# (overloaded, still loading, tunnel down). Generation has no side effects, but a request
+# that reached a model is never retried, so one slow prompt cannot fan out across the fleet.
+RETRY_STATUSES = {429, 502, 503}
+# Hop-by-hop headers and ones httpx recomputes
+DROP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding", "accept-encoding"}
+
+#===============================================
+# STEP 2: Node Pool
+#===============================================
+
+class BrainNode:
+    """One registered brain and what the gateway has measured about it."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = False          # only healthy nodes receive traffic
+        self.failures = 0             # consecutive failed health checks / connection errors
+        self.outstanding = 0          # requests proxied and not yet finished
+        self.tokens_per_sec: Optional[float] = None
+        self.phase: Optional[str] = None
+        self.last_check: Optional[float] = None
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def weight(self) -> float:
+        return self.tokens_per_sec or 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "phase": self.phase,
+            "outstanding": self.outstanding,
+            "tokens_per_sec": self.tokens_per_sec,
+            "consecutive_failures": self.failures,
+            "requests": self.requests,
+            "errors": self.errors,
+            "last_check": self.last_check
+        }
+
+class NodePool:
+    """
+    Least-outstanding-requests balancing, weighted by each node's decode tokens/sec.
+
+    A node's load is `(outstanding + 1) / weight`, so a node twice as fast takes
+    twice the concurrent requests before a slower one is preferred. Nodes that fail
+    EJECT_AFTER health checks in a row stop receiving traffic until a check passes.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.nodes: Dict[str, BrainNode] = {}
+        self.stats = {"requests": 0, "retries": 0, "no_node": 0, "deadline_exceeded": 0}
+        # Last /questions/index body: every node keeps its own bank, so it is replayed to
+        # nodes that register or come back from ejection before they take traffic
+        self.question_index: Optional[bytes] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        for url in urls:
+            self.add(url)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # Read timeout stays open: generation time is bounded by the caller's deadline
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None),
+                                             headers={"ngrok-skip-browser-warning": "true"})
+        return self._client
+
+    def add(self, url: str) -> BrainNode:
+        url = url.strip().rstrip("/")
+        if url not in self.nodes:
+            self.nodes[url] = BrainNode(url)
+            print(f"➕ Registered brain node: {url}")
+        return self.nodes[url]
+
+    def remove(self, url: str) -> bool:
+        return self.nodes.pop(url.strip().rstrip("/"), None) is not None
+
+    def pick(self, exclude: set) -> Optional[BrainNode]:
+        candidates = [n for n in self.nodes.values() if n.healthy and n.url not in exclude]
+        if not candidates:
+            return None
+        best = min((n.outstanding + 1) / n.weight for n in candidates)
+        return random.choice([n for n in candidates if (n.outstanding + 1) / n.weight == best])
+
+    def mark_failure(self, node: BrainNode, reason: str):
+        node.failures += 1
+        if node.healthy and node.failures >= EJECT_AFTER:
+            node.healthy = False
+            print(f"⛔ Ejected {node.url}: {reason}")
+
+    async def index_questions(self, node: BrainNode, body: bytes) -> httpx.Response:
+        """Sends a question bank to one node; raises on connection errors and non-200 answers."""
+        response = await self.client.post(f"{node.url}/questions/index", content=body,
+                                          headers={"content-type": "application/json"}, timeout=120.0)
+        response.raise_for_status()
+        return response
+
+    async def check(self, node: BrainNode):
+        """
+        Health check: /health decides eligibility, GET / refreshes the decode rate.
+        A node rejoining the pool gets the question bank first, so retrieval never hits an empty index.
+        """
+        node.last_check = time.time()
+        try:
+            health = await self.client.get(f"{node.url}/health", timeout=5.0)
+            body = health.json() if health.headers.get("content-type", "").startswith("application/json") else {}
+            node.phase = body.get("phase", "ready" if health.status_code == 200 else None)
+            if health.status_code != 200:
+                self.mark_failure(node, f"/health returned {health.status_code}")
+                return
+            info = (await self.client.get(f"{node.url}/", timeout=5.0)).json()
+            if info.get("decode_tokens_per_sec"):
+                node.tokens_per_sec = float(info["decode_tokens_per_sec"])
+            if not node.healthy and self.question_index is not None:
+                await self.index_questions(node, self.question_index)
+        except (httpx.HTTPError, ValueError) as e:
+            node.phase = None
+            self.mark_failure(node, f"{type(e).__name__}: {e}")
+            return
+        if not node.healthy:
+            print(f"✅ Node ready: {node.url} ({node.tokens_per_sec or '?'} tokens/sec)")
+        node.healthy, node.failures = True, 0
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(node) for node in list(self.nodes.values())))
+
+    async def health_loop(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(HEALTH_INTERVAL_S)
+
+pool = NodePool(NODES)
+
+#===============================================
+# STEP 3: Proxy
+#===============================================
+
+def request_budget_s(request: Request) -> float:
+    """How long the caller will wait, from X-Brain-Deadline-Ms; the default when missing, malformed or not a positive number."""
+    header = request.headers.get("x-brain-deadline-ms")
+    try:
+        budget_s = float(header) / 1000 if header else DEFAULT_DEADLINE_S
+    except ValueError:
+        budget_s = DEFAULT_DEADLINE_S
+    return budget_s if math.isfinite(budget_s) and budget_s > 0 else DEFAULT_DEADLINE_S
+
+async def forward(request: Request, path: str) -> Response:
+    """
+    Sends the request to the least-loaded node, retrying on another node when the
+    chosen one is unreachable or answers 429/502/503 before doing any work.
+
+    Bodies are streamed straight through, so SSE endpoints work unchanged. The caller's
+    X-Brain-Deadline-Ms is re-based on every attempt so nodes drop work nobody awaits,
+    and once it has passed the gateway answers 504 instead of trying another node.
+    """
+    body = await request.body()
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in DROP_HEADERS}
+    deadline = time.time() + request_budget_s(request)
+    pool.stats["requests"] += 1
+
+    tried: set = set()
+    last_error: Optional[Response] = None
+    for attempt in range(MAX_ATTEMPTS):
+        node = pool.pick(tried)
+        if node is None:
+            break
+        tried.add(node.url)
+        if attempt:
+            pool.stats["retries"] += 1
+        remaining_ms = int((deadline - time.time()) * 1000)
+        if remaining_ms <= 0:
+            pool.stats["deadline_exceeded"] += 1
+            return JSONResponse(status_code=504, content={"detail": f"Deadline exceeded after {attempt} attempt(s)"})
+        headers["x-brain-deadline-ms"] = str(remaining_ms)
+
+        node.outstanding += 1
+        node.requests += 1
+        released = False
+
+        def release(n: BrainNode = node):
+            nonlocal released
+            if not released:
+                released = True
+                n.outstanding -= 1
+
+        try:
+            upstream = await pool.client.send(
+                pool.client.build_request(request.method, f"{node.url}/{path}", params=request.query_params,
+                                          headers=headers, content=body),
+                stream=True
+            )
+        except httpx.HTTPError as e:
+            release()
+            node.errors += 1
+            pool.mark_failure(node, f"{type(e).__name__}: {e}")
+            print(f"🔁 {node.url} unreachable, retrying elsewhere")
+            continue
+
+        if upstream.status_code in RETRY_STATUSES:
+            content = await upstream.aread()
+            await upstream.aclose()
+            release()
+            last_error = Response(content=content, status_code=upstream.status_code,
+                                  headers={k: v for k, v in upstream.headers.items() if k.lower() in ("content-type", "retry-after")})
+            continue
+
+        async def relay(up: httpx.Response = upstream, done=release):
+            try:
+                async for chunk in up.aiter_raw():
+                    yield chunk
+            finally:
+                await up.aclose()
+                done()
+
+        response_headers = {k: v for k, v in upstream.headers.items() if k.lower() not in DROP_HEADERS | {"content-encoding"}}
+        response_headers["X-Brain-Node"] = node.url
+        return StreamingResponse(relay(), status_code=upstream.status_code, headers=response_headers)
+
+    if last_error is not None:
+        return last_error
+    pool.stats["no_node"] += 1
+    return JSONResponse(status_code=503, content={"detail": "No healthy brain node available"}, headers={"Retry-After": str(int(HEALTH_INTERVAL_S))})
+
+async def broadcast_question_index(request: Request) -> Response:
+    """
+    Fans a question bank out to every healthy node: each brain keeps its own index, so
+    indexing one node would leave the rest serving generated questions only.
+
+    Answers 200 only when every node indexed it, otherwise 502 with the per-node outcome,
+    so the caller retries the sync instead of recording it as done. The body is kept and
+    replayed to nodes that join later (see NodePool.check).
+    """
+    body = await request.body()
+    pool.question_index = body
+    nodes = [n for n in pool.nodes.values() if n.healthy]
+    if not nodes:
+        pool.stats["no_node"] += 1
+        return JSONResponse(status_code=503, content={"detail": "No healthy brain node available"}, headers={"Retry-After": str(int(HEALTH_INTERVAL_S))})
+
+    start = time.time()
+    results = await asyncio.gather(*(pool.index_questions(node, body) for node in nodes), return_exceptions=True)
+    outcome, failed = [], 0
+    for node, result in zip(nodes, results):
+        node.requests += 1
+        if isinstance(result, httpx.Response):
+            data = result.json()
+            outcome.append({"node": node.url, "added": data.get("added"), "bank_size": data.get("bank_size")})
+            continue
+        failed += 1
+        node.errors += 1
+        if not isinstance(result, httpx.HTTPStatusError):
+            pool.mark_failure(node, f"{type(result).__name__}: {result}")
+        outcome.append({"node": node.url, "error": f"{type(result).__name__}: {result}"})
+
+    content = {
+        "added": sum(r.get("added") or 0 for r in outcome),
+        "bank_size": min((r["bank_size"] for r in outcome if r.get("bank_size") is not None), default=0),
+        "nodes": outcome,
+        "time_ms": round((time.time() - start)*1000)
+    }
+    if failed:
+        content["detail"] = f"Question bank not indexed on {failed} of {len(nodes)} node(s)"
+        return JSONResponse(status_code=502, content=content)
+    return JSONResponse(content=content)
+
+#===============================================
+# STEP 4: FastAPI Server
+#===============================================
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    checker = asyncio.create_task(pool.health_loop())
+    yield
+    checker.cancel()
+    await pool.client.aclose()
+
+app = FastAPI(title="FAB Brain Gateway", lifespan=lifespan)
+
+class NodeRequest(BaseModel):
+    url: str
+
+@app.get("/")
+def root():
+    healthy = [n for n in pool.nodes.values() if n.healthy]
+    return {
+        "status": "online",
+        "gateway": True,
+        "nodes": len(pool.nodes),
+        "healthy_nodes": len(healthy),
+        "decode_tokens_per_sec": round(sum(n.tokens_per_sec or 0 for n in healthy), 1) or None,
+        "features": ["llm", "sentence-bert"]
+    }
+
+@app.get("/health")
+def health(response: Response):
+    """200 while at least one node can take traffic."""
+    if any(n.healthy for n in pool.nodes.values()):
+        return {"status": "healthy"}
+    response.status_code = 503
+    return {"status": "starting" if pool.nodes else "no-nodes"}
+
+@app.get("/gateway/nodes")
+def list_nodes():
+    return {"nodes": [n.to_dict() for n in pool.nodes.values()], **pool.stats}
+
+@app.post("/gateway/nodes")
+async def register_node(req: NodeRequest):
+    """Adds a brain (e.g. a new notebook's ngrok URL) and health-checks it right away."""
+    node = pool.add(req.url)
+    await pool.check(node)
+    return node.to_dict()
+
+@app.delete("/gateway/nodes")
+def remove_node(req: NodeRequest):
+    if not pool.remove(req.url):
+        raise HTTPException(status_code=404, detail="Unknown node")
+    return {"removed": req.url}
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus view of the pool (each node also serves its own /metrics)."""
+    lines = []
+    for name, kind, attr in (("fab_gateway_node_healthy", "gauge", "healthy"),
+                             ("fab_gateway_node_outstanding", "gauge", "outstanding"),
+                             ("fab_gateway_node_tokens_per_second", "gauge", "tokens_per_sec"),
+                             ("fab_gateway_node_requests_total", "counter", "requests"),
+                             ("fab_gateway_node_errors_total", "counter", "errors")):
+        lines.append(f"# TYPE {name} {kind}")
+        for node in pool.nodes.values():
+            lines.append(f'{name}{{node="{node.url}"}} {float(getattr(node, attr) or 0)}')
+    lines.append("# TYPE fab_gateway_requests_total counter")
+    lines += [f'fab_gateway_requests_total{{outcome="{k}"}} {v}' for k, v in pool.stats.items()]
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.post("/questions/index")
+async def index_questions(request: Request):
+    return await broadcast_question_index(request)
+
+@app.api_route("/{path:path}", methods=["GET", "POST"])
+async def proxy(path: str, request: Request):
+    return await forward(request, path)
+
+#===============================================
+# STEP 5: Run Server
+#===============================================
+if __name__ == "__main__":
+    print(f"\n🚦 Starting FAB Brain Gateway on port {PORT} with {len(pool.nodes)} node(s)...")
+    if not pool.nodes:
+        print("⚠️  No nodes yet. Set FAB_GATEWAY_NODES or POST {\"url\": ...} to /gateway/nodes")
+    uvicorn.run(app, host="0.0.0.0", port=PORT, log_level="info")
@@ -0,0 +1,763 @@
+# FAB MOCK BRAIN
+# Stand-in for fab_brain.py with no models: same routes and response shapes, canned or
+# templated JSON, and simulated latency, token rate, overload, errors and timeouts.
+# Lets the backend's RemoteProvider timeouts, fallbacks and concurrency be load-tested on a laptop.
+#
+#   FAB_MOCK_PROFILE=t4 python fab_mock_brain.py                     # then REMOTE_BRAIN_URL=http://localhost:8000
+#   FAB_MOCK_PROFILE=flaky FAB_MOCK_SEED=7 python fab_mock_brain.py
+#   curl -X POST localhost:8000/mock/config -H 'Content-Type: application/json' -d '{"error_rate": 0.2}'
+
+import os
+import re
+import json
+import math
+import time
+import random
+import struct
+import asyncio
+import base64
+import hashlib
+from typing import List, Optional, Dict, Any
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse, JSONResponse
+from pydantic import BaseModel
+
+#===============================================
+# STEP 1: Configuration
+#===============================================
+
+PORT = int(os.environ.get("FAB_MOCK_PORT", "8000"))
+SEED = int(os.environ.get("FAB_MOCK_SEED", "0"))
+EMBED_DIM = 384                                   # all-MiniLM-L6-v2
+MODEL_ID = "mock/Qwen2.5-1.5B-Instruct"
+EMBED_MODEL_ID = "mock/all-MiniLM-L6-v2"
+
+# Latency model per request: tunnel + queue overhead (lognormal around the median), then
+# prompt tokens at the prefill rate and output tokens at the decode rate. `slots` requests
+# generate at once, the next `max_queue` wait, and the rest get 429 like the real scheduler.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "instant": {"latency_median_ms": 0, "latency_sigma": 0.0, "prefill_tokens_per_sec": 0, "decode_tokens_per_sec": 0,
+                "slots": 64, "max_queue": 1024, "error_rate": 0.0, "timeout_rate": 0.0},
+    "t4": {"latency_median_ms": 250, "latency_sigma": 0.5, "prefill_tokens_per_sec": 2500, "decode_tokens_per_sec": 28,
+           "slots": 8, "max_queue": 32, "error_rate": 0.0, "timeout_rate": 0.0},
+    "cpu": {"latency_median_ms": 60, "latency_sigma": 0.3, "prefill_tokens_per_sec": 300, "decode_tokens_per_sec": 8,
+            "slots": 1, "max_queue": 32, "error_rate": 0.0, "timeout_rate": 0.0},
+    "flaky": {"latency_median_ms": 400, "latency_sigma": 0.9, "prefill_tokens_per_sec": 2500, "decode_tokens_per_sec": 28,
+              "slots": 8, "max_queue": 32, "error_rate": 0.05, "timeout_rate": 0.02},
+}
+PROFILE = os.environ.get("FAB_MOCK_PROFILE", "t4")
+
+# 0 for a rate means "infinitely fast"
+config: Dict[str, Any] = {
+    "profile": PROFILE,
+    **PROFILES[PROFILE],
+    "error_statuses": [500, 502, 503],
+    "timeout_hang_s": 600.0,        # longer than every RemoteProvider timeout
+    "warmup_s": 0.0,                # /health answers 503 "warming" this long after start
+    "default_deadline_s": 180.0,    # when X-Brain-Deadline-Ms is missing or malformed, like the brain
+    "output_tokens": 120,           # length of free-text answers
+}
+_ENV = {
+    "latency_median_ms": float, "latency_sigma": float, "prefill_tokens_per_sec": float, "decode_tokens_per_sec": float,
+    "slots": int, "max_queue": int, "error_rate": float, "timeout_rate": float, "timeout_hang_s": float,
+    "warmup_s": float, "default_deadline_s": float, "output_tokens": int,
+}
+for _key, _cast in _ENV.items():
+    if os.environ.get(f"FAB_MOCK_{_key.upper()}"):
+        config[_key] = _cast(os.environ[f"FAB_MOCK_{_key.upper()}"])
+if os.environ.get("FAB_MOCK_ERROR_STATUSES"):
+    config["error_statuses"] = [int(s) for s in os.environ["FAB_MOCK_ERROR_STATUSES"].split(",") if s.strip()]
+
+STARTED_AT = time.time()
+
+#===============================================
+# STEP 2: Simulated Node
+#===============================================
+
+class MockError(Exception):
+    def __init__(self, status: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        self.status, self.detail, self.headers = status, detail, headers or {}
+
+class MockNode:
+    """
+    Decides, deterministically per arrival, how long each request takes and whether it fails.
+
+    Arrival n draws from Random(f"{seed}:{n}"), so a replayed request sequence sees the same
+    latencies and the same injected failures. Response content depends only on the request.
+    """
+
+    def __init__(self):
+        self.arrivals = 0
+        self.active = 0
+        self.waiting = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slot_count = 0
+        self.stats: Dict[str, int] = {"requests": 0, "ok": 0, "injected_errors": 0, "injected_timeouts": 0,
+                                      "rejected": 0, "deadline_exceeded": 0, "output_tokens": 0}
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None or self._slot_count != config["slots"]:
+            self._slot_count = max(1, int(config["slots"]))
+            self._slots = asyncio.Semaphore(self._slot_count)
+        return self._slots
+
+    def arrival(self) -> random.Random:
+        self.arrivals += 1
+        self.stats["requests"] += 1
+        return random.Random(f"{SEED}:{self.arrivals}")
+
+    @staticmethod
+    def overhead_s(rng: random.Random) -> float:
+        median = config["latency_median_ms"] / 1000
+        return median * rng.lognormvariate(0, config["latency_sigma"]) if median > 0 else 0.0
+
+    @staticmethod
+    def rate_s(tokens: int, rate: float) -> float:
+        return tokens / rate if rate > 0 else 0.0
+
+    async def admit(self, request: Request, rng: random.Random) -> float:
+        """
+        Applies forced/injected failures and the queue limit; returns the request's deadline.
+
+        Raises:
+            MockError: injected error, injected timeout (after hanging), or 429 when full.
+        """
+        forced = request.headers.get("x-mock-error")
+        if forced:
+            self.stats["injected_errors"] += 1
+            raise MockError(int(forced), "Forced by X-Mock-Error")
+        roll = rng.random()
+        if roll < config["timeout_rate"]:
+            self.stats["injected_timeouts"] += 1
+            await asyncio.sleep(config["timeout_hang_s"])
+            raise MockError(504, "Injected timeout")
+        if roll < config["timeout_rate"] + config["error_rate"]:
+            self.stats["injected_errors"] += 1
+            await asyncio.sleep(self.overhead_s(rng))
+            raise MockError(rng.choice(config["error_statuses"]), "Injected error")
+        if self.waiting >= config["max_queue"]:
+            self.stats["rejected"] += 1
+            raise MockError(429, f"Brain overloaded: {self.waiting} requests already queued", {"Retry-After": "5"})
+        header = request.headers.get("x-brain-deadline-ms")
+        try:
+            budget_s = float(header) / 1000 if header else config["default_deadline_s"]
+        except ValueError:
+            budget_s = config["default_deadline_s"]
+        if not (math.isfinite(budget_s) and budget_s > 0):
+            budget_s = config["default_deadline_s"]
+        return time.time() + budget_s
+
+    async def run(self, request: Request, prompt_tokens: int, output_tokens: int):
+        """Holds the request for its simulated duration inside a generation slot."""
+        rng = self.arrival()
+        deadline = await self.admit(request, rng)
+        overhead = self.overhead_s(rng)
+        forced = request.headers.get("x-mock-latency-ms")
+        duration = float(forced) / 1000 if forced else (
+            overhead + self.rate_s(prompt_tokens, config["prefill_tokens_per_sec"])
+            + self.rate_s(output_tokens, config["decode_tokens_per_sec"]))
+        async with self.slot():
+            if time.time() + duration > deadline:
+                await asyncio.sleep(max(0.0, deadline - time.time()))
+                self.stats["deadline_exceeded"] += 1
+                raise MockError(504, f"Deadline passed after {duration:.1f}s of simulated work")
+            await asyncio.sleep(duration)
+        self.stats["ok"] += 1
+        self.stats["output_tokens"] += output_tokens
+
+    def slot(self):
+        node = self
+
+        class _Slot:
+            async def __aenter__(self):
+                node.waiting += 1
+                try:
+                    await node.slots.acquire()
+                finally:
+                    node.waiting -= 1
+                node.active += 1
+
+            async def __aexit__(self, *exc):
+                node.active -= 1
+                node.slots.release()
+
+        return _Slot()
+
+node = MockNode()
+
+#===============================================
+# STEP 3: Canned & Templated Content
+#===============================================
+
+def approx_tokens(text: str) -> int:
+    """~4 characters per token, like Qwen on English and code."""
+    return max(1, len(text) // 4)
+
+def content_rng(*parts: Any) -> random.Random:
+    """Randomness that depends only on the request, so equal requests get equal answers."""
+    return random.Random(hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest())
+
+class _Skip(Exception):
+    """A placeholder token (etc, ...) that stands for no value."""
+
+class TemplateReader:
+    """
+    Turns the loose JSON examples in backend prompts into real values.
+
+    Prompts describe their output as `"score": 0-100`, `"type": "A" | "B"`,
+    `["flag1", etc]` or `0-100 (your confidence)`. Ranges become a number inside the range,
+    alternatives the first option, and trailing remarks are dropped.
+    """
+
+    BARE = re.compile(r"-?\d+(?:\.\d+)?(?:\s*-\s*\d+(?:\.\d+)?)?|[A-Za-z_][\w.]*|\.\.\.")
+
+    def __init__(self, text: str, rng: random.Random):
+        self.s, self.i, self.rng = text, 0, rng
+
+    def ws(self):
+        while self.i < len(self.s) and self.s[self.i].isspace():
+            self.i += 1
+
+    def string(self) -> str:
+        value, self.i = json.decoder.scanstring(self.s, self.i + 1)
+        return value
+
+    def value(self) -> Any:
+        self.ws()
+        if self.i >= len(self.s):
+            raise ValueError("Template ended early")
+        c = self.s[self.i]
+        if c == "{":
+            return self.obj()
+        if c == "[":
+            return self.arr()
+        if c == '"':
+            return self.string()
+        m = self.BARE.match(self.s, self.i)
+        if not m:
+            raise ValueError(f"Unexpected {c!r} in template")
+        self.i = m.end()
+        token = m.group()
+        if re.fullmatch(r"-?\d+(?:\.\d+)?\s*-\s*\d+(?:\.\d+)?", token):
+            low, high = (float(v) for v in re.split(r"(?<=\d)\s*-\s*", token, 1))
+            return self.rng.randint(int(low), int(high))
+        if re.fullmatch(r"-?\d+(?:\.\d+)?", token):
+            return float(token) if "." in token else int(token)
+        if token in ("true", "false", "null"):
+            return json.loads(token)
+        if token in ("number", "int", "integer"):
+            return self.rng.randint(0, 100)
+        if token in ("string", "str"):
+            return "mock"
+        raise _Skip()
+
+    def skip_rest(self):
+        """Skips remarks after a value, up to the next comma or closing bracket at this level."""
+        depth = 0
+        while self.i < len(self.s):
+            c = self.s[self.i]
+            if c == '"':
+                self.string()
+                continue
+            if c in "{[(":
+                depth += 1
+            elif c in "}])":
+                if depth == 0:
+                    return
+                depth -= 1
+            elif c == "," and depth == 0:
+                return
+            self.i += 1
+
+    def obj(self) -> Dict[str, Any]:
+        self.i += 1
+        out: Dict[str, Any] = {}
+        while True:
+            self.ws()
+            if self.i >= len(self.s):
+                raise ValueError("Unclosed object in template")
+            if self.s[self.i] == "}":
+                self.i += 1
+                return out
+            if self.s[self.i] == ",":
+                self.i += 1
+                continue
+            if self.s[self.i] == '"':
+                key = self.string()
+            else:
+                m = re.compile(r"[A-Za-z_]\w*").match(self.s, self.i)
+                if not m:
+                    raise ValueError("Bad key in template")
+                key, self.i = m.group(), m.end()
+            self.ws()
+            if self.i >= len(self.s) or self.s[self.i] != ":":
+                raise ValueError("Missing ':' in template")
+            self.i += 1
+            try:
+                out[key] = self.value()
+            except _Skip:
+                out[key] = "mock"
+            self.skip_rest()
+
+    def arr(self) -> List[Any]:
+        self.i += 1
+        out: List[Any] = []
+        while True:
+            self.ws()
+            if self.i >= len(self.s):
+                raise ValueError("Unclosed array in template")
+            if self.s[self.i] == "]":
+                self.i += 1
+                return out
+            if self.s[self.i] == ",":
+                self.i += 1
+                continue
+            try:
+                out.append(self.value())
+            except _Skip:
+                pass
+            self.skip_rest()
+
+def template_from_prompt(prompt: str, rng: random.Random) -> Optional[Any]:
+    """The JSON shape a prompt asks for: the first example after its last mention of JSON that has one."""
+    for mention in reversed([m.end() for m in re.finditer(r"json", prompt, re.I)]):
+        start = re.compile(r"[{\[]").search(prompt, mention, mention + 400)
+        if not start:
+            continue
+        try:
+            value = TemplateReader(prompt[start.start():], rng).value()
+        except (ValueError, IndexError):
+            continue
+        if value:
+            return value
+    return None
+
+def evaluation(prompt: str) -> Dict[str, Any]:
+    rng = content_rng("evaluation", prompt)
+    # Longer answers score better, so fallbacks and thresholds see a spread of scores
+    answer = prompt.rsplit("Answer", 1)[-1]
+    score = min(95, 25 + len(answer.split()) // 2 + rng.randint(0, 15))
+    return {
+        "score": score,
+        "feedback": "Mock evaluation: covers the basics but misses trade-offs." if score < 70 else "Mock evaluation: solid and specific.",
+        "breakdown": {"accuracy": min(100, score + rng.randint(-5, 5)), "depth": max(0, score - rng.randint(0, 15)),
+                      "communication": min(100, score + rng.randint(0, 10))},
+        "satisfaction": score,
+        "redFlags": [] if score >= 50 else ["Vague answer"],
+    }
+
+SKILL_WORDS = ("python", "javascript", "typescript", "java", "go", "rust", "c++", "react", "node", "express", "django",
+               "flask", "fastapi", "docker", "kubernetes", "aws", "postgresql", "mongodb", "redis", "git", "graphql")
+
+def resume_analysis(text: str) -> Dict[str, Any]:
+    words = set(re.findall(r"[a-z+#.]+", text.lower()))
+    found = [s for s in SKILL_WORDS if s in words]
+    return {
+        "languages": [s for s in found if s in ("python", "javascript", "typescript", "java", "go", "rust", "c++")],
+        "frameworks": [s for s in found if s in ("react", "node", "express", "django", "flask", "fastapi")],
+        "tools": [s for s in found if s in ("docker", "kubernetes", "aws", "postgresql", "mongodb", "redis", "git")],
+        "concepts": [s for s in found if s == "graphql"],
+        "summary": "Mock summary: software engineer" + (f" working with {', '.join(found[:3])}." if found else "."),
+        "experience": [],
+        "projects": [],
+    }
+
+QUESTION_TEMPLATES = (
+    "How would you find and fix a memory leak in a production {skill} service?",
+    "Walk me through how you would design caching for a read-heavy {skill} API.",
+    "What trade-offs did you weigh the last time you chose {skill} for a project?",
+    "How do you test concurrency bugs in {skill} code?",
+    "Explain a {skill} performance problem you diagnosed and what the root cause was.",
+)
+
+def mock_questions(skills: List[str], count: int, exclude: List[str]) -> List[Dict[str, Any]]:
+    skills = skills or ["software engineering"]
+    seen = {q.strip().lower() for q in exclude}
+    out = []
+    for i in range(len(QUESTION_TEMPLATES) * len(skills)):
+        skill = skills[i % len(skills)]
+        text = QUESTION_TEMPLATES[(i // len(skills)) % len(QUESTION_TEMPLATES)].format(skill=skill)
+        if text.lower() in seen:
+            continue
+        seen.add(text.lower())
+        out.append({"text": text, "type": "TECHNICAL", "difficulty": "MEDIUM", "context": f"Technical: {skill}",
+                    "expectedPoints": [], "skills": [skill], "source": "mock"})
+        if len(out) == count:
+            break
+    return out
+
+def prose(prompt: str, max_tokens: int) -> str:
+    rng = content_rng("prose", prompt)
+    words = ("the", "service", "cache", "request", "latency", "queue", "token", "batch", "model", "answer", "candidate", "project")
+    tokens = min(max_tokens, config["output_tokens"])
+    return "Mock response: " + " ".join(rng.choice(words) for _ in range(max(1, tokens - 3)))
+
+def mock_vector(text: str) -> List[float]:
+    """Deterministic unit vector per text; equal texts embed identically, different ones do not."""
+    rng = content_rng("embed", text)
+    vector = [rng.gauss(0, 1) for _ in range(EMBED_DIM)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+def pack(vectors: List[List[float]], dtype: str) -> str:
+    fmt = "<" + ("e" if dtype == "float16" else "f") * (EMBED_DIM * len(vectors))
+    return base64.b64encode(struct.pack(fmt, *[v for row in vectors for v in row])).decode("ascii")
+
+#===============================================
+# STEP 4: FastAPI Server
+#===============================================
+
+app = FastAPI(title="FAB Mock Brain")
+
+@app.exception_handler(MockError)
+async def mock_error_handler(request: Request, exc: MockError):
+    return JSONResponse(status_code=exc.status, content={"detail": exc.detail}, headers=exc.headers)
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    system_prompt: str = ""
+    max_tokens: int = 2048
+    temperature: float = 0.3
+    json_schema: Optional[Dict[str, Any]] = None
+
+class CodeAnalysisRequest(BaseModel):
+    code: str
+    language: str
+
+class ResumeAnalysisRequest(BaseModel):
+    resume_text: str
+    job_description: str = ""
+    mode: str = "hybrid"
+
+class ProjectInput(BaseModel):
+    name: str = ""
+    description: str = ""
+    readme: str = ""
+    languages: Dict[str, int] = {}
+    file_tree: List[str] = []
+    core_files: List[Dict[str, Any]] = []
+
+class ProjectAnalysisRequest(ProjectInput):
+    projects: List[ProjectInput] = []
+    prompt: str = ""
+    system_prompt: str = ""
+    max_tokens: int = 1024
+
+class AnswerItem(BaseModel):
+    question: str
+    answer: str
+    expectedPoints: List[str] = []
+    context: str = ""
+
+class BatchEvaluateRequest(BaseModel):
+    items: List[AnswerItem]
+    max_tokens: int = 512
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+    kind: str = "text"
+    batch_size: int = 64
+    normalize: bool = True
+    dtype: str = "float16"
+    encoding: str = "base64"
+
+class CodeFile(BaseModel):
+    path: str = ""
+    content: Optional[str] = None
+    sha: Optional[str] = None
+
+class EmbedCodeRequest(BaseModel):
+    files: List[CodeFile]
+    include_chunks: bool = False
+    dtype: str = "float16"
+
+class QuestionIndexRequest(BaseModel):
+    questions: List[Dict[str, Any]]
+
+class QuestionRequest(BaseModel):
+    skills: List[str]
+    projects: List[dict] = []
+    count: int = 3
+    exclude: List[str] = []
+    difficulty: Optional[str] = None
+
+class MockConfigRequest(BaseModel):
+    profile: Optional[str] = None
+    latency_median_ms: Optional[float] = None
+    latency_sigma: Optional[float] = None
+    prefill_tokens_per_sec: Optional[float] = None
+    decode_tokens_per_sec: Optional[float] = None
+    slots: Optional[int] = None
+    max_queue: Optional[int] = None
+    error_rate: Optional[float] = None
+    timeout_rate: Optional[float] = None
+    error_statuses: Optional[List[int]] = None
+    timeout_hang_s: Optional[float] = None
+    output_tokens: Optional[int] = None
+
+question_bank: set = set()
+
+def phase() -> str:
+    return "warming" if time.time() - STARTED_AT < config["warmup_s"] else "ready"
+
+def elapsed_ms(start: float) -> int:
+    return round((time.time() - start) * 1000)
+
+@app.get("/")
+def root():
+    return {
+        "status": "online",
+        "model": MODEL_ID,
+        "device": "mock",
+        "dtype": config["profile"],
+        "phase": phase(),
+        "decode_tokens_per_sec": config["decode_tokens_per_sec"] or None,
+        "features": ["llm", "sentence-bert", "mock"]
+    }
+
+@app.get("/health")
+def health(response: Response):
+    if phase() == "ready":
+        return {"status": "healthy"}
+    response.status_code = 503
+    response.headers["Retry-After"] = "15"
+    return {"status": "starting", "phase": phase(), "error": None}
+
+@app.get("/ready")
+def ready(response: Response):
+    if phase() != "ready":
+        response.status_code = 503
+    return {"phase": phase(), "model": MODEL_ID, "embedding_model": EMBED_MODEL_ID, "uptime_seconds": round(time.time() - STARTED_AT, 1),
+            "mock": config}
+
+@app.get("/metrics")
+def metrics():
+    lines = ["# TYPE fab_mock_requests_total counter"]
+    lines += [f'fab_mock_requests_total{{outcome="{k}"}} {v}' for k, v in node.stats.items() if k != "output_tokens"]
+    lines += ["# TYPE fab_brain_running_jobs gauge", f"fab_brain_running_jobs {node.active}",
+              "# TYPE fab_brain_queue_depth gauge", f"fab_brain_queue_depth {node.waiting}",
+              "# TYPE fab_brain_tokens_total counter", f'fab_brain_tokens_total{{direction="output"}} {node.stats["output_tokens"]}']
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/mock/stats")
+def mock_stats():
+    return {**node.stats, "active": node.active, "waiting": node.waiting, "config": config}
+
+@app.post("/mock/config")
+def mock_config(req: MockConfigRequest):
+    """Changes the simulation mid-test; a `profile` resets every rate to that profile's values first."""
+    changes = {k: v for k, v in req.model_dump().items() if v is not None}
+    if "profile" in changes:
+        if changes["profile"] not in PROFILES:
+            raise MockError(400, f"Unknown profile (choose from {', '.join(PROFILES)})")
+        config.update(PROFILES[changes["profile"]])
+    config.update(changes)
+    return config
+
+def require_ready():
+    if phase() != "ready":
+        raise MockError(503, "Brain is warming", {"Retry-After": "15"})
+
+@app.post("/generate")
+async def generate_endpoint(req: GenerateRequest, request: Request):
+    start = time.time()
+    require_ready()
+    prompt = f"{req.system_prompt}\n{req.prompt}"
+    # Backend callers ask for JSON in the prompt and parse `result`, so answer in the shape they describe
+    template = template_from_prompt(req.prompt, content_rng("template", prompt)) if re.search(r"json", req.prompt, re.I) else None
+    result = json.dumps(template, indent=2) if template is not None else prose(prompt, req.max_tokens)
+    await node.run(request, approx_tokens(prompt), approx_tokens(result))
+    return {"result": result, "truncated_tokens": 0, "time_ms": elapsed_ms(start)}
+
+async def stream_events(request: Request, prompt: str, result: str, parse_json: bool):
+    """SSE like fab_brain's stream_job_events: token events at the decode rate, then `done`."""
+    require_ready()
+    rng = node.arrival()
+    deadline = await node.admit(request, rng)
+    pieces = re.findall(r"\s*\S{1,4}", result) or [result]
+    start = time.time()
+
+    def sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    async def events():
+        async with node.slot():
+            await asyncio.sleep(node.overhead_s(rng) + node.rate_s(approx_tokens(prompt), config["prefill_tokens_per_sec"]))
+            ttft = elapsed_ms(start)
+            for piece in pieces:
+                if time.time() > deadline:
+                    node.stats["deadline_exceeded"] += 1
+                    yield sse("error", {"error": "Deadline passed"})
+                    return
+                yield sse("token", {"text": piece})
+                await asyncio.sleep(node.rate_s(1, config["decode_tokens_per_sec"]))
+        node.stats["ok"] += 1
+        node.stats["output_tokens"] += len(pieces)
+        done = {"result": result, "tokens": len(pieces), "truncated_tokens": 0, "ttft_ms": ttft, "time_ms": elapsed_ms(start)}
+        if parse_json:
+            parsed = json.loads(result)
+            done.update({"parsed": parsed, "repaired": False, "parse_error": False})
+        yield sse("done", done)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/generate-stream")
+async def generate_stream_endpoint(req: GenerateRequest, request: Request):
+    prompt = f"{req.system_prompt}\n{req.prompt}"
+    return await stream_events(request, prompt, prose(prompt, req.max_tokens), False)
+
+@app.post("/generate-json")
+async def generate_json_endpoint(req: GenerateRequest, request: Request):
+    start = time.time()
+    require_ready()
+    parsed = template_from_prompt(req.prompt, content_rng("template", req.prompt))
+    if not isinstance(parsed, (dict, list)):
+        parsed = {}
+    if isinstance(parsed, dict):
+        for key in (req.json_schema or {}).get("required", []):
+            parsed.setdefault(key, "mock")
+    result = json.dumps(parsed)
+    await node.run(request, approx_tokens(req.prompt), approx_tokens(result))
+    return {"result": result, "parsed": parsed, "repaired": False, "parse_error": False, "truncated_tokens": 0, "time_ms": elapsed_ms(start)}
+
+@app.post("/evaluate-answer")
+async def evaluate_answer(req: GenerateRequest, request: Request):
+    start = time.time()
+    require_ready()
+    parsed = evaluation(req.prompt)
+    result = json.dumps(parsed)
+    await node.run(request, approx_tokens(req.prompt), approx_tokens(result))
+    return {"result": result, "parsed": parsed, "repaired": False, "parse_error": False, "truncated_tokens": 0, "time_ms": elapsed_ms(start)}
+
+@app.post("/evaluate-answer-stream")
+async def evaluate_answer_stream(req: GenerateRequest, request: Request):
+    return await stream_events(request, req.prompt, json.dumps(evaluation(req.prompt)), True)
+
+@app.post("/analyze-code")
+async def analyze_code(req: CodeAnalysisRequest, request: Request):
+    start = time.time()
+    require_ready()
+    analysis = prose(req.code, 1024)
+    await node.run(request, approx_tokens(req.code), approx_tokens(analysis))
+    return {"analysis": analysis, "embedding_preview": mock_vector(req.code)[:5], "truncated_tokens": 0, "time_ms": elapsed_ms(start)}
+
+@app.post("/analyze-resume")
+async def analyze_resume(req: ResumeAnalysisRequest, request: Request):
+    start = time.time()
+    require_ready()
+    analysis = resume_analysis(req.resume_text)
+    # Hybrid mode only generates the summary; llm mode writes the whole document
+    raw = json.dumps(analysis if req.mode == "llm" else {"summary": analysis["summary"]})
+    await node.run(request, approx_tokens(req.resume_text), approx_tokens(raw))
+    return {"analysis": analysis, "parse_error": False, "raw": raw, "generated_tokens": approx_tokens(raw),
+            "llm_fields": ["summary"] if req.mode != "llm" else [], "time_ms": elapsed_ms(start)}
+
+def project_analysis(project: ProjectInput) -> Dict[str, Any]:
+    rng = content_rng("project", project.name, project.description)
+    languages = sorted(project.languages, key=project.languages.get, reverse=True)
+    files = len(project.file_tree)
+    return {
+        "name": project.name,
+        "analysis": {
+            "complexity": "ADVANCED" if files > 80 else "INTERMEDIATE" if files > 15 else "BASIC",
+            "architecture": rng.choice(["Layered REST API", "Monolithic SPA", "CLI with plugin system", "Event-driven service"]),
+            "learnedSkills": languages[:4] or ["Software Engineering"],
+            "projectType": rng.choice(["Web App", "CLI", "Library", "API", "Other"]),
+            "realWorldUtility": f"Mock analysis of {project.name or 'the project'}."
+        },
+        "ranked_files": [f.get("path", "") for f in project.core_files][:5],
+        "cached": False
+    }
+
+@app.post("/analyze-project")
+async def analyze_project(req: ProjectAnalysisRequest, request: Request):
+    start = time.time()
+    require_ready()
+    projects = req.projects or [ProjectInput(name=req.name, description=req.description or req.prompt, readme=req.readme,
+                                             languages=req.languages, file_tree=req.file_tree, core_files=req.core_files)]
+    results = [project_analysis(p) for p in projects]
+    prompt_tokens = sum(approx_tokens(p.readme + p.description) + 1500 for p in projects)
+    # One batched generate on the real brain: the longest answer sets the pace
+    await node.run(request, prompt_tokens, max(approx_tokens(json.dumps(r["analysis"])) for r in results))
+    if req.projects:
+        return {"results": results, "time_ms": elapsed_ms(start)}
+    return {**results[0], "time_ms": elapsed_ms(start)}
+
+@app.post("/batch/evaluate-answers")
+async def batch_evaluate_answers(req: BatchEvaluateRequest, request: Request):
+    start = time.time()
+    require_ready()
+    if len(req.items) > 64:
+        raise MockError(413, "At most 64 items per request")
+    results = [{"index": i, "ok": True, "evaluation": evaluation(f"{item.question}\nAnswer: {item.answer}"), "cached": False}
+               for i, item in enumerate(req.items)]
+    waves = -(-len(req.items) // max(1, config["slots"]))
+    await node.run(request, sum(approx_tokens(item.answer) + 200 for item in req.items), 120 * max(1, waves))
+    return {"results": results, "succeeded": len(results), "failed": 0, "time_ms": elapsed_ms(start)}
+
+@app.post("/embed")
+async def embed(req: EmbedRequest, request: Request):
+    start = time.time()
+    require_ready()
+    if len(req.texts) > 4096:
+        raise MockError(413, "At most 4096 texts per request")
+    if req.dtype not in ("float16", "float32"):
+        raise MockError(400, "dtype must be float16 or float32")
+    # Encoding is all prefill: no output tokens
+    await node.run(request, sum(approx_tokens(t) for t in req.texts), 0)
+    data = pack([mock_vector(t) for t in req.texts], req.dtype)
+    if req.encoding == "binary":
+        return Response(content=base64.b64decode(data), media_type="application/octet-stream", headers={
+            "X-Embedding-Count": str(len(req.texts)), "X-Embedding-Dim": str(EMBED_DIM),
+            "X-Embedding-Dtype": req.dtype, "X-Embedding-Model": EMBED_MODEL_ID})
+    return {"model": EMBED_MODEL_ID, "count": len(req.texts), "dim": EMBED_DIM, "dtype": req.dtype,
+            "normalized": True, "data": data, "time_ms": elapsed_ms(start)}
+
+@app.post("/embed-code")
+async def embed_code(req: EmbedCodeRequest, request: Request):
+    start = time.time()
+    require_ready()
+    files, vectors = [], []
+    for f in req.files:
+        if f.content is None and not f.sha:
+            raise MockError(400, "Every file needs content or a sha")
+        sha = f.sha or hashlib.sha1(b"blob %d\0" % len(f.content.encode()) + f.content.encode()).hexdigest()
+        vectors.append(mock_vector(f.content or sha))
+        files.append({"path": f.path, "sha": sha, "missing": False, "chunks": 1, "tokens": approx_tokens(f.content or ""), "cached": False})
+    await node.run(request, sum(f["tokens"] for f in files), 0)
+    repo = [sum(col) / max(1, len(vectors)) for col in zip(*vectors)] if vectors else [0.0] * EMBED_DIM
+    return {"model": EMBED_MODEL_ID, "dim": EMBED_DIM, "dtype": req.dtype, "files": files, "missing": [], "reused": 0,
+            "computed": len(files), "data": pack(vectors, req.dtype), "repo": pack([repo], req.dtype), "time_ms": elapsed_ms(start)}
+
+@app.post("/questions/index")
+async def index_questions(req: QuestionIndexRequest, request: Request):
+    start = time.time()
+    require_ready()
+    await node.run(request, sum(approx_tokens(str(q.get("text", ""))) for q in req.questions), 0)
+    texts = {str(q.get("text", "")).strip().lower() for q in req.questions if q.get("text")}
+    added = len(texts - question_bank)
+    question_bank.update(texts)
+    return {"added": added, "bank_size": len(question_bank), "time_ms": elapsed_ms(start)}
+
+@app.post("/generate-questions")
+async def generate_questions(req: QuestionRequest, request: Request):
+    start = time.time()
+    require_ready()
+    questions = mock_questions(req.skills, req.count, req.exclude)
+    # Served from the index unless the bank is empty, like the retrieval-first brain
+    generated = 0 if question_bank else len(questions)
+    await node.run(request, 300, 60 * generated)
+    return {"questions": questions, "retrieved": len(questions) - generated, "generated": generated,
+            "raw": json.dumps({"questions": questions}) if generated else "", "time_ms": elapsed_ms(start)}
+
+#===============================================
+# STEP 5: Run Server
+#===============================================
+if __name__ == "__main__":
+    print(f"\n🧪 Starting FAB Mock Brain on port {PORT} (profile '{config['profile']}', seed {SEED})")
+    print(f"   decode {config['decode_tokens_per_sec'] or '∞'} tokens/sec, {config['slots']} slots, "
+          f"errors {config['error_rate']:.0%}, timeouts {config['timeout_rate']:.0%}")
+    uvicorn.run(app, host="0.0.0.0", port=PORT, log_level="warning")
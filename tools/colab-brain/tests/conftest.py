@@ -0,0 +1,83 @@
+"""
+Shared setup for the brain's unit tests.
+
+fab_brain reads its configuration from FAB_BRAIN_* variables at import, so they are set
+here, before any test module imports it: CPU, full precision, no calibration run and a
+throwaway cache directory. The `brain` fixture builds a tiny random-init model offline
+and loads it, for tests that need the scheduler or the embedding model.
+"""
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("FAB_BRAIN_CACHE_DIR", tempfile.mkdtemp(prefix="fab_brain_test_"))
+os.environ.setdefault("FAB_BRAIN_DEVICE", "cpu")
+os.environ.setdefault("FAB_BRAIN_CPU_DTYPE", "fp32")
+os.environ.setdefault("FAB_BRAIN_CALIBRATE", "0")
+
+
+def tiny_corpus() -> str:
+    """Fixed training text for the tiny tokenizers, so the models do not change when the brain's code does."""
+    words = ("the a candidate answer question interview score feedback project code resume skill python typescript "
+             "def class return import self async await yield json schema token batch cache prefix model decode "
+             "{ } [ ] : , \" 0 1 2 3 42 100 true false null ( ) = . - _ # \n").split(" ")
+    rng = random.Random(0)
+    return "\n".join(" ".join(rng.choice(words) for _ in range(16)) for _ in range(4000))
+
+
+def build_tiny_models(root: str, corpus: str):
+    """Random-init Qwen2 chat model (plus a smaller draft) and a small Sentence-BERT, saved under `root`."""
+    import torch
+    from sentence_transformers import SentenceTransformer, models as st_models
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import BertConfig, BertModel, PreTrainedTokenizerFast, Qwen2Config, Qwen2ForCausalLM
+
+    torch.manual_seed(0)
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator([corpus], trainers.BpeTrainer(
+        vocab_size=2000, special_tokens=["<|endoftext|>", "<|im_start|>", "<|im_end|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<|im_end|>", pad_token="<|endoftext|>")
+    tokenizer.chat_template = ("{% for m in messages %}<|im_start|>{{ m['role'] }}\n{{ m['content'] }}<|im_end|>\n{% endfor %}"
+                               "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}")
+    for name, hidden, layers in (("llm", 64, 2), ("draft", 32, 1)):
+        config = Qwen2Config(vocab_size=len(tokenizer), hidden_size=hidden, intermediate_size=hidden * 2, num_hidden_layers=layers,
+                             num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=2048,
+                             eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.pad_token_id)
+        Qwen2ForCausalLM(config).save_pretrained(os.path.join(root, name))
+        tokenizer.save_pretrained(os.path.join(root, name))
+
+    wordpiece = Tokenizer(models.WordPiece(unk_token="[UNK]"))
+    wordpiece.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    wordpiece.train_from_iterator([corpus], trainers.WordPieceTrainer(vocab_size=1000, special_tokens=["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]))
+    bert_tokenizer = PreTrainedTokenizerFast(tokenizer_object=wordpiece, unk_token="[UNK]", pad_token="[PAD]",
+                                             cls_token="[CLS]", sep_token="[SEP]", mask_token="[MASK]", model_max_length=128)
+    bert_dir = os.path.join(root, "bert")
+    bert_tokenizer.save_pretrained(bert_dir)
+    BertModel(BertConfig(vocab_size=len(bert_tokenizer), hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+                         intermediate_size=64, max_position_embeddings=256)).save_pretrained(bert_dir)
+    encoder = st_models.Transformer(bert_dir, max_seq_length=128)
+    SentenceTransformer(modules=[encoder, st_models.Pooling(32)]).save(os.path.join(root, "sentence"))
+
+
+@pytest.fixture(scope="session")
+def brain(tmp_path_factory):
+    """fab_brain with tiny random-init models loaded and warmed (no network, a few seconds on CPU)."""
+    import fab_brain
+
+    root = str(tmp_path_factory.mktemp("models"))
+    build_tiny_models(root, tiny_corpus())
+    fab_brain.LLM_ID = os.path.join(root, "llm")
+    fab_brain.DRAFT_MODEL_ID = os.path.join(root, "draft")
+    fab_brain.SENTENCE_MODEL_ID = os.path.join(root, "sentence")
+    fab_brain.load_and_warm()
+    assert fab_brain.BRAIN_STATE["phase"] == "ready", fab_brain.BRAIN_STATE["error"]
+    return fab_brain
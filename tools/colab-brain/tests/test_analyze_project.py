@@ -0,0 +1,68 @@
+import json
+import types
+import uuid
+from concurrent.futures import Future
+
+import pytest
+from fastapi.testclient import TestClient
+
+from fab_brain import QueueFullError
+
+ANALYSIS = {"complexity": "ADVANCED", "architecture": "Layered REST API", "learnedSkills": ["FastAPI", "SQLite"],
+            "projectType": "API", "realWorldUtility": "Serves interview models"}
+
+
+@pytest.fixture
+def analyst(brain, monkeypatch):
+    """The project endpoint with the model replaced by canned answers, one per submitted prompt in order."""
+    answers = []
+
+    def submit_generation(prompt, *args, **kwargs):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        future = Future()
+        future.set_result(answer)
+        return types.SimpleNamespace(future=future, cancel=lambda: None)
+
+    monkeypatch.setattr(brain, "submit_generation", submit_generation)
+    return answers, TestClient(brain.app)
+
+
+def project(**fields):
+    return {"name": f"repo-{uuid.uuid4()}", "description": "A FastAPI service", "languages": {"Python": 1000},
+            "core_files": [{"path": "main.py", "content": "from fastapi import FastAPI\napp = FastAPI()\n"}], **fields}
+
+
+def test_single_project_returns_the_normalized_analysis_and_caches_it(analyst):
+    answers, client = analyst
+    answers.append(json.dumps({**ANALYSIS, "complexity": "expert"}))
+    body = project()
+    first = client.post("/analyze-project", json=body).json()
+    assert first["analysis"] == {**ANALYSIS, "complexity": "INTERMEDIATE"}
+    assert first["ranked_files"] == ["main.py"] and first["cached"] is False
+    assert client.post("/analyze-project", json=body).json()["cached"] is True
+    assert answers == []
+
+
+@pytest.mark.parametrize("answer, error", [
+    ("I cannot analyze this repository.", "Unparseable analysis"),
+    (json.dumps(ANALYSIS)[:60], "Incomplete analysis"),
+    (QueueFullError("64 requests already queued"), "Brain overloaded"),
+])
+def test_single_project_failure_is_a_502(analyst, answer, error):
+    answers, client = analyst
+    answers.append(answer)
+    response = client.post("/analyze-project", json=project())
+    assert response.status_code == 502
+    assert response.json()["detail"].startswith(error)
+
+
+def test_failures_in_a_list_stay_per_project(analyst):
+    answers, client = analyst
+    answers += [json.dumps(ANALYSIS), "not json"]
+    response = client.post("/analyze-project", json={"projects": [project(), project()]})
+    assert response.status_code == 200
+    ok, failed = response.json()["results"]
+    assert ok["analysis"] == ANALYSIS
+    assert failed["analysis"] is None and failed["error"] == "Unparseable analysis" and failed["raw"] == "not json"
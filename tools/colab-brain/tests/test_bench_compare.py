@@ -0,0 +1,43 @@
+from fab_bench import compare
+
+
+def generation(prompt_tokens=512, batch_size=1, empty_cache=True, **fields):
+    return {"prompt_tokens": prompt_tokens, "max_tokens": 128, "batch_size": batch_size, "concurrency": 1,
+            "empty_cache": empty_cache, "decode_tokens_per_sec": 20.0, "ttft_p95_ms": 400, **fields}
+
+
+def embedding(**fields):
+    return {"kind": "code", "batch_size": 32, "texts_per_sec": 100.0, **fields}
+
+
+BASELINE = {"generation": [generation(), generation(batch_size=4)], "embeddings": [embedding()]}
+
+
+def test_unchanged_run_has_no_regressions():
+    assert compare(BASELINE, BASELINE, 0.1) == []
+
+
+def test_throughput_drop_and_latency_rise_beyond_tolerance():
+    current = {"generation": [generation(decode_tokens_per_sec=17.0, ttft_p95_ms=500)], "embeddings": [embedding(texts_per_sec=80.0)]}
+    assert compare(current, BASELINE, 0.1) == [
+        "generation/512/128/1/1/True decode_tokens_per_sec: 20.0 -> 17.0",
+        "generation/512/128/1/1/True ttft_p95_ms: 400 -> 500",
+        "embeddings/code/32 texts_per_sec: 100.0 -> 80.0",
+    ]
+
+
+def test_changes_within_tolerance_or_in_the_good_direction_pass():
+    current = {"generation": [generation(decode_tokens_per_sec=18.5, ttft_p95_ms=300)], "embeddings": [embedding(texts_per_sec=150.0)]}
+    assert compare(current, BASELINE, 0.1) == []
+
+
+def test_only_matching_grid_points_are_compared():
+    current = {"generation": [generation(prompt_tokens=2048, decode_tokens_per_sec=1.0),
+                              generation(empty_cache=False, decode_tokens_per_sec=1.0)]}
+    assert compare(current, BASELINE, 0.1) == []
+
+
+def test_unmeasured_fields_are_skipped():
+    current = {"generation": [generation(ttft_p95_ms=None)]}
+    baseline = {"generation": [generation(decode_tokens_per_sec=None)]}
+    assert compare(current, baseline, 0.1) == []
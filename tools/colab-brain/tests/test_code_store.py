@@ -0,0 +1,73 @@
+import base64
+import uuid
+
+import numpy as np
+
+from fab_brain import CodeEmbeddingStore, git_blob_sha
+
+
+def file_vectors(body: dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(body["data"]), dtype="<f4").reshape(len(body["files"]), body["dim"])
+
+
+def embed_code(brain, files):
+    return brain.embed_code(brain.EmbedCodeRequest(files=[brain.CodeFile(**f) for f in files], dtype="float32"))
+
+
+def test_blob_sha_matches_git():
+    assert git_blob_sha("hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"     # git hash-object
+    assert git_blob_sha("") == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+
+
+def test_unchanged_blobs_are_not_embedded_again(brain):
+    source = f"def handler_{uuid.uuid4().hex}(request):\n    return request.json()\n"
+    embedded = brain.code_store.stats["chunks_embedded"]
+    first = embed_code(brain, [{"path": "a.py", "content": source}])
+    assert (first["computed"], first["reused"]) == (1, 0)
+    assert first["files"][0]["sha"] == git_blob_sha(source)
+    chunks = brain.code_store.stats["chunks_embedded"] - embedded
+
+    # Same content under another path, and the bare SHA: both served from the store
+    second = embed_code(brain, [{"path": "b.py", "content": source}, {"path": "a.py", "sha": git_blob_sha(source)}])
+    assert (second["computed"], second["reused"]) == (0, 2)
+    assert brain.code_store.stats["chunks_embedded"] - embedded == chunks
+    np.testing.assert_allclose(file_vectors(second), np.repeat(file_vectors(first), 2, axis=0), atol=1e-6)
+
+    edited = embed_code(brain, [{"path": "a.py", "content": source + "# edited\n"}])
+    assert edited["computed"] == 1
+
+
+def test_unknown_bare_sha_is_reported_missing(brain):
+    sha = "0" * 40
+    body = embed_code(brain, [{"path": "gone.py", "sha": sha}])
+    assert body["missing"] == [sha] and body["files"][0]["missing"]
+    assert not file_vectors(body).any()
+
+
+def source_lines(count: int) -> str:
+    return "\n".join(f"value_{i} = compute(value_{i - 1}) + {i}" for i in range(1, count))
+
+
+def test_long_files_become_overlapping_windows(brain):
+    spans = brain.split_code_windows(source_lines(40))
+    assert 1 < len(spans) < brain.CODE_MAX_CHUNKS
+    assert all(tokens <= brain.code_chunk_window() for _, _, tokens in spans)
+    assert all(next_start < end for (_, end, _), (next_start, _, _) in zip(spans, spans[1:]))
+
+
+def test_very_long_files_are_sampled_end_to_end(brain):
+    source = source_lines(2000)
+    spans = brain.split_code_windows(source)
+    assert len(spans) == brain.CODE_MAX_CHUNKS
+    assert spans[0][0] == 0 and spans[-1][1] == len(source)
+
+
+def test_store_survives_a_restart_on_disk(brain, tmp_path):
+    path = str(tmp_path / "code.sqlite3")
+    entry = {"spans": [(0, 10, 4), (8, 20, 5)], "vectors": np.full((2, 4), 0.5, dtype=np.float32)}
+    CodeEmbeddingStore(path, 8, 1 << 20).put_many({"abc": entry})
+    store = CodeEmbeddingStore(path, 8, 1 << 20)
+    found = store.get_many(["abc", "def"])
+    assert list(found) == ["abc"] and found["abc"]["spans"] == entry["spans"]
+    np.testing.assert_array_equal(found["abc"]["vectors"], entry["vectors"])
+    assert store.stats["disk_hits"] == 1 and store.stats["misses"] == 1
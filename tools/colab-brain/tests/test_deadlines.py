@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import fab_brain
+from fab_brain import DEFAULT_DEADLINE_S, JobCancelledError, QueueFullError, request_deadline
+
+
+def request_with(headers=None, receive=None) -> Request:
+    scope = {"type": "http", "method": "POST", "path": "/", "query_string": b"",
+             "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]}
+    return Request(scope, receive)
+
+
+@pytest.mark.parametrize("header, budget_s", [
+    ("1500", 1.5),
+    (None, DEFAULT_DEADLINE_S),
+    ("abc", DEFAULT_DEADLINE_S),
+    ("0", DEFAULT_DEADLINE_S),
+    ("-5", DEFAULT_DEADLINE_S),
+    ("nan", DEFAULT_DEADLINE_S),
+    ("inf", DEFAULT_DEADLINE_S),
+])
+def test_request_deadline(header, budget_s):
+    headers = {"X-Brain-Deadline-Ms": header} if header is not None else {}
+    assert request_deadline(request_with(headers)) - time.time() == pytest.approx(budget_s, abs=0.5)
+
+
+def test_full_queue_answers_429_with_retry_after(brain, monkeypatch):
+    def overloaded(*args, **kwargs):
+        raise QueueFullError("64 requests already queued")
+
+    monkeypatch.setattr(brain, "submit_generation", overloaded)
+    response = TestClient(brain.app).post("/generate", json={"prompt": "hi", "temperature": 0.9})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "overloaded" in response.json()["detail"]
+
+
+def test_passed_deadline_answers_504(brain):
+    response = TestClient(brain.app).post("/generate", json={"prompt": "A long story please", "max_tokens": 200, "temperature": 0.9},
+                                          headers={"X-Brain-Deadline-Ms": "1"})
+    assert response.status_code == 504
+
+
+def test_client_disconnect_cancels_the_job(brain):
+    async def receive():
+        await asyncio.sleep(0.05)
+        return {"type": "http.disconnect"}
+
+    job = brain.submit_generation("Tell me everything about databases.", "", 2000, 0.9, coalesce=False)
+    with pytest.raises(JobCancelledError):
+        asyncio.run(fab_brain.await_job(job, request_with(receive=receive)))
+    assert job.cancelled and len(job.output_ids) < 2000
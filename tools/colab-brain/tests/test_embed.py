@@ -0,0 +1,38 @@
+import base64
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+
+def decode(body: dict) -> np.ndarray:
+    dtype = "<f2" if body["dtype"] == "float16" else "<f4"
+    return np.frombuffer(base64.b64decode(body["data"]), dtype=dtype).reshape(body["count"], body["dim"])
+
+
+TEXTS = ["Explain the event loop.", "What is a race condition?", "ok", "Describe how you would shard a database " * 8]
+
+
+def test_batching_does_not_change_the_vectors(brain):
+    one_by_one = decode(brain.embed(brain.EmbedRequest(texts=TEXTS, batch_size=1, dtype="float32")))
+    batched = decode(brain.embed(brain.EmbedRequest(texts=TEXTS, batch_size=64, dtype="float32")))
+    assert one_by_one.shape == (len(TEXTS), brain.sentence_model.get_sentence_embedding_dimension())
+    np.testing.assert_allclose(batched, one_by_one, atol=1e-5)
+
+
+def test_vectors_are_normalized_and_packed_as_requested(brain):
+    body = brain.embed(brain.EmbedRequest(texts=TEXTS))
+    assert body["dtype"] == "float16" and body["normalized"]
+    np.testing.assert_allclose(np.linalg.norm(decode(body).astype(np.float32), axis=1), 1.0, atol=1e-2)
+
+    raw = brain.embed(brain.EmbedRequest(texts=TEXTS, normalize=False, dtype="float32", encoding="binary"))
+    assert raw.headers["X-Embedding-Count"] == str(len(TEXTS))
+    vectors = np.frombuffer(raw.body, dtype="<f4").reshape(len(TEXTS), -1)
+    np.testing.assert_allclose(vectors, brain.encode_texts(TEXTS), atol=1e-6)
+
+
+def test_empty_and_invalid_requests(brain):
+    assert brain.embed(brain.EmbedRequest(texts=[]))["count"] == 0
+    with pytest.raises(HTTPException) as error:
+        brain.embed(brain.EmbedRequest(texts=["x"], dtype="int8"))
+    assert error.value.status_code == 400
@@ -0,0 +1,176 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import fab_gateway
+from fab_gateway import NodePool
+
+
+class Body(httpx.AsyncByteStream):
+    """A network-like body: httpx would pre-read `json=` content, which cannot be relayed as a stream."""
+
+    def __init__(self, data: dict):
+        self.data = json.dumps(data).encode()
+
+    async def __aiter__(self):
+        yield self.data
+
+
+class Fleet:
+    """Fake brains behind an httpx MockTransport; `answers[url]` decides each node's reply."""
+
+    def __init__(self):
+        self.answers = {}
+        self.calls = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        url = f"{request.url.scheme}://{request.url.host}"
+        self.calls.append((url, request.url.path, request.headers.get("x-brain-deadline-ms"), request.content))
+        if request.url.path == "/health":
+            return httpx.Response(200 if self.answers.get(url) != "down" else 503, json={"phase": "ready"})
+        if request.url.path == "/":
+            return httpx.Response(200, json={"decode_tokens_per_sec": 10.0})
+        answer = self.answers.get(url, 200)
+        if isinstance(answer, tuple):
+            delay, answer = answer
+            await asyncio.sleep(delay)
+        if answer == "down":
+            raise httpx.ConnectError("connection refused")
+        return httpx.Response(answer, headers={"content-type": "application/json"},
+                              stream=Body({"node": url, "added": 2, "bank_size": 5}))
+
+    def paths(self, path: str):
+        return [c[0] for c in self.calls if c[1] == path]
+
+
+@pytest.fixture
+def fleet(monkeypatch):
+    fleet = Fleet()
+    pool = NodePool(["http://a", "http://b"])
+    pool._client = httpx.AsyncClient(transport=httpx.MockTransport(fleet.handler))
+    for node in pool.nodes.values():
+        node.healthy = True
+    monkeypatch.setattr(fab_gateway, "pool", pool)
+    fleet.pool = pool
+    fleet.client = TestClient(fab_gateway.app)    # no context manager: the health loop stays off
+    return fleet
+
+
+def test_pick_prefers_fewest_outstanding_per_unit_of_speed(fleet):
+    a, b = fleet.pool.nodes["http://a"], fleet.pool.nodes["http://b"]
+    a.tokens_per_sec, b.tokens_per_sec = 40.0, 10.0
+    assert fleet.pool.pick(set()) is a
+    a.outstanding = 3                       # 4/40 ties with 1/10
+    assert {fleet.pool.pick(set()) for _ in range(50)} == {a, b}
+    a.outstanding = 4                       # 5/40 loses to it
+    assert fleet.pool.pick(set()) is b
+    assert fleet.pool.pick({"http://b"}) is a
+    b.healthy = False
+    assert fleet.pool.pick({"http://a"}) is None
+
+
+def test_node_is_ejected_after_failed_checks_and_rejoins(fleet):
+    node = fleet.pool.nodes["http://a"]
+    fleet.answers["http://a"] = "down"
+    for _ in range(fab_gateway.EJECT_AFTER):
+        assert node.healthy
+        asyncio.run(fleet.pool.check(node))
+    assert not node.healthy
+    assert all(fleet.client.post("/generate", json={}).headers["X-Brain-Node"] == "http://b" for _ in range(4))
+
+    fleet.answers["http://a"] = 200
+    asyncio.run(fleet.pool.check(node))
+    assert node.healthy and node.failures == 0 and node.tokens_per_sec == 10.0
+
+
+@pytest.mark.parametrize("status", [429, 502, "down"])
+def test_retries_on_another_node_before_any_work(fleet, status):
+    fleet.pool.nodes["http://a"].tokens_per_sec = 100.0     # tried first
+    fleet.answers["http://a"] = status
+    response = fleet.client.post("/generate", json={"prompt": "hi"})
+    assert response.status_code == 200
+    assert response.headers["X-Brain-Node"] == "http://b"
+    assert fleet.paths("/generate") == ["http://a", "http://b"]
+    assert fleet.pool.stats["retries"] == 1
+
+
+def test_other_errors_are_relayed_not_retried(fleet):
+    fleet.answers.update({"http://a": 500, "http://b": 500})
+    assert fleet.client.post("/generate", json={}).status_code == 500
+    assert len(fleet.paths("/generate")) == 1
+
+
+def test_last_retryable_answer_is_returned_when_every_node_refuses(fleet):
+    fleet.answers.update({"http://a": 429, "http://b": 429})
+    assert fleet.client.post("/generate", json={}).status_code == 429
+    assert len(fleet.paths("/generate")) == 2
+
+
+def test_deadline_is_rebased_on_every_attempt(fleet):
+    fleet.pool.nodes["http://a"].tokens_per_sec = 100.0
+    fleet.answers["http://a"] = (0.2, 503)
+    response = fleet.client.post("/generate", json={}, headers={"X-Brain-Deadline-Ms": "5000"})
+    assert response.status_code == 200
+    first, second = (int(c[2]) for c in fleet.calls if c[1] == "/generate")
+    assert first <= 5000 and second <= first - 200
+
+
+@pytest.mark.parametrize("header", ["abc", "-5", "0", "nan", "inf"])
+def test_malformed_deadline_falls_back_to_the_default(fleet, header):
+    fleet.client.post("/generate", json={}, headers={"X-Brain-Deadline-Ms": header})
+    forwarded = int(fleet.calls[-1][2])
+    assert fab_gateway.DEFAULT_DEADLINE_S * 1000 - 1000 < forwarded <= fab_gateway.DEFAULT_DEADLINE_S * 1000
+
+
+def test_passed_deadline_answers_504_instead_of_retrying(fleet):
+    fleet.pool.nodes["http://a"].tokens_per_sec = 100.0
+    fleet.answers["http://a"] = (0.3, 429)
+    response = fleet.client.post("/generate", json={}, headers={"X-Brain-Deadline-Ms": "100"})
+    assert response.status_code == 504
+    assert fleet.paths("/generate") == ["http://a"]
+    assert fleet.pool.stats["deadline_exceeded"] == 1
+
+
+def test_question_index_reaches_every_node(fleet):
+    bank = {"questions": [{"question": "What is a closure?"}]}
+    response = fleet.client.post("/questions/index", json=bank)
+    assert response.status_code == 200
+    assert sorted(fleet.paths("/questions/index")) == ["http://a", "http://b"]
+    assert response.json()["added"] == 4
+    assert all(json.loads(c[3]) == bank for c in fleet.calls)
+
+
+def test_question_index_fails_when_any_node_misses_it(fleet):
+    fleet.answers["http://b"] = 500
+    response = fleet.client.post("/questions/index", json={"questions": []})
+    assert response.status_code == 502
+    assert [n["node"] for n in response.json()["nodes"] if "error" in n] == ["http://b"]
+
+
+def test_question_index_is_replayed_to_joining_and_recovering_nodes(fleet):
+    fleet.client.post("/questions/index", json={"questions": [{"question": "Q"}]})
+    fleet.calls.clear()
+
+    assert fleet.client.post("/gateway/nodes", json={"url": "http://c"}).json()["healthy"]
+    assert fleet.paths("/questions/index") == ["http://c"]
+
+    node = fleet.pool.nodes["http://a"]
+    node.healthy = False
+    asyncio.run(fleet.pool.check(node))
+    assert node.healthy
+    assert fleet.paths("/questions/index") == ["http://c", "http://a"]
+
+    asyncio.run(fleet.pool.check(node))        # already in the pool: not sent again
+    assert fleet.paths("/questions/index") == ["http://c", "http://a"]
+
+
+def test_node_that_cannot_take_the_bank_stays_out(fleet):
+    fleet.client.post("/questions/index", json={"questions": []})
+    node = fleet.pool.nodes["http://a"]
+    node.healthy = False
+    fleet.answers["http://a"] = 500
+    asyncio.run(fleet.pool.check(node))
+    assert not node.healthy
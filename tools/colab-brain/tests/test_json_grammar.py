@@ -0,0 +1,72 @@
+import math
+
+import pytest
+
+from fab_brain import JsonGrammar, JsonStreamParser
+
+
+def fed(text: str, schema=None) -> JsonGrammar:
+    grammar = JsonGrammar.from_schema(schema)
+    assert grammar.feed(text), text
+    return grammar
+
+
+@pytest.mark.parametrize("text", [
+    '{}',
+    '[]',
+    '{"a": 1, "b": [true, false, null], "c": {"d": "x\\n\\u00e9"}}',
+    '[-0.5, 12e3, 1E-2, 0, "s"]',
+])
+def test_accepts_valid_documents(text):
+    assert fed(text).complete
+
+
+@pytest.mark.parametrize("text", [
+    ' {}',          # leading whitespace (a fence or preamble) is not allowed
+    '"top"',        # the root must be a container
+    '{"a" 1}',
+    '{"a": 01}',
+    '{"a": ture}',
+    '{"a": NaN}',
+    '{"a": Infinity}',
+    '[1,]',
+    '{} {}',
+])
+def test_rejects_invalid_documents(text):
+    assert not JsonGrammar.from_schema({}).feed(text)
+
+
+def test_prefixes_stay_open_until_the_value_closes():
+    grammar = fed('{"a": [1, 2')
+    assert not grammar.complete
+    assert grammar.accepts(']}')
+    assert not grammar.accepts('}')
+
+
+def test_schema_pins_root_type_and_required_keys():
+    assert not JsonGrammar.from_schema({"type": "array"}).feed("{")
+    grammar = fed('{"score": 1', {"type": "object", "required": ["score", "feedback"]})
+    assert not grammar.accepts("}")
+    assert grammar.accepts(', "feedback": ""}')
+
+
+def test_whitespace_runs_are_capped():
+    grammar = JsonGrammar.from_schema({})
+    assert grammar.feed("{")
+    assert not grammar.feed(" " * (JsonGrammar.MAX_WHITESPACE_RUN + 1))
+
+
+@pytest.mark.parametrize("number", ["9" * 16, "1." + "5" * 15, "1e99", "-1.5E+99"])
+def test_accepts_numbers_within_bounds(number):
+    assert fed(f"[{number}]").complete
+
+
+@pytest.mark.parametrize("number", ["9" * 17, "1." + "5" * 16, "1e999", "1e999999", "-2E+100"])
+def test_rejects_numbers_past_bounds(number):
+    assert not JsonGrammar.from_schema({}).feed(f"[{number}]")
+
+
+def test_largest_admitted_number_is_finite():
+    parser = JsonStreamParser.from_schema({})
+    parser.feed(f"[{'9' * 16}.{'9' * 15}e99]")
+    assert math.isfinite(parser.value()[0])
@@ -0,0 +1,128 @@
+import asyncio
+import types
+import uuid
+from concurrent.futures import Future
+
+import anyio
+import pytest
+from fastapi import Response
+from starlette.requests import Request
+
+import fab_brain
+from fab_brain import EVALUATION_SCHEMA, JsonStreamParser, json_complete, parse_json_output
+
+
+def parsed(text: str, schema=None):
+    parser = JsonStreamParser.from_schema(schema)
+    parser.feed(text)
+    return parser.value(), parser.repaired
+
+
+def test_complete_value_is_not_repaired():
+    assert parsed('Sure! ```json\n{"a": [1, 2]}\n``` done') == ({"a": [1, 2]}, False)
+
+
+def test_truncated_value_is_repaired_to_the_last_complete_member():
+    assert parsed('{"a": 1, "b": [1, 2') == ({"a": 1, "b": [1]}, True)    # "2" could still grow
+    assert parsed('{"a": 1, "b": "half-writ') == ({"a": 1}, True)
+    assert parsed('{"a": 1, "b": {"c": "x", "d') == ({"a": 1, "b": {"c": "x"}}, True)
+    assert parsed('{"a": 1, "b": {"c') == ({"a": 1}, True)
+
+
+def test_chunked_feed_matches_one_shot():
+    text = 'Here you go: {"score": 70, "feedback": "ok", "breakdown": {"depth": 5}} trailing'
+    parser = JsonStreamParser.from_schema(EVALUATION_SCHEMA)
+    for ch in text:
+        parser.feed(ch)
+    assert parser.complete
+    assert (parser.value(), parser.repaired) == parsed(text, EVALUATION_SCHEMA)
+
+
+def test_no_json_at_all():
+    assert parsed("I cannot answer that.") == (None, False)
+    assert parse_json_output("[1, 2]", {"type": "object"}) == (None, False)
+
+
+@pytest.mark.parametrize("value, repaired, schema, expected", [
+    ({"score": 1, "feedback": "", "breakdown": {}}, False, EVALUATION_SCHEMA, True),
+    ({"score": 1, "feedback": "", "breakdown": {}}, True, EVALUATION_SCHEMA, False),
+    ({"score": 1, "feedback": ""}, False, EVALUATION_SCHEMA, False),
+    ([1], False, {"type": "object"}, False),
+    ([1], False, {"type": "array"}, True),
+    ({}, False, None, True),
+    (None, False, None, False),
+])
+def test_json_complete(value, repaired, schema, expected):
+    assert json_complete(value, repaired, schema) is expected
+
+
+def fake_request() -> Request:
+    async def receive():
+        await asyncio.sleep(3600)
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": []}, receive)
+
+
+@pytest.fixture
+def model_output(monkeypatch):
+    """Replaces the model with canned text; returns the list of prompts it was asked for."""
+    outputs, prompts = {}, []
+
+    def submit_generation(prompt, *args, **kwargs):
+        prompts.append(prompt)
+        future = Future()
+        future.set_result(outputs["text"])
+        return types.SimpleNamespace(future=future, dropped_tokens=0, speculative=False, output_ids=[])
+
+    monkeypatch.setattr(fab_brain, "submit_generation", submit_generation)
+    return outputs, prompts
+
+
+def call_twice(endpoint, req):
+    # anyio.run rather than asyncio.run (which nest_asyncio replaces): it stops the worker
+    # threads the cache lookups ran on, so the test process can exit
+    results, headers = [], []
+    for _ in range(2):
+        response = Response()
+        results.append(anyio.run(endpoint, req, fake_request(), response))
+        headers.append(response.headers["X-Brain-Cache"])
+    return results, headers
+
+
+def test_generate_json_caches_only_complete_results(model_output):
+    outputs, prompts = model_output
+    schema = {"type": "object", "required": ["a", "b"]}
+
+    outputs["text"] = '{"a": 1, "b": [2, 3,'
+    req = fab_brain.GenerateRequest(prompt=f"truncated {uuid.uuid4()}", json_schema=schema)
+    results, headers = call_twice(fab_brain.generate_json_endpoint, req)
+    assert results[0]["parsed"] == {"a": 1, "b": [2, 3]}
+    assert results[0]["repaired"] and results[0]["parse_error"]
+    assert headers == ["MISS", "MISS"] and len(prompts) == 2
+
+    outputs["text"] = '{"a": 1, "b": [2, 3]}'
+    req = fab_brain.GenerateRequest(prompt=f"complete {uuid.uuid4()}", json_schema=schema)
+    results, headers = call_twice(fab_brain.generate_json_endpoint, req)
+    assert not results[0]["parse_error"]
+    assert headers == ["MISS", "HIT-MEMORY"] and len(prompts) == 3
+
+
+def test_evaluate_answer_needs_every_required_key(model_output):
+    outputs, prompts = model_output
+    outputs["text"] = '{"score": 80, "feedback": "Solid"}'
+    req = fab_brain.GenerateRequest(prompt=f"missing breakdown {uuid.uuid4()}")
+    results, headers = call_twice(fab_brain.evaluate_answer, req)
+    assert results[0]["parsed"] == {"score": 80, "feedback": "Solid"}
+    assert results[0]["parse_error"] and not results[0]["repaired"]
+    assert headers == ["MISS", "MISS"] and len(prompts) == 2
+
+
+def test_batch_evaluation_reports_repaired_items_as_failed(model_output):
+    outputs, prompts = model_output
+    outputs["text"] = '{"score": 80, "feedback": "Solid", "satisfaction": 70, "redFlags": [], "breakdown": {"depth": 4'
+    req = fab_brain.BatchEvaluateRequest(items=[fab_brain.AnswerItem(question="Q?", answer=f"A {uuid.uuid4()}")])
+    for _ in range(2):
+        result = anyio.run(fab_brain.batch_evaluate_answers, req, fake_request())
+        assert result["failed"] == 1
+        assert result["results"][0]["ok"] is False
+        assert result["results"][0]["error"] == "Incomplete evaluation"
+    assert len(prompts) == 2
@@ -0,0 +1,39 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from load_test import compare
+
+
+def stats(count=100, p50=100.0, p95=200.0, p99=300.0, error_rate=0.0):
+    return {"count": count, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "error_rate": error_rate}
+
+
+BASELINE = {"scenarios": {"profile": stats()}, "operations": {"GET /api/profile": stats(p50=40.0, p95=80.0, p99=120.0)}}
+
+
+def run(current, latency_tolerance=0.2, error_tolerance=0.01, min_delta_ms=50):
+    return compare(current, BASELINE, latency_tolerance, error_tolerance, min_delta_ms)
+
+
+def test_unchanged_run_has_no_regressions():
+    assert run(BASELINE) == []
+
+
+def test_latency_must_exceed_both_the_relative_and_absolute_thresholds():
+    assert run({"scenarios": {"profile": stats(p99=400.0)}}) == ["profile p99_ms: 300ms -> 400ms (+100ms)"]
+    assert run({"scenarios": {"profile": stats(p99=355.0)}}) == []           # +18%: inside the tolerance
+    assert run({"operations": {"GET /api/profile": stats(p50=80.0, p95=80.0, p99=120.0)}}) == []   # +100% but only +40ms
+
+
+def test_error_rate_regression():
+    assert run({"scenarios": {"profile": stats(error_rate=0.05)}}) == ["profile error_rate: 0.0% -> 5.0%"]
+    assert run({"scenarios": {"profile": stats(error_rate=0.005)}}) == []
+
+
+def test_missing_empty_or_unmeasured_entries_are_skipped():
+    assert run({}) == []
+    assert run({"scenarios": {"profile": stats(count=0, p99=9999.0, error_rate=1.0)}}) == []
+    assert run({"scenarios": {"profile": stats(p50=None, p95=None, p99=None)}}) == []
+    assert run({"scenarios": {"profile": stats(), "interview": stats(p99=9999.0)}}) == []    # not in the baseline
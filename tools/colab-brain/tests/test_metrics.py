@@ -0,0 +1,74 @@
+import re
+
+from fastapi.testclient import TestClient
+
+from fab_brain import Histogram
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_]+="[^"]*",?)*\})? (-?[0-9.e+-]+|\+Inf|NaN)$')
+
+
+def scrape(brain):
+    response = TestClient(brain.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    return response.text
+
+
+def samples(text: str):
+    """{(name, labels): value} plus the declared type of every family."""
+    values, types, helped = {}, {}, set()
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            helped.add(line.split()[2])
+        elif line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            assert name in helped and name not in types, line
+            types[name] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"malformed sample: {line!r}"
+            name, labels, value = match.groups()
+            family = re.sub(r"_(bucket|sum|count)$", "", name) if name not in types else name
+            assert family in types, f"sample without # TYPE: {line!r}"
+            values[(name, labels or "")] = float(value)
+    return values, types
+
+
+def test_exposition_is_well_formed(brain):
+    values, types = samples(scrape(brain))
+    assert types["fab_brain_request_duration_seconds"] == "histogram"
+    assert types["fab_brain_tokens_total"] == "counter"
+    assert types["fab_brain_queue_depth"] == "gauge"
+    assert values[("fab_brain_up", "")] == 1
+
+
+def test_requests_are_labelled_by_route_template(brain):
+    client = TestClient(brain.app)
+    before, _ = samples(scrape(brain))
+    assert client.post("/generate", json={"prompt": "metrics", "max_tokens": 8, "temperature": 0.9}).status_code == 200
+    client.get("/no/such/route")
+    values, _ = samples(scrape(brain))
+
+    key = ("fab_brain_requests_total", '{endpoint="/generate",method="POST",status="200"}')
+    assert values[key] == before.get(key, 0) + 1
+    assert values[("fab_brain_requests_total", '{endpoint="unmatched",method="GET",status="404"}')] >= 1
+    assert values[("fab_brain_request_duration_seconds_count", '{endpoint="/generate"}')] >= 1
+    output = ("fab_brain_tokens_total", '{direction="output"}')
+    assert values[output] > before[output]
+
+
+def test_histogram_buckets_are_cumulative(brain):
+    values, _ = samples(scrape(brain))
+    buckets = [(labels, v) for (name, labels), v in values.items()
+               if name == "fab_brain_request_duration_seconds_bucket" and 'endpoint="/generate"' in labels]
+    counts = [v for _, v in buckets]
+    assert counts == sorted(counts)
+    assert buckets[-1][0].endswith('le="+Inf"}')
+    assert counts[-1] == values[("fab_brain_request_duration_seconds_count", '{endpoint="/generate"}')]
+
+
+def test_histogram_counts_each_value_in_every_bucket_above_it():
+    hist = Histogram((0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        hist.observe(("x",), value)
+    assert hist.series[("x",)] == {"counts": [1, 2], "sum": 5.55, "count": 3}
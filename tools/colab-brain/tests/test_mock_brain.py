@@ -0,0 +1,33 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import fab_mock_brain
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    monkeypatch.setattr(fab_mock_brain, "config", {**fab_mock_brain.config, **fab_mock_brain.PROFILES["instant"]})
+    monkeypatch.setattr(fab_mock_brain, "node", fab_mock_brain.MockNode())
+    return TestClient(fab_mock_brain.app)
+
+
+@pytest.mark.parametrize("header", ["abc", "", "-5", "nan", "inf"])
+def test_malformed_deadline_uses_the_default(mock, header):
+    response = mock.post("/generate", json={"prompt": "hi"}, headers={"X-Brain-Deadline-Ms": header})
+    assert response.status_code == 200
+
+
+def test_deadline_shorter_than_the_work_gives_504(mock):
+    response = mock.post("/generate", json={"prompt": "hi"}, headers={"X-Brain-Deadline-Ms": "50", "X-Mock-Latency-Ms": "500"})
+    assert response.status_code == 504
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/embed", {"texts": ["a", "b"]}),
+    ("/embed-code", {"files": [{"path": "a.py", "content": "print(1)"}]}),
+    ("/questions/index", {"questions": [{"text": "What is a closure?"}]}),
+])
+def test_embedding_and_index_routes_go_through_the_simulated_node(mock, path, body):
+    assert mock.post(path, json=body).status_code == 200
+    assert mock.post(path, json=body, headers={"X-Mock-Error": "503"}).status_code == 503
+    assert fab_mock_brain.node.stats["requests"] == 2 and fab_mock_brain.node.stats["injected_errors"] == 1
@@ -0,0 +1,44 @@
+from fab_brain import PrefixCache
+
+SYSTEM = "You are a careful interviewer. " * 12
+
+
+def test_admission_needs_length_and_repeat_sightings(brain):
+    cache = PrefixCache(max_entries=4, min_seen=2, min_tokens=32)
+    assert cache.admit(SYSTEM, 16) is None                 # too short to be worth it
+    assert cache.admit(SYSTEM, 64) is None                 # first sighting
+    assert cache.admit(SYSTEM, 64) == PrefixCache.key_for(SYSTEM)
+    cache.pin("pinned prompt")
+    assert cache.admit("pinned prompt", 64) == PrefixCache.key_for("pinned prompt")
+    assert PrefixCache(0, 1, 0).admit(SYSTEM, 64) is None
+
+
+def test_hit_returns_a_private_copy_and_counts_reused_tokens(brain):
+    cache = PrefixCache(max_entries=4, min_seen=1, min_tokens=1)
+    ids = brain.tokenizer(SYSTEM).input_ids
+    first = cache.get("k", ids)
+    second = cache.get("k", ids)
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 0, "reused_tokens": len(ids)}
+    assert first.get_seq_length() == second.get_seq_length() == len(ids)
+    second.crop(1)                                         # decoding grows the copy, never the entry
+    assert cache.get("k", ids).get_seq_length() == len(ids)
+
+
+def test_least_recently_used_prefix_is_evicted(brain):
+    cache = PrefixCache(max_entries=2, min_seen=1, min_tokens=1)
+    for key in ("a", "b", "a", "c"):                       # b is the oldest when c arrives
+        cache.get(key, [1, 2, 3])
+    assert cache.stats["evictions"] == 1
+    misses = cache.stats["misses"]
+    cache.get("a", [1, 2, 3])
+    assert cache.stats["misses"] == misses
+    cache.get("b", [1, 2, 3])
+    assert cache.stats["misses"] == misses + 1
+
+
+def test_cached_prefix_decodes_like_a_cold_prompt(brain):
+    hits = brain.prefix_cache.stats["hits"]
+    outputs = [brain.submit_generation("Tell me about caching.", SYSTEM, 24, 0.0, coalesce=False).future.result(timeout=60)
+               for _ in range(brain.PREFIX_CACHE_MIN_SEEN + 1)]
+    assert brain.prefix_cache.stats["hits"] > hits
+    assert len(set(outputs)) == 1
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+
+
+def unit(*values) -> np.ndarray:
+    v = np.array(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+VECTORS = {
+    "What is a Python decorator?": unit(1, 0, 0, 0),
+    "Explain Python decorators.": unit(1, 0.05, 0, 0),           # near-duplicate of the first
+    "How does the GIL limit threads?": unit(0.8, 0.6, 0, 0),
+    "How does Rust ownership work?": unit(0, 0, 1, 0),           # unrelated to the probe
+    "Design a Python plugin system.": unit(0.75, 0, 0, 0.66),
+}
+PROBE = unit(1, 0, 0, 0)[None, :]
+NONE = np.zeros((0, 4), dtype=np.float32)
+
+
+@pytest.fixture
+def bank(brain, tmp_path, monkeypatch):
+    monkeypatch.setattr(brain, "encode_texts", lambda texts, *args, **kwargs: np.stack([VECTORS[t.split(": ", 1)[-1]] for t in texts]))
+    bank = brain.QuestionBank(str(tmp_path / "questions.sqlite3"), max_entries=100)
+    bank.add([{"text": t, "difficulty": "HARD" if "plugin" in t else "MEDIUM", "skills": ["python"] if "plugin" in t else []}
+              for t in VECTORS])
+    return bank
+
+
+def texts(picked):
+    return [q["text"] for q in picked]
+
+
+def test_mmr_skips_near_duplicates_of_what_it_already_picked(bank):
+    picked = bank.search(PROBE, [], 3, [], NONE)
+    assert texts(picked) == ["What is a Python decorator?", "How does the GIL limit threads?", "Design a Python plugin system."]
+    assert picked[0]["similarity"] == pytest.approx(1.0, abs=1e-3)
+
+
+def test_asked_questions_and_their_near_duplicates_are_excluded(bank):
+    asked = "what is a python decorator"                           # normalized match
+    assert "What is a Python decorator?" not in texts(bank.search(PROBE, [], 3, [asked], NONE))
+    picked = bank.search(PROBE, [], 3, [asked], VECTORS["What is a Python decorator?"][None, :])
+    assert texts(picked) == ["How does the GIL limit threads?", "Design a Python plugin system."]
+
+
+def test_irrelevant_questions_are_never_served(bank):
+    assert "How does Rust ownership work?" not in texts(bank.search(PROBE, [], 10, [], NONE))
+
+
+def test_difficulty_filter(bank):
+    assert texts(bank.search(PROBE, [], 3, [], NONE, "HARD")) == ["Design a Python plugin system."]
+
+
+def test_tagged_skill_outranks_a_slightly_closer_question(bank):
+    probe = unit(0, 0, 0.6, 0.8)[None, :]                            # Rust 0.60, plugin system 0.53
+    assert texts(bank.search(probe, [], 1, [], NONE)) == ["How does Rust ownership work?"]
+    picked = bank.search(probe, ["Python"], 1, [], NONE)
+    assert texts(picked) == ["Design a Python plugin system."]
+    assert picked[0]["similarity"] == pytest.approx(0.528 + 0.15, abs=1e-2)
+
+
+def test_texts_are_indexed_once_and_persist(brain, bank, tmp_path):
+    assert bank.add([{"text": "  what is a PYTHON decorator "}]) == 0
+    assert len(bank) == len(VECTORS)
+    reopened = brain.QuestionBank(str(tmp_path / "questions.sqlite3"), max_entries=100)
+    assert len(reopened) == len(VECTORS)
+    assert texts(reopened.search(PROBE, [], 1, [], NONE)) == ["What is a Python decorator?"]    # float16 vectors round-trip
+
+
+def test_generated_questions_are_evicted_before_the_curated_bank(brain, bank, tmp_path):
+    VECTORS["Generated question?"] = unit(0, 1, 0, 0)
+    try:
+        small = brain.QuestionBank(str(tmp_path / "small.sqlite3"), max_entries=2)
+        small.add([{"text": "What is a Python decorator?", "source": "curated"}])
+        small.add([{"text": "Generated question?", "source": "generated"}])
+        small.add([{"text": "How does the GIL limit threads?", "source": "curated"}])
+    finally:
+        del VECTORS["Generated question?"]
+    assert small.stats["evictions"] == 1
+    assert sorted(texts(small.search(PROBE, [], 5, [], NONE))) == ["How does the GIL limit threads?", "What is a Python decorator?"]
@@ -0,0 +1,79 @@
+import uuid
+
+import anyio
+from fastapi import Response
+
+import fab_brain
+from fab_brain import ResponseCache
+
+
+def cache(tmp_path, memory_entries=2, disk_bytes=1 << 20, ttl_s=60.0) -> ResponseCache:
+    return ResponseCache(str(tmp_path / "responses.sqlite3"), memory_entries, disk_bytes, ttl_s)
+
+
+def test_memory_tier_is_lru_and_falls_back_to_disk(tmp_path):
+    rc = cache(tmp_path)
+    rc.put("a", "generate", {"v": "a"})
+    rc.put("b", "generate", {"v": "b"})
+    assert rc.get("a") == ("memory", {"v": "a"})       # a is now the most recent
+    rc.put("c", "generate", {"v": "c"})                 # pushes b out of memory
+    assert rc.get("b") == ("disk", {"v": "b"})
+    assert rc.get("b") == ("memory", {"v": "b"})        # promoted back
+    assert rc.get("missing") == (None, None)
+    assert rc.stats["memory_hits"] == 2 and rc.stats["disk_hits"] == 1 and rc.stats["misses"] == 1
+
+
+def test_disk_tier_outlives_the_process(tmp_path):
+    cache(tmp_path).put("k", "generate-json", {"parsed": {"a": 1}})
+    assert cache(tmp_path).get("k") == ("disk", {"parsed": {"a": 1}})
+
+
+def test_expired_entries_are_misses(tmp_path):
+    rc = cache(tmp_path, ttl_s=-1.0)
+    rc.put("k", "generate", {"v": 1})
+    assert rc.get("k") == (None, None)
+
+
+def test_disk_tier_evicts_least_recently_hit_past_its_size(tmp_path):
+    rc = cache(tmp_path, memory_entries=1, disk_bytes=4000)
+    for i in range(33):                                 # the 33rd store prunes
+        rc.put(f"k{i}", "generate", {"v": "x" * 200})
+        if i == 20:
+            assert rc.get("k0")[0] == "disk"           # a hit keeps k0 around
+    assert 0 < rc.stats["evictions"] < 33
+    assert rc.get("k0")[0] == "disk"
+    assert rc.get("k1") == (None, None)
+    assert rc.get("k31")[0] == "disk"
+
+
+def test_keys_cover_model_endpoint_and_parameters():
+    key = ResponseCache.key_for("generate", "sys", "prompt", 64, 0.0)
+    assert key == ResponseCache.key_for("generate", "sys", "prompt", 64, 0.0)
+    assert len({key, ResponseCache.key_for("generate-json", "sys", "prompt", 64, 0.0),
+                ResponseCache.key_for("generate", "sys", "prompt", 65, 0.0)}) == 3
+
+
+def serve(endpoint, temperature, constrained=False):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"result": "ok", "time_ms": 5}
+
+    parts = (f"prompt {uuid.uuid4()}", temperature)
+    headers = []
+    for _ in range(2):
+        response = Response()
+        anyio.run(lambda: fab_brain.serve_cached(response, endpoint, parts, temperature, compute, constrained=constrained))
+        headers.append(response.headers["X-Brain-Cache"])
+    return headers, len(calls)
+
+
+def test_sampled_free_text_bypasses_the_cache():
+    assert fab_brain.RESPONSE_CACHE_MAX_TEMPERATURE == 0.0
+    assert serve("generate", 0.2) == (["BYPASS", "BYPASS"], 2)
+    assert serve("generate", 0.0) == (["MISS", "HIT-MEMORY"], 1)
+
+
+def test_grammar_constrained_output_is_cached_at_its_temperature():
+    assert serve("generate-json", 0.2, constrained=True) == (["MISS", "HIT-MEMORY"], 1)
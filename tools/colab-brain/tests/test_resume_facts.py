@@ -0,0 +1,69 @@
+import pytest
+
+RESUME = """Jane Doe | jane@example.com
+Summary
+Backend engineer who likes Go and Python.
+Work Experience
+Senior Software Engineer | Acme Corp | Jan 2021 - Present
+- Cut p99 latency 40% by moving hot paths to Rust
+- Ran the Kubernetes migration
+Globex
+Software Developer, Mar 2018 – Dec 2020
+Projects
+Tracker (React, Node)
+- A Django app with PostgreSQL and Docker
+Education
+B.Tech in Computer Science, IIT Bombay, 2018
+Certifications
+- AWS Certified Solutions Architect
+Skills
+C++, c#, golang, R, Next.js, Terraform, REST API
+"""
+
+
+@pytest.fixture
+def facts(brain):
+    return brain.extract_resume_facts(RESUME)
+
+
+def test_skills_are_matched_with_aliases_and_cased_languages(facts):
+    assert facts["languages"] == ["python", "rust", "c++", "c#", "go", "r"]
+    assert facts["frameworks"] == ["react", "django", "next.js"]
+    assert facts["tools"] == ["kubernetes", "postgresql", "docker", "aws", "terraform"]
+    assert facts["concepts"] == ["rest api"]
+
+
+def test_go_and_r_only_count_when_capitalized(brain):
+    assert brain.resume_skills("we go to r&d, then write R and Go")["languages"] == ["r", "go"]
+
+
+def test_roles_come_from_the_dated_line_or_the_line_above(facts):
+    assert facts["experience"] == [
+        {"company": "Acme Corp", "role": "Senior Software Engineer", "duration": "Jan 2021 - Present",
+         "highlights": ["Cut p99 latency 40% by moving hot paths to Rust", "Ran the Kubernetes migration"]},
+        {"company": "Globex", "role": "Software Developer", "duration": "Mar 2018 – Dec 2020", "highlights": []},
+    ]
+
+
+def test_summary_projects_education_and_certifications(facts):
+    assert facts["summary"] == "Backend engineer who likes Go and Python."
+    assert facts["projects"] == [{"name": "Tracker", "tech": ["react", "django", "postgresql", "docker"],
+                                  "description": "A Django app with PostgreSQL and Docker"}]
+    assert facts["education"] == [{"degree": "B.Tech in Computer Science", "institution": "IIT Bombay", "year": "2018"}]
+    assert facts["certifications"] == ["AWS Certified Solutions Architect"]      # not repeated by the inline match
+
+
+def test_flattened_resume_keeps_skills_and_leaves_the_rest_to_the_llm(brain):
+    facts = brain.extract_resume_facts(" ".join(RESUME.splitlines()))
+    assert facts["languages"] == ["python", "rust", "c++", "c#", "go", "r"]
+    assert facts["certifications"][0].startswith("AWS Certified Solutions Architect")
+    assert (facts["summary"], facts["experience"], facts["projects"], facts["education"]) == ("", [], [], [])
+    _, schema, _, roles = brain.resume_narrative_request(facts, RESUME)
+    assert (schema["required"], roles) == (["summary", "experience"], [])
+
+
+def test_llm_is_only_asked_for_what_the_rules_missed(brain, facts):
+    _, schema, _, roles = brain.resume_narrative_request(facts, RESUME)
+    assert (schema["required"], roles) == (["highlights"], [1])                  # Globex has no bullets
+    complete = {**facts, "experience": facts["experience"][:1]}
+    assert brain.resume_narrative_request(complete, RESUME) is None
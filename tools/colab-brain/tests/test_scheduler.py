@@ -0,0 +1,54 @@
+import time
+
+from fab_brain import PRIORITY_CLASSES, PRIORITY_WEIGHTS, BatchScheduler, GenerationJob
+
+
+def wait_for(condition, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_weighted_fair_queueing_shares_batches_by_class_weight():
+    scheduler = BatchScheduler(max_batch_size=1, max_wait_ms=0)
+    for _ in range(200):
+        for priority in PRIORITY_CLASSES:
+            scheduler._enqueue(GenerationJob([1], 10, 0.0, priority=priority))
+    led = dict.fromkeys(PRIORITY_CLASSES, 0)
+    for _ in range(120):
+        batch = scheduler._take_batch()
+        batch[0].output_ids = [0] * 10
+        scheduler.charge(batch)
+        led[batch[0].priority] += 1
+    total = sum(PRIORITY_WEIGHTS[p] for p in PRIORITY_CLASSES)
+    for priority in PRIORITY_CLASSES:
+        assert abs(led[priority] - 120 * PRIORITY_WEIGHTS[priority] / total) <= 1
+
+
+def test_concurrent_requests_share_a_generate_call(brain):
+    before = brain.scheduler.stats["batches"]
+    jobs = [brain.submit_generation(f"Question number {i}", "", 24, 0.0, coalesce=False) for i in range(4)]
+    for job in jobs:
+        job.future.result(timeout=60)
+        assert 0 < len(job.output_ids) <= 24
+    assert brain.scheduler.stats["batches"] - before < len(jobs)
+
+
+def test_interactive_job_preempts_batch_work_without_changing_its_output(brain):
+    prompt = "Describe the batch scheduler in detail."
+    reference = brain.submit_generation(prompt, "", 600, 0.0, priority="batch", coalesce=False)
+    expected = reference.future.result(timeout=120)
+    assert len(reference.output_ids) == 600
+
+    preempted = brain.scheduler.stats["preempted"]
+    background = brain.submit_generation(prompt, "", 600, 0.0, priority="batch", coalesce=False)
+    wait_for(lambda: len(background.output_ids) >= brain.PREEMPT_MIN_TOKENS + 8)
+    # A different temperature keeps the urgent job out of the background job's batch
+    urgent = brain.submit_generation("Quick question?", "", 8, 0.05, priority="interactive", coalesce=False)
+    urgent.future.result(timeout=60)
+    assert not background.done
+
+    assert background.future.result(timeout=120) == expected
+    assert background.preemptions >= 1
+    assert brain.scheduler.stats["preempted"] > preempted
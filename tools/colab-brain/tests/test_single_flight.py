@@ -0,0 +1,79 @@
+import time
+
+from fab_brain import GenerationJob, JobCancelledError, SingleFlight
+
+
+def job(priority: str = "standard", deadline=None) -> GenerationJob:
+    return GenerationJob([1, 2, 3], 16, 0.0, deadline=deadline, priority=priority)
+
+
+def flight() -> SingleFlight:
+    return SingleFlight(enabled=True, max_temperature=0.3)
+
+
+def test_keys_cover_prompt_and_decoding_settings():
+    sf = flight()
+    key = sf.key_for([1, 2], 64, 0.2, None)
+    assert key == sf.key_for([1, 2], 64, 0.2, None)
+    assert len({key, sf.key_for([1, 3], 64, 0.2, None), sf.key_for([1, 2], 32, 0.2, None),
+                sf.key_for([1, 2], 64, 0.0, None), sf.key_for([1, 2], 64, 0.2, {})}) == 5
+
+
+def test_hot_sampling_and_disabled_flight_are_never_merged():
+    assert flight().key_for([1], 8, 0.7, None) is None
+    assert SingleFlight(enabled=False).key_for([1], 8, 0.0, None) is None
+
+
+def test_join_attaches_to_the_running_job():
+    sf, leader = flight(), job()
+    assert sf.join("k", None) is None
+    sf.lead("k", leader)
+    assert sf.join("k", None) is leader
+    assert leader.waiters == 2
+    assert sf.stats == {"leaders": 1, "coalesced": 1, "coalesced_streams": 0}
+
+
+def test_job_is_cancelled_only_when_every_waiter_has_gone():
+    sf, leader = flight(), job()
+    sf.lead("k", leader)
+    sf.join("k", None)
+    leader.cancel()
+    assert not leader.cancelled
+    leader.cancel()
+    assert leader.cancelled
+    leader.abandon()
+    assert isinstance(leader.future.exception(), JobCancelledError)
+
+
+def test_nobody_joins_a_cancelled_or_finished_job():
+    sf, leader = flight(), job()
+    sf.lead("k", leader)
+    leader.cancel()
+    assert sf.join("k", None) is None
+
+    finished = job()
+    sf.lead("k2", finished)
+    finished.fail(RuntimeError("boom"))
+    assert sf.join("k2", None) is None
+    assert finished.waiters == 1
+
+
+def test_lead_forgets_finished_jobs():
+    sf, old = flight(), job()
+    sf.lead("old", old)
+    old.fail(RuntimeError("done"))
+    sf.lead("new", job())
+    assert set(sf._jobs) == {"new"}
+
+
+def test_attach_promotes_priority_and_keeps_the_latest_deadline():
+    now = time.time()
+    shared = job("batch", deadline=now + 5)
+    assert shared.attach(now + 30, "interactive")
+    assert shared.priority == "interactive"
+    assert shared.deadline == now + 30
+    assert shared.attach(now + 1, "batch")
+    assert shared.priority == "interactive" and shared.deadline == now + 30
+    # A caller without a deadline keeps the job alive for as long as it runs
+    assert shared.attach(None)
+    assert shared.deadline is None
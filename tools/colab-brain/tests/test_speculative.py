@@ -0,0 +1,65 @@
+import json
+import threading
+
+import torch
+from transformers import AutoModelForCausalLM
+
+from fab_brain import JsonGrammar
+
+
+def test_greedy_speculative_output_matches_plain_decoding(brain):
+    prompt = "Walk me through the speculative decoding path."
+    plain = brain.submit_generation(prompt, "", 64, 0.0, coalesce=False)
+    expected = plain.future.result(timeout=60)
+
+    job = brain.submit_generation(prompt, "", 64, 0.0, speculative=True, coalesce=False)
+    assert job.speculative
+    assert job.future.result(timeout=60) == expected
+    assert job.draft_proposed > 0
+    assert 0.0 <= job.acceptance_rate <= 1.0
+    assert brain.speculation_fields(job)["draft_tokens_accepted"] == job.draft_accepted
+
+
+def test_speculative_json_stays_under_the_grammar(brain):
+    job = brain.submit_generation("Return a JSON object.", "", 48, 0.0, {}, speculative=True, coalesce=False)
+    text = job.future.result(timeout=60)
+    # Draft tokens are checked against the grammar too: the row never leaves it, and it
+    # either closes its value (which then parses) or runs into the token limit
+    assert job.grammar is not None
+    assert JsonGrammar.from_schema({}).feed(text)
+    if job.grammar.complete:
+        assert isinstance(json.loads(text), (dict, list))
+    else:
+        assert len(job.output_ids) == 48
+
+
+def test_non_speculative_jobs_report_no_draft_fields(brain):
+    job = brain.submit_generation("Plain request", "", 8, 0.0, coalesce=False)
+    job.future.result(timeout=60)
+    assert brain.speculation_fields(job) == {}
+
+
+def test_acceptance_counts_only_this_calls_draft_passes(brain, monkeypatch):
+    # A draft identical to the main model: every proposal is accepted
+    twin = AutoModelForCausalLM.from_pretrained(brain.LLM_ID).eval()
+    twin.generation_config.num_assistant_tokens = brain.DRAFT_TOKENS
+    twin.register_forward_hook(brain.draft_counter)
+    monkeypatch.setattr(brain, "draft_model", twin)
+
+    stop = threading.Event()
+
+    def other_draft_user():
+        with torch.inference_mode():
+            while not stop.is_set():
+                twin(torch.tensor([[1, 2, 3]]))
+
+    noise = threading.Thread(target=other_draft_user)
+    noise.start()
+    try:
+        job = brain.submit_generation("Count every proposal once.", "", 40, 0.0, speculative=True, coalesce=False)
+        job.future.result(timeout=60)
+    finally:
+        stop.set()
+        noise.join()
+    assert job.draft_proposed > 0
+    assert job.draft_accepted == job.draft_proposed
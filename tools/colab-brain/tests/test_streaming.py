@@ -0,0 +1,56 @@
+import asyncio
+import json
+import time
+
+import anyio
+import pytest
+from fastapi.testclient import TestClient
+
+from fab_brain import EVALUATION_SCHEMA, JobCancelledError
+
+
+def events(body: str):
+    """(event, data) pairs of an SSE body."""
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+def test_tokens_arrive_before_one_final_done_event(brain):
+    response = TestClient(brain.app).post("/generate-stream", json={"prompt": "Stream a short answer.", "max_tokens": 24})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    stream = events(response.text)
+    names = [name for name, _ in stream]
+    assert names[-1] == "done" and names.count("done") == 1
+    assert set(names[:-1]) == {"token"}
+    done = stream[-1][1]
+    assert done["result"] == "".join(data["text"] for _, data in stream[:-1])
+    assert 0 < done["tokens"] <= 24 and done["truncated_tokens"] == 0
+
+
+def test_evaluation_stream_ends_with_parsed_scores(brain, monkeypatch):
+    submit = brain.submit_generation
+    # The endpoint asks for 1024 tokens; the random test model would use all of them
+    monkeypatch.setattr(brain, "submit_generation", lambda prompt, system, max_tokens, *args, **kwargs: submit(prompt, system, 48, *args, **kwargs))
+    response = TestClient(brain.app).post("/evaluate-answer-stream", json={"prompt": "Question: what is a mutex? Answer: a lock."})
+    name, done = events(response.text)[-1]
+    assert name == "done"
+    assert {"parsed", "repaired", "parse_error"} <= done.keys()
+    if not done["parse_error"]:
+        assert set(EVALUATION_SCHEMA["required"]) <= done["parsed"].keys()
+
+
+def test_closing_the_stream_cancels_the_job(brain):
+    job = brain.submit_generation("Tell me a very long story.", "", 2000, 0.9, coalesce=False)
+
+    async def read_one_event_then_leave():
+        body = brain.stream_job_events(job, time.time()).body_iterator
+        assert (await body.__anext__()).startswith("event: token")
+        await body.aclose()                                # what Starlette does on disconnect
+        with pytest.raises(JobCancelledError):
+            await asyncio.wrap_future(job.future)
+
+    anyio.run(read_one_event_then_leave)
+    assert job.cancelled and len(job.output_ids) < 2000
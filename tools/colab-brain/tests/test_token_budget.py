@@ -0,0 +1,48 @@
+from fab_brain import TokenBudget
+
+
+def budget(brain, max_context=1000) -> TokenBudget:
+    return TokenBudget(max_context, kv_budget_bytes=1 << 40, max_batch_size=1)
+
+
+def test_prompt_that_fits_is_untouched(brain):
+    tb = budget(brain)
+    assert tb.fit([1, 2], [3] * 100, [4], 64) == ([1, 2] + [3] * 100 + [4], 64, 0)
+    assert tb.stats == {"truncated_requests": 0, "dropped_tokens": 0}
+
+
+def test_user_content_is_middle_elided(brain):
+    tb = budget(brain)
+    prefix, tail = [1] * 50, [2] * 10
+    user = list(range(1000, 3000))
+    prompt, max_new, dropped = tb.fit(prefix, user, tail, 200)
+
+    assert max_new == 200
+    assert len(prompt) + max_new == tb.max_context
+    assert prompt[:50] == prefix and prompt[-10:] == tail
+    keep = len(prompt) - 60 - len(tb.marker_ids)
+    head = int(keep * tb.HEAD_SHARE)                       # opening instructions, then the closing question
+    assert prompt[50:-10] == user[:head] + tb.marker_ids + user[len(user) - (keep - head):]
+    assert dropped == len(user) - keep
+    assert tb.stats == {"truncated_requests": 1, "dropped_tokens": dropped}
+
+
+def test_generation_budget_leaves_room_for_the_question(brain):
+    tb = budget(brain)
+    prompt, max_new, _ = tb.fit([1] * 50, [3] * 2000, [2] * 10, 5000)
+    assert max_new == tb.max_context - 60 - tb.MIN_USER_TOKENS
+    assert len(prompt) + max_new == tb.max_context
+
+
+def test_tiny_room_keeps_only_the_end_of_the_user_text(brain):
+    tb = budget(brain, max_context=100)
+    user = list(range(500))
+    prompt, max_new, dropped = tb.fit([1] * 30, user, [2] * 5, 64)
+    assert max_new == 64
+    assert prompt == [1] * 30 + user[-1:] + [2] * 5
+    assert dropped == 499
+
+
+def test_kv_memory_caps_the_window_for_a_full_batch(brain):
+    per_token = budget(brain).kv_bytes_per_token
+    assert TokenBudget(10_000, per_token * 4 * 300, max_batch_size=4).max_context == 300
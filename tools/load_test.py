@@ -0,0 +1,415 @@
+# FAB LOAD TEST
+# Open-loop load generator for the Express backend. Scenarios arrive on a fixed schedule
+# whatever the server's response time, so a slow server shows up as higher latency rather than
+# as a lower request rate (the one-call-at-a-time suites cannot see queueing at all).
+#
+#   python tools/load_test.py --rate 20 --duration 60 --mix profile=4,progress=4,interview=1 --out run.json
+#   python tools/load_test.py --rate 20 --duration 60 --baseline run.json    # run, then flag regressions
+#   python tools/load_test.py --compare new.json --baseline run.json         # compare two saved runs
+#
+# Scenarios:
+#   profile    GET /profile/:username
+#   progress   GET /progress/:username, /progress/:username/projects, /progress/:username/next-action
+#   interview  POST /interview/start, --answers x POST /interview/answer, POST /interview/stop
+#              (the user needs a completed unified analysis, or start returns 400)
+#   unified    POST /analyze/unified, then GET /analyzer/status/:id every --poll-interval seconds
+#              (needs --github-token or GITHUB_TOKEN)
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:3000")
+USERNAME = "sp25126"
+RED = "\033[91m"
+GREEN = "\033[92m"
+RESET = "\033[0m"
+
+SCENARIOS = ("profile", "progress", "interview", "unified")
+DEFAULT_MIX = "profile=4,progress=4,interview=1,unified=1"
+TERMINAL_STATUSES = {"complete", "error"}
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+
+ANSWERS = [
+    "I would start by profiling the hot path, then cache the results that do not change per request.",
+    "React re-renders when state or props change, so I memoize expensive children and keep state local.",
+    "An index on the foreign key turns the join from a full scan into a lookup, at the cost of slower writes.",
+    "I used a queue so the API returns immediately and a worker retries failed jobs with backoff.",
+]
+
+#===============================================
+# Recording
+#===============================================
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class Recorder:
+    """Collects latencies and outcomes per operation and per scenario from all worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = {"scenarios": {}, "operations": {}}
+        self.start_delays = []
+        self.abandoned = 0
+
+    def record(self, table, name, seconds, outcome):
+        with self.lock:
+            entry = self.tables[table].setdefault(name, {"latencies": [], "outcomes": {}})
+            entry["latencies"].append(seconds * 1000)
+            entry["outcomes"][outcome] = entry["outcomes"].get(outcome, 0) + 1
+
+    def started(self, delay_s):
+        with self.lock:
+            self.start_delays.append(delay_s * 1000)
+
+    @staticmethod
+    def summarize(entry):
+        latencies = sorted(entry["latencies"])
+        count = len(latencies)
+        errors = sum(n for outcome, n in entry["outcomes"].items() if not outcome.startswith("2"))
+        return {
+            "count": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "rate_limited": entry["outcomes"].get("429", 0),
+            "mean_ms": round(sum(latencies) / count, 1) if count else None,
+            "p50_ms": round(percentile(latencies, 50), 1) if count else None,
+            "p95_ms": round(percentile(latencies, 95), 1) if count else None,
+            "p99_ms": round(percentile(latencies, 99), 1) if count else None,
+            "max_ms": round(latencies[-1], 1) if count else None,
+            "outcomes": dict(sorted(entry["outcomes"].items()))
+        }
+
+    def results(self, config, arrivals, elapsed_s):
+        with self.lock:
+            delays = sorted(self.start_delays)
+            scenarios = {name: self.summarize(e) for name, e in sorted(self.tables["scenarios"].items())}
+            operations = {name: self.summarize(e) for name, e in sorted(self.tables["operations"].items())}
+        completed = sum(s["count"] for s in scenarios.values())
+        return {
+            "tool": "fab-load-test",
+            "started_at": config.pop("started_at"),
+            "base_url": config.pop("base_url"),
+            "config": config,
+            "summary": {
+                "arrivals": arrivals,
+                "completed": completed,
+                "abandoned": self.abandoned,
+                "elapsed_s": round(elapsed_s, 1),
+                "offered_rate": config["rate"],
+                "completed_rate": round(completed / elapsed_s, 2) if elapsed_s else 0.0,
+                "p99_start_delay_ms": round(percentile(delays, 99), 1) if delays else None
+            },
+            "scenarios": scenarios,
+            "operations": operations
+        }
+
+#===============================================
+# HTTP
+#===============================================
+
+class Abandoned(Exception):
+    """The run's grace period ended while this scenario was still in flight."""
+
+class Client:
+    """
+    One keep-alive requests.Session per worker thread, so connections are reused the way a
+    browser reuses them instead of paying a TCP handshake on every call.
+    """
+
+    def __init__(self, base_url, timeout, recorder, stop, spoof_ips):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.recorder = recorder
+        self.stop = stop
+        self.spoof_ips = spoof_ips
+        self.local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            self.local.session = session
+        return session
+
+    def call(self, op, method, path, client_ip=None, **kwargs):
+        """Times one request under `op` and returns (outcome, parsed body or None)."""
+        if self.stop.is_set():
+            raise Abandoned()
+        headers = {"X-Forwarded-For": client_ip} if self.spoof_ips and client_ip else {}
+        start = time.perf_counter()
+        try:
+            res = self.session.request(method, f"{self.base_url}{path}", headers=headers, timeout=self.timeout, **kwargs)
+            outcome = str(res.status_code)
+            try:
+                body = res.json()
+            except ValueError:
+                body = None
+        except requests.Timeout:
+            outcome, body = "timeout", None
+        except requests.RequestException:
+            outcome, body = "connection_error", None
+        self.recorder.record("operations", op, time.perf_counter() - start, outcome)
+        return outcome, body
+
+#===============================================
+# Scenarios
+#===============================================
+
+def scenario_profile(client, user, ip, args):
+    return client.call("GET /profile/:username", "GET", f"/profile/{user}", ip)[0]
+
+def scenario_progress(client, user, ip, args):
+    for op, path in (("GET /progress/:username", f"/progress/{user}"),
+                     ("GET /progress/:username/projects", f"/progress/{user}/projects"),
+                     ("GET /progress/:username/next-action", f"/progress/{user}/next-action")):
+        outcome, _ = client.call(op, "GET", path, ip)
+        if not outcome.startswith("2"):
+            return outcome
+    return outcome
+
+def scenario_interview(client, user, ip, args):
+    outcome, body = client.call("POST /interview/start", "POST", "/interview/start", ip,
+                                json={"username": user, "brainType": args.brain_type})
+    if not outcome.startswith("2"):
+        return outcome
+    session_id = (body or {}).get("sessionId")
+    for _ in range(args.answers):
+        outcome, body = client.call("POST /interview/answer", "POST", "/interview/answer", ip,
+                                    json={"sessionId": session_id, "answer": random.choice(ANSWERS)})
+        if not outcome.startswith("2"):
+            return outcome
+        if (body or {}).get("done"):
+            return outcome
+    return client.call("POST /interview/stop", "POST", "/interview/stop", ip, json={"sessionId": session_id})[0]
+
+def scenario_unified(client, user, ip, args):
+    data = {"username": user, "githubToken": args.github_token}
+    if args.resume:
+        with open(args.resume, "rb") as f:
+            outcome, body = client.call("POST /analyze/unified", "POST", "/analyze/unified", ip, data=data,
+                                        files={"resume": (os.path.basename(args.resume), f)})
+    else:
+        outcome, body = client.call("POST /analyze/unified", "POST", "/analyze/unified", ip, data=data)
+    if not outcome.startswith("2"):
+        return outcome
+    analysis_id = (body or {}).get("analysisId")
+    deadline = time.time() + args.poll_timeout
+    while time.time() < deadline:
+        if client.stop.wait(args.poll_interval):
+            raise Abandoned()
+        outcome, body = client.call("GET /analyzer/status/:id", "GET", f"/analyzer/status/{analysis_id}", ip)
+        if not outcome.startswith("2"):
+            return outcome
+        status = (body or {}).get("status")
+        if status in TERMINAL_STATUSES:
+            return outcome if status == "complete" else "analysis_error"
+    return "poll_timeout"
+
+SCENARIO_RUNNERS = {
+    "profile": scenario_profile,
+    "progress": scenario_progress,
+    "interview": scenario_interview,
+    "unified": scenario_unified,
+}
+
+#===============================================
+# Open-loop driver
+#===============================================
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise SystemExit("--mix needs at least one scenario with a positive weight")
+    return mix
+
+def arrival_times(rate, duration, arrival, rng):
+    """Offsets (seconds from start) at which scenarios are launched."""
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+        if t >= duration:
+            return
+        yield t
+
+def run_load(args):
+    mix = parse_mix(args.mix)
+    if "unified" in mix and not args.github_token:
+        raise SystemExit("The unified scenario needs --github-token (or GITHUB_TOKEN)")
+    users = [u.strip() for u in args.users.split(",") if u.strip()]
+    rng = random.Random(args.seed)
+    names, weights = list(mix), list(mix.values())
+
+    recorder = Recorder()
+    stop = threading.Event()
+    client = Client(args.base_url, args.timeout, recorder, stop, args.spoof_ips)
+
+    def launch(name, user, ip, scheduled):
+        recorder.started(time.perf_counter() - scheduled)
+        try:
+            outcome = SCENARIO_RUNNERS[name](client, user, ip, args)
+        except Abandoned:
+            with recorder.lock:
+                recorder.abandoned += 1
+            return
+        # Scenario latency runs from the scheduled arrival, so time spent waiting for a free
+        # worker counts against the server instead of silently lowering the offered load
+        recorder.record("scenarios", name, time.perf_counter() - scheduled, outcome)
+
+    print(f"🚀 {args.rate}/s {args.arrival} arrivals for {args.duration}s against {args.base_url}")
+    print(f"   Mix: {', '.join(f'{n}={w:g}' for n, w in mix.items())} | users: {', '.join(users)}")
+
+    arrivals = 0
+    started = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="load")
+    for offset in arrival_times(args.rate, args.duration, args.arrival, rng):
+        scheduled = started + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        arrivals += 1
+        executor.submit(launch, rng.choices(names, weights)[0], users[arrivals % len(users)],
+                        f"10.{arrivals >> 16 & 255}.{arrivals >> 8 & 255}.{arrivals & 255}", scheduled)
+
+    # Give in-flight scenarios (interview loops, analysis polling) a grace period to finish
+    timer = threading.Timer(args.grace, stop.set)
+    timer.start()
+    executor.shutdown(wait=True)
+    timer.cancel()
+    elapsed = time.perf_counter() - started
+
+    config = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "base_url": args.base_url,
+        "rate": args.rate,
+        "duration_s": args.duration,
+        "arrival": args.arrival,
+        "mix": mix,
+        "users": users,
+        "concurrency": args.concurrency,
+        "answers": args.answers,
+        "spoof_ips": args.spoof_ips,
+        "seed": args.seed
+    }
+    return recorder.results(config, arrivals, elapsed)
+
+#===============================================
+# Reporting and baseline comparison
+#===============================================
+
+def fmt(value):
+    return "-" if value is None else f"{value:.0f}"
+
+def print_report(results):
+    summary = results["summary"]
+    print(f"\n📊 {summary['completed']}/{summary['arrivals']} scenarios completed in {summary['elapsed_s']}s "
+          f"({summary['completed_rate']}/s offered {summary['offered_rate']}/s, {summary['abandoned']} abandoned)")
+    for table in ("scenarios", "operations"):
+        print(f"\n{table.upper():<40} {'count':>6} {'err%':>6} {'429':>5} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7}")
+        for name, s in results[table].items():
+            color = RED if s["error_rate"] else GREEN
+            print(f"{name:<40} {s['count']:>6} {color}{s['error_rate'] * 100:>6.1f}{RESET} {s['rate_limited']:>5} "
+                  f"{fmt(s['p50_ms']):>7} {fmt(s['p95_ms']):>7} {fmt(s['p99_ms']):>7} {fmt(s['max_ms']):>7}")
+    delay = summary["p99_start_delay_ms"]
+    if delay is not None and delay > 100:
+        print(f"\n⚠️  p99 start delay is {delay:.0f}ms: the client ran out of workers. Raise --concurrency "
+              f"or latencies include client-side queueing.")
+
+def compare(current, baseline, latency_tolerance, error_tolerance, min_delta_ms):
+    """Returns a list of regressions of `current` against `baseline`, one string each."""
+    regressions = []
+    for table in ("scenarios", "operations"):
+        for name, base in baseline.get(table, {}).items():
+            cur = current.get(table, {}).get(name)
+            if not cur or not cur["count"] or not base["count"]:
+                continue
+            for key in LATENCY_KEYS:
+                before, after = base.get(key), cur.get(key)
+                if before is None or after is None:
+                    continue
+                if after > before * (1 + latency_tolerance) and after - before >= min_delta_ms:
+                    regressions.append(f"{name} {key}: {before:.0f}ms -> {after:.0f}ms (+{after - before:.0f}ms)")
+            if cur["error_rate"] > base["error_rate"] + error_tolerance:
+                regressions.append(f"{name} error_rate: {base['error_rate'] * 100:.1f}% -> {cur['error_rate'] * 100:.1f}%")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test for the FAB backend")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--rate", type=float, default=10.0, help="Scenario arrivals per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of arrivals")
+    parser.add_argument("--arrival", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. profile=4,progress=4,interview=1")
+    parser.add_argument("--users", default=USERNAME, help="Comma-separated usernames, assigned round-robin")
+    parser.add_argument("--concurrency", type=int, default=256, help="Worker threads (max scenarios in flight)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--grace", type=float, default=30.0, help="Seconds in-flight scenarios get after the last arrival")
+    parser.add_argument("--answers", type=int, default=3, help="Answers submitted per interview")
+    parser.add_argument("--brain-type", default="remote", help="brainType sent to /interview/start")
+    parser.add_argument("--github-token", default=os.environ.get("GITHUB_TOKEN"))
+    parser.add_argument("--resume", help="Resume file attached to /analyze/unified")
+    parser.add_argument("--poll-interval", type=float, default=3.0, help="Seconds between /analyzer/status polls (the frontend uses 3)")
+    parser.add_argument("--poll-timeout", type=float, default=300.0)
+    parser.add_argument("--spoof-ips", action="store_true",
+                        help="Send a distinct X-Forwarded-For per arrival so the per-IP rate limiter does not cap the test")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Results JSON to compare against; exits 1 on regressions")
+    parser.add_argument("--compare", help="Compare this saved results JSON instead of running a test")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="Allowed relative p50/p95/p99 increase")
+    parser.add_argument("--error-tolerance", type=float, default=0.01, help="Allowed absolute error-rate increase")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore latency increases smaller than this")
+    args = parser.parse_args()
+
+    if args.compare:
+        if not args.baseline:
+            raise SystemExit("--compare needs --baseline")
+        with open(args.compare) as f:
+            results = json.load(f)
+    else:
+        results = run_load(args)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"💾 Results written to {args.out}")
+    print_report(results)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.latency_tolerance, args.error_tolerance, args.min_delta_ms)
+        print(f"\n🔍 Against baseline {args.baseline} ({baseline.get('started_at', '?')}):")
+        if regressions:
+            for line in regressions:
+                print(f"   {RED}REGRESSION{RESET} {line}")
+            sys.exit(1)
+        print(f"   {GREEN}No regressions{RESET}")
+
+if __name__ == "__main__":
+    main()